@@ -3,6 +3,7 @@ PM Tool v2 - 配置文件
 """
 import os
 from pathlib import Path
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 
@@ -69,12 +70,74 @@ class Settings(BaseSettings):
         """CSV 数据目录"""
         return self.data_dir / "csv_data"
     
+    @property
+    def cache_dir(self) -> Path:
+        """派生数据缓存目录（可随时删除重建）"""
+        return self.data_dir / "cache"
+    
+    @property
+    def database_path(self) -> Path:
+        """SQLite 数据库（与 data/csv_data/db_manager.py 的 DB_PATH 目录结构一致）"""
+        return self.data_dir / "data" / "pm_tool.db"
+    
+    @property
+    def project_store_path(self) -> Path:
+        """项目文档 SQLite 数据库（与 database_path 分开，migrate.py 重建产品数据库时不受影响）"""
+        return self.data_dir / "data" / "project_store.db"
+    
     # 缩略图配置
     thumb_sizes: dict = {
         "small": 120,
         "medium": 240,
         "large": 480
     }
+    thumb_format: str = "webp"    # 首选格式（客户端不支持时回退 png）
+    thumb_quality: int = 80       # WebP 质量
+    thumb_workers: int = 0        # 缩略图进程池大小（0 = CPU 核数的一半）
+    
+    # 精灵图（网格视图一次请求一页缩略图）
+    sprite_columns: int = 10      # 每行缩略图数
+    sprite_page_size: int = 100   # 每张精灵图包含的缩略图数
+    sprite_stale_grace: float = 60.0  # 旧版本精灵图最后一次被请求后保留的秒数（之后在后台删除）
+    
+    # 视觉分析调度
+    vision_provider: str = "api"          # api = OpenAI/Anthropic，stub = 本地模拟（离线测试）
+    vision_openai_rpm: float = Field(60, gt=0)     # GPT-5.2 每分钟请求数上限
+    vision_anthropic_rpm: float = Field(50, gt=0)  # Opus 4.5 每分钟请求数上限
+    vision_max_concurrency: int = 4       # 每个 Provider 的最大并发（429 时自动下调）
+    vision_max_retries: int = 5           # 限流/临时错误的最大重试次数
+    vision_stub_latency: float = 0.2      # stub 模拟每次调用耗时（秒）
+    vision_stub_rate_limit: float = 0.0   # stub 模拟 429 的概率
+    vision_cache_enabled: bool = True     # 按图片内容 + 模型 + prompt 缓存模型输出
+    
+    # 视觉分析图片预处理（发送给模型前裁剪、缩放、重新编码）
+    vision_preprocess: bool = True        # 关闭时发送原图
+    vision_max_long_edge: int = 1568      # 长边上限（像素），超过模型上限的分辨率只会被服务端再缩小
+    vision_image_format: str = "jpeg"     # jpeg / webp
+    vision_image_quality: int = 85        # 编码质量
+    vision_status_bar_ratio: float = 0.05 # 竖屏截图顶部状态栏高度占比（0 = 不裁剪）
+    
+    # 响应压缩（gzip；安装 brotli 包后同时支持 br）
+    compression_min_size: int = 1024      # 小于该字节数的响应不压缩
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 5
+    compression_cache_mb: int = 64        # 按 ETag 缓存压缩结果的内存上限（MB）
+    
+    # 项目数据存储（分类 / AI 分析结果 / Onboarding 范围）
+    storage_backend: str = "json"         # json = 项目目录下的 JSON 文件，dual = 读 SQLite 并同时写两边（过渡），sqlite = 只用 SQLite
+    classify_flush_delay: float = 0.1     # 分类更新合并窗口（秒），窗口内同一项目的改动一次写入
+    
+    # 操作历史（history.jsonl 追加写）
+    history_max_bytes: int = 1024 * 1024  # 超过后轮转为 history.1.jsonl
+    history_backups: int = 3              # 保留的轮转文件数
+    history_memory_items: int = 500       # 内存缓存的最近记录数
+    
+    # 应用排序的备份（重命名清单，不复制图片）
+    sort_backup_keep: int = 20            # 每个项目保留的清单数
+    sort_backup_hash: bool = True         # 清单中记录 sha256，撤销前校验内容（False = 只用 size + mtime，更快但发现不了同大小、保留时间戳的替换）
+    
+    # 项目索引 mtime 扫描间隔（秒）
+    project_index_interval: float = 5.0
     
     # CORS 配置
     cors_origins: list = [
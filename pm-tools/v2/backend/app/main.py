@@ -1,11 +1,42 @@
 """
 PM Tool v2 - FastAPI 应用入口
 """
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
-from app.routers import projects, screenshots, onboarding, sort, classify, store, export, pending, branch, analysis, vision, builder
+from app.routers import projects, screenshots, onboarding, sort, classify, store, export, pending, branch, analysis, vision, builder, search
+from app.services.project_service import project_index
+from app.services.thumbnail_service import shutdown_executor
+from app.services.analysis_job_store import job_store
+from app.services.classification_writer import classification_writer
+from app.services.compression import CompressionMiddleware
+from app.services.fast_json import FastJSONResponse
+from app.services.swimlane_aggregate import swimlane_aggregate
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时构建项目索引和泳道聚合，并在后台持续增量刷新"""
+    await asyncio.to_thread(project_index.refresh)
+    await asyncio.to_thread(swimlane_aggregate.refresh)
+    
+    # 上次退出时未完成的分析任务标记为 interrupted（可通过 resume 接口续跑）
+    interrupted = job_store.mark_interrupted()
+    if interrupted:
+        print(f"[INFO] {interrupted} 个分析任务被中断，可调用 /api/vision/analysis/{{app_id}}/resume 续跑")
+    index_watcher = asyncio.create_task(project_index.watch(settings.project_index_interval))
+    swimlane_watcher = asyncio.create_task(swimlane_aggregate.watch(settings.project_index_interval))
+    
+    yield
+    
+    index_watcher.cancel()
+    swimlane_watcher.cancel()
+    await classification_writer.flush_all()
+    shutdown_executor()
 
 
 # 创建 FastAPI 应用
@@ -15,6 +46,8 @@ app = FastAPI(
     description="PM 截图分析工具 v2 - 现代化重构版本",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # 配置 CORS
@@ -26,6 +59,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 响应压缩（gzip/brotli，流式响应不压缩）
+app.add_middleware(CompressionMiddleware)
+
 # 注册路由
 # 注意：screenshots 路由必须先注册，因为它的路由更具体
 # /projects/{name}/screenshots 必须在 /projects/{name} 之前匹配
@@ -40,6 +76,7 @@ app.include_router(branch.router, prefix="/api", tags=["Branch"])
 app.include_router(analysis.router, prefix="/api", tags=["Analysis"])
 app.include_router(vision.router, prefix="/api", tags=["Vision Analysis"])
 app.include_router(builder.router, prefix="/api", tags=["Builder"])
+app.include_router(search.router, prefix="/api", tags=["Search"])
 app.include_router(projects.router, prefix="/api", tags=["Projects"])
 
 
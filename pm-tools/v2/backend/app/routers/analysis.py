@@ -4,9 +4,12 @@ Swimlane Analysis Router - 泳道图分析 API
 import json
 from pathlib import Path
 from typing import Optional
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 
 from app.config import settings
+from app.services.http_cache import etag_json_response, file_json_response
+from app.services.swimlane_aggregate import AggregateSnapshot, swimlane_aggregate
+from app.services.swimlane_store import swimlane_store
 
 router = APIRouter(prefix="/analysis")
 
@@ -14,75 +17,89 @@ router = APIRouter(prefix="/analysis")
 SWIMLANE_DATA_DIR = settings.data_dir / "analysis" / "swimlane"
 
 
+def _swimlane_sources() -> list[Path]:
+    """汇总类接口依赖的文件：目录本身（增删文件）+ 所有分析 JSON"""
+    return [SWIMLANE_DATA_DIR, *sorted(SWIMLANE_DATA_DIR.glob("*.json"))]
+
+
 # ============================================================================
 # 跨产品比较 API (放在前面避免路由冲突)
 # ============================================================================
 
 @router.get("/compare")
-async def compare_all_apps():
+async def compare_all_apps(request: Request):
     """
     跨产品比较：获取所有 App 的汇总对比数据
     """
-    if not SWIMLANE_DATA_DIR.exists():
+    return _aggregate_response(request, "compare", _build_compare_all_apps)
+
+
+def _aggregate_response(request: Request, key: str, builder):
+    """跨 App 汇总接口：从同一聚合快照生成，结果和序列化后的响应体按版本缓存，ETag 为快照版本"""
+    snapshot = swimlane_aggregate.snapshot()
+    return etag_json_response(
+        request,
+        snapshot.etag,
+        lambda: swimlane_aggregate.memo(key, builder, snapshot),
+        cache_key=f"analysis:{key}",
+    )
+
+
+def _type_meta(snapshot: AggregateSnapshot) -> dict:
+    """类型 -> 第一个包含该类型的 App 中的 label/color"""
+    meta = {}
+    for contribution in snapshot.apps:
+        for type_code, type_info in contribution.by_type.items():
+            meta.setdefault(type_code, type_info)
+    return meta
+
+
+def _build_compare_all_apps(snapshot: AggregateSnapshot) -> dict:
+    if not swimlane_aggregate.exists:
         return {"apps": [], "aggregate": {}}
     
     apps_data = []
-    all_types = {}
     all_patterns = []
-    total_screens = 0
-    
-    for json_file in SWIMLANE_DATA_DIR.glob("*.json"):
-        try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            app_id = json_file.stem
-            screens = data.get("screens", [])
-            summary = data.get("summary", {})
-            by_type = summary.get("by_type", {})
-            
-            # 收集每个 App 的数据
-            apps_data.append({
+    type_apps: dict[str, list] = {}
+    
+    for contribution in snapshot.apps:
+        app_id = contribution.app_id
+        
+        # 收集每个 App 的数据
+        apps_data.append({
+            "appId": app_id,
+            "app": contribution.app,
+            "total_screens": len(contribution.screens),
+            "phases": contribution.phases,
+            "patterns": contribution.patterns,
+            "by_type": contribution.by_type
+        })
+        
+        for type_code, count in contribution.type_counts.items():
+            type_apps.setdefault(type_code, []).append({"appId": app_id, "count": count})
+        
+        # 收集模式
+        for pattern in contribution.patterns:
+            all_patterns.append({
                 "appId": app_id,
-                "app": data.get("app", app_id),
-                "total_screens": len(screens),
-                "phases": data.get("phases", []),
-                "patterns": data.get("patterns", []),
-                "by_type": by_type
+                **pattern
             })
-            
-            # 汇总类型统计
-            for type_code, type_info in by_type.items():
-                if type_code not in all_types:
-                    all_types[type_code] = {
-                        "label": type_info.get("label", type_code),
-                        "color": type_info.get("color", "#6B7280"),
-                        "count": 0,
-                        "apps": []
-                    }
-                all_types[type_code]["count"] += type_info.get("count", 0)
-                all_types[type_code]["apps"].append({
-                    "appId": app_id,
-                    "count": type_info.get("count", 0)
-                })
-            
-            # 收集模式
-            for pattern in data.get("patterns", []):
-                all_patterns.append({
-                    "appId": app_id,
-                    **pattern
-                })
-            
-            total_screens += len(screens)
-            
-        except (json.JSONDecodeError, IOError):
-            continue
-    
-    # 计算类型占比
-    for type_code in all_types:
-        all_types[type_code]["percentage"] = round(
-            all_types[type_code]["count"] / total_screens * 100, 1
-        ) if total_screens > 0 else 0
+    
+    # 汇总类型统计（总数由聚合增量维护）
+    total_screens = snapshot.total_screens
+    type_counts = snapshot.type_counts
+    type_meta = _type_meta(snapshot)
+    all_types = {}
+    for type_code, apps in type_apps.items():
+        count = type_counts.get(type_code, 0)
+        all_types[type_code] = {
+            "label": type_meta[type_code].get("label", type_code),
+            "color": type_meta[type_code].get("color", "#6B7280"),
+            "count": count,
+            "apps": apps,
+            # 计算类型占比
+            "percentage": round(count / total_screens * 100, 1) if total_screens > 0 else 0
+        }
     
     return {
         "apps": apps_data,
@@ -96,39 +113,27 @@ async def compare_all_apps():
 
 
 @router.get("/compare/type-matrix")
-async def get_type_matrix():
+async def get_type_matrix(request: Request):
     """
     获取类型分布矩阵：每个 App 的每种类型数量
     """
-    if not SWIMLANE_DATA_DIR.exists():
+    return _aggregate_response(request, "type-matrix", _load_type_matrix)
+
+
+def _load_type_matrix(snapshot: AggregateSnapshot) -> dict:
+    if not swimlane_aggregate.exists:
         return {"matrix": [], "apps": [], "types": []}
     
     apps = []
     matrix = []
-    all_type_codes = set()
-    
-    for json_file in SWIMLANE_DATA_DIR.glob("*.json"):
-        try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            app_id = json_file.stem
-            by_type = data.get("summary", {}).get("by_type", {})
-            
-            apps.append({
-                "id": app_id,
-                "name": data.get("app", app_id),
-                "total": data.get("total_screens", 0)
-            })
-            
-            row = {"appId": app_id, "app": data.get("app", app_id)}
-            for type_code, type_info in by_type.items():
-                row[type_code] = type_info.get("count", 0)
-                all_type_codes.add(type_code)
-            
-            matrix.append(row)
-        except (json.JSONDecodeError, IOError):
-            continue
+    
+    for contribution in snapshot.apps:
+        apps.append({
+            "id": contribution.app_id,
+            "name": contribution.app,
+            "total": contribution.declared_total
+        })
+        matrix.append({"appId": contribution.app_id, "app": contribution.app, **contribution.type_counts})
     
     # 类型定义
     type_labels = {
@@ -137,6 +142,7 @@ async def get_type_matrix():
         "G": "Gamified", "L": "Loading", "X": "Permission", "P": "Paywall"
     }
     
+    all_type_codes = {t for c in snapshot.apps for t in c.type_counts}
     types = [
         {"code": t, "label": type_labels.get(t, t)}
         for t in sorted(all_type_codes)
@@ -146,75 +152,64 @@ async def get_type_matrix():
 
 
 @router.get("/compare/phase-structure")
-async def get_phase_structure():
+async def get_phase_structure(request: Request):
     """
     获取阶段结构对比：每个 App 的阶段划分
     """
-    if not SWIMLANE_DATA_DIR.exists():
+    return _aggregate_response(request, "phase-structure", _load_phase_structure)
+
+
+def _load_phase_structure(snapshot: AggregateSnapshot) -> dict:
+    if not swimlane_aggregate.exists:
         return {"apps": []}
     
-    apps = []
-    
-    for json_file in SWIMLANE_DATA_DIR.glob("*.json"):
-        try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            apps.append({
-                "appId": json_file.stem,
-                "app": data.get("app", json_file.stem),
-                "total_screens": data.get("total_screens", 0),
-                "phases": data.get("phases", [])
-            })
-        except (json.JSONDecodeError, IOError):
-            continue
+    apps = [
+        {
+            "appId": contribution.app_id,
+            "app": contribution.app,
+            "total_screens": contribution.declared_total,
+            "phases": contribution.phases
+        }
+        for contribution in snapshot.apps
+    ]
     
     return {"apps": apps}
 
 
 @router.get("/template/vitaflow")
-async def generate_vitaflow_template():
+async def generate_vitaflow_template(request: Request):
     """
     基于竞品分析生成 VitaFlow onboarding 模板建议
     """
-    if not SWIMLANE_DATA_DIR.exists():
+    return _aggregate_response(request, "vitaflow", _build_vitaflow_template)
+
+
+def _build_vitaflow_template(snapshot: AggregateSnapshot) -> dict:
+    if not swimlane_aggregate.exists:
         return {"error": "No analysis data found"}
     
-    # 收集所有 App 的数据
+    # 收集所有 App 的数据（复制后再标注来源，不修改聚合中的数据）
     all_screens = []
     all_patterns = []
-    type_stats = {}
-    
-    for json_file in SWIMLANE_DATA_DIR.glob("*.json"):
-        try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            app_id = json_file.stem
-            for screen in data.get("screens", []):
-                screen["source_app"] = app_id
-                all_screens.append(screen)
-            
-            for pattern in data.get("patterns", []):
-                pattern["source_app"] = app_id
-                all_patterns.append(pattern)
-            
-            for type_code, type_info in data.get("summary", {}).get("by_type", {}).items():
-                if type_code not in type_stats:
-                    type_stats[type_code] = {"count": 0, "label": type_info.get("label", type_code)}
-                type_stats[type_code]["count"] += type_info.get("count", 0)
-        except (json.JSONDecodeError, IOError):
-            continue
-    
-    total = sum(t["count"] for t in type_stats.values())
+    
+    for contribution in snapshot.apps:
+        for screen in contribution.screens:
+            all_screens.append({**screen, "source_app": contribution.app_id})
+        
+        for pattern in contribution.patterns:
+            all_patterns.append({**pattern, "source_app": contribution.app_id})
+    
+    type_counts = snapshot.type_counts
+    type_meta = _type_meta(snapshot)
+    total = sum(type_counts.values())
     
     # 计算行业平均配比
     industry_ratio = {}
-    for type_code, info in type_stats.items():
+    for type_code, count in type_counts.items():
         industry_ratio[type_code] = {
-            "label": info["label"],
-            "percentage": round(info["count"] / total * 100, 1) if total > 0 else 0,
-            "count": info["count"]
+            "label": type_meta.get(type_code, {}).get("label", type_code),
+            "percentage": round(count / total * 100, 1) if total > 0 else 0,
+            "count": count
         }
     
     # 生成推荐的页面序列
@@ -229,7 +224,7 @@ async def generate_vitaflow_template():
         "recommended_sequence": recommended_sequence,
         "best_practices": best_practices,
         "total_screens_analyzed": len(all_screens),
-        "apps_analyzed": len(list(SWIMLANE_DATA_DIR.glob("*.json")))
+        "apps_analyzed": len(snapshot.apps)
     }
 
 
@@ -238,39 +233,58 @@ async def generate_vitaflow_template():
 # ============================================================================
 
 @router.get("/swimlane")
-async def list_swimlane_analyses():
+async def list_swimlane_analyses(request: Request):
     """
     获取所有可用的泳道图分析列表
     """
+    return file_json_response(request, _swimlane_sources(), _load_swimlane_list, cache_key="swimlane:list")
+
+
+def _load_swimlane_list() -> dict:
     if not SWIMLANE_DATA_DIR.exists():
         return {"analyses": []}
     
     analyses = []
-    for json_file in SWIMLANE_DATA_DIR.glob("*.json"):
-        try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                analyses.append({
-                    "id": json_file.stem,
-                    "app": data.get("app", json_file.stem),
-                    "total_screens": data.get("total_screens", 0),
-                    "analyzed_at": data.get("analyzed_at"),
-                    "summary": {
-                        "by_type": data.get("summary", {}).get("by_type", {}),
-                        "key_patterns": data.get("summary", {}).get("key_patterns", [])
-                    }
-                })
-        except (json.JSONDecodeError, IOError) as e:
-            continue
+    for app_id in swimlane_store.sync_all():
+        header = swimlane_store.get_header(app_id) or {}
+        analyses.append({
+            "id": app_id,
+            "app": header.get("app", app_id),
+            "total_screens": header.get("total_screens", 0),
+            "analyzed_at": header.get("analyzed_at"),
+            "summary": {
+                "by_type": header.get("summary", {}).get("by_type", {}),
+                "key_patterns": header.get("summary", {}).get("key_patterns", [])
+            }
+        })
     
     return {"analyses": analyses}
 
 
+def _sync_app(app_id: str):
+    """同步索引存储，App 不存在时 404"""
+    try:
+        exists = swimlane_store.sync(app_id)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=500, detail=f"Invalid JSON data: {str(e)}")
+    if not exists:
+        raise HTTPException(status_code=404, detail=f"Analysis for '{app_id}' not found")
+
+
 @router.get("/swimlane/{app_id}")
-async def get_swimlane_analysis(app_id: str):
+async def get_swimlane_analysis(request: Request, app_id: str):
     """
     获取特定 app 的泳道图分析数据
     """
+    return file_json_response(
+        request,
+        [SWIMLANE_DATA_DIR / f"{app_id}.json"],
+        lambda: _load_swimlane_analysis(app_id),
+        cache_key=f"swimlane:{app_id}",
+    )
+
+
+def _load_swimlane_analysis(app_id: str) -> dict:
     json_file = SWIMLANE_DATA_DIR / f"{app_id}.json"
     
     if not json_file.exists():
@@ -288,122 +302,124 @@ async def get_swimlane_analysis(app_id: str):
 
 @router.get("/swimlane/{app_id}/screens")
 async def get_swimlane_screens(
+    request: Request,
     app_id: str,
     start: int = 0,
     limit: int = 100,
-    type_filter: Optional[str] = None
+    type_filter: Optional[str] = None,
+    phase: Optional[str] = None,
+    cursor: Optional[int] = None
 ):
     """
-    分页获取泳道图截图数据，支持按类型筛选
-    """
-    json_file = SWIMLANE_DATA_DIR / f"{app_id}.json"
+    分页获取泳道图截图数据，支持按类型、阶段筛选
     
-    if not json_file.exists():
-        raise HTTPException(status_code=404, detail=f"Analysis for '{app_id}' not found")
+    支持两种分页：start/limit 偏移分页，或传入上一页返回的 next_cursor 进行游标分页。
+    """
+    return file_json_response(
+        request,
+        [SWIMLANE_DATA_DIR / f"{app_id}.json"],
+        lambda: _load_swimlane_screens(app_id, start, limit, type_filter, phase, cursor),
+    )
+
+
+def _load_swimlane_screens(
+    app_id: str,
+    start: int = 0,
+    limit: int = 100,
+    type_filter: Optional[str] = None,
+    phase: Optional[str] = None,
+    cursor: Optional[int] = None
+) -> dict:
+    _sync_app(app_id)
+    
+    page = swimlane_store.list_screens(
+        app_id,
+        start=max(0, start),
+        limit=max(0, limit),
+        primary_type=type_filter,
+        phase=phase,
+        cursor=cursor,
+    )
     
-    try:
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        screens = data.get("screens", [])
-        
-        # 按类型筛选
-        if type_filter:
-            screens = [s for s in screens if s.get("primary_type") == type_filter]
-        
-        # 分页
-        total = len(screens)
-        paginated = screens[start:start + limit]
-        
-        return {
-            "screens": paginated,
-            "total": total,
-            "start": start,
-            "limit": limit,
-            "has_more": start + limit < total
-        }
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Invalid JSON data: {str(e)}")
+    return {
+        **page,
+        "start": start,
+        "limit": limit,
+    }
 
 
 @router.get("/swimlane/{app_id}/screen/{index}")
-async def get_screen_detail(app_id: str, index: int):
+async def get_screen_detail(request: Request, app_id: str, index: int):
     """
     获取单个截图的详细信息
     """
-    json_file = SWIMLANE_DATA_DIR / f"{app_id}.json"
-    
-    if not json_file.exists():
-        raise HTTPException(status_code=404, detail=f"Analysis for '{app_id}' not found")
+    return file_json_response(
+        request,
+        [SWIMLANE_DATA_DIR / f"{app_id}.json"],
+        lambda: _load_screen_detail(app_id, index),
+    )
+
+
+def _load_screen_detail(app_id: str, index: int) -> dict:
+    _sync_app(app_id)
     
-    try:
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        screens = data.get("screens", [])
-        
-        # 查找对应索引的截图
-        for screen in screens:
-            if screen.get("index") == index:
-                return screen
-        
+    # 按序号索引查询
+    screen = swimlane_store.get_screen(app_id, index)
+    if screen is None:
         raise HTTPException(status_code=404, detail=f"Screen {index} not found")
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Invalid JSON data: {str(e)}")
+    return screen
 
 
 @router.get("/swimlane/{app_id}/summary")
-async def get_swimlane_summary(app_id: str):
+async def get_swimlane_summary(request: Request, app_id: str):
     """
     获取泳道图分析摘要统计
     """
-    json_file = SWIMLANE_DATA_DIR / f"{app_id}.json"
-    
-    if not json_file.exists():
-        raise HTTPException(status_code=404, detail=f"Analysis for '{app_id}' not found")
+    return file_json_response(
+        request,
+        [SWIMLANE_DATA_DIR / f"{app_id}.json"],
+        lambda: _load_swimlane_summary(app_id),
+    )
+
+
+def _load_swimlane_summary(app_id: str) -> dict:
+    _sync_app(app_id)
+    data = swimlane_store.get_header(app_id)
     
-    try:
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        return {
-            "app": data.get("app"),
-            "total_screens": data.get("total_screens"),
-            "analyzed_at": data.get("analyzed_at"),
-            "taxonomy_version": data.get("taxonomy_version"),
-            "summary": data.get("summary", {}),
-            "flow_patterns": data.get("flow_patterns", {}),
-            "design_insights": data.get("design_insights", {})
-        }
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Invalid JSON data: {str(e)}")
+    return {
+        "app": data.get("app"),
+        "total_screens": data.get("total_screens"),
+        "analyzed_at": data.get("analyzed_at"),
+        "taxonomy_version": data.get("taxonomy_version"),
+        "summary": data.get("summary", {}),
+        "flow_patterns": data.get("flow_patterns", {}),
+        "design_insights": data.get("design_insights", {})
+    }
 
 
 @router.get("/swimlane/{app_id}/types")
-async def get_screen_types(app_id: str):
+async def get_screen_types(request: Request, app_id: str):
     """
     获取页面类型统计
     """
-    json_file = SWIMLANE_DATA_DIR / f"{app_id}.json"
-    
-    if not json_file.exists():
-        raise HTTPException(status_code=404, detail=f"Analysis for '{app_id}' not found")
+    return file_json_response(
+        request,
+        [SWIMLANE_DATA_DIR / f"{app_id}.json"],
+        lambda: _load_screen_types(app_id),
+    )
+
+
+def _load_screen_types(app_id: str) -> dict:
+    _sync_app(app_id)
+    by_type = swimlane_store.get_header(app_id).get("summary", {}).get("by_type", {})
     
-    try:
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        by_type = data.get("summary", {}).get("by_type", {})
-        
-        return {
-            "types": by_type,
-            "type_list": [
-                {"code": code, **info}
-                for code, info in by_type.items()
-            ]
-        }
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Invalid JSON data: {str(e)}")
+    return {
+        "types": by_type,
+        "type_list": [
+            {"code": code, **info}
+            for code, info in by_type.items()
+        ]
+    }
 
 
 # ============================================================================
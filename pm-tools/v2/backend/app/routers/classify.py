@@ -12,6 +12,8 @@ from pydantic import BaseModel
 from typing import Dict, List, Optional, Any
 
 from ..config import settings
+from ..services.classification_writer import classification_writer
+from ..services.project_store import project_store
 
 router = APIRouter()
 
@@ -112,52 +114,18 @@ async def update_classification(data: UpdateClassificationRequest):
     if not os.path.exists(project_path):
         raise HTTPException(status_code=404, detail=f"项目不存在: {data.project}")
     
-    # 查找分类文件
-    classification_file = os.path.join(project_path, "classification.json")
-    ai_file = os.path.join(project_path, "ai_analysis.json")
-    
     try:
-        # 尝试加载现有分类
-        classifications = {}
-        
-        if os.path.exists(classification_file):
-            with open(classification_file, "r", encoding="utf-8") as f:
-                classifications = json.load(f)
-        elif os.path.exists(ai_file):
-            with open(ai_file, "r", encoding="utf-8") as f:
-                ai_data = json.load(f)
-                classifications = ai_data.get("results", {})
-        
-        # 应用更新
-        updated = 0
+        # 每个截图要写入的字段（只包含请求中给出的字段）
+        adjusted_at = datetime.now().isoformat()
+        changes = {}
         for filename, new_class in data.changes.items():
-            if filename not in classifications:
-                classifications[filename] = {}
-            
-            if new_class.stage is not None:
-                classifications[filename]["stage"] = new_class.stage
-            if new_class.module is not None:
-                classifications[filename]["module"] = new_class.module
-            if new_class.feature is not None:
-                classifications[filename]["feature"] = new_class.feature
-            if new_class.page_role is not None:
-                classifications[filename]["page_role"] = new_class.page_role
-            
-            classifications[filename]["manually_adjusted"] = True
-            classifications[filename]["adjusted_at"] = datetime.now().isoformat()
-            updated += 1
-        
-        # 保存到 classification.json
-        with open(classification_file, "w", encoding="utf-8") as f:
-            json.dump(classifications, f, ensure_ascii=False, indent=2)
+            fields = new_class.model_dump(exclude_none=True)
+            fields["manually_adjusted"] = True
+            fields["adjusted_at"] = adjusted_at
+            changes[filename] = fields
         
-        # 如果有 ai_analysis.json，也更新它
-        if os.path.exists(ai_file):
-            with open(ai_file, "r", encoding="utf-8") as f:
-                ai_data = json.load(f)
-            ai_data["results"] = classifications
-            with open(ai_file, "w", encoding="utf-8") as f:
-                json.dump(ai_data, f, ensure_ascii=False, indent=2)
+        # 合并窗口内的改动一次写入（同一项目串行），写入完成后返回
+        updated = await classification_writer.submit(data.project, changes)
         
         return {"success": True, "count": updated}
         
@@ -168,20 +136,8 @@ async def update_classification(data: UpdateClassificationRequest):
 @router.get("/classification/{project_name:path}")
 async def get_classification(project_name: str):
     """获取项目的分类数据"""
-    project_path = get_project_path(project_name)
-    
-    classification_file = os.path.join(project_path, "classification.json")
-    ai_file = os.path.join(project_path, "ai_analysis.json")
-    
-    if os.path.exists(classification_file):
-        with open(classification_file, "r", encoding="utf-8") as f:
-            return {"project": project_name, "classifications": json.load(f)}
-    elif os.path.exists(ai_file):
-        with open(ai_file, "r", encoding="utf-8") as f:
-            ai_data = json.load(f)
-            return {"project": project_name, "classifications": ai_data.get("results", {})}
-    
-    return {"project": project_name, "classifications": {}}
+    classifications = project_store.load_classifications(project_name)
+    return {"project": project_name, "classifications": classification_writer.overlay(project_name, classifications)}
 
 
 @router.post("/batch-classify")
@@ -5,20 +5,19 @@
 """
 import os
 import json
-import zipfile
 from datetime import datetime
-from io import BytesIO
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import StreamingResponse, JSONResponse
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 
 from ..config import settings
+from ..services.history_store import history_store
+from ..services.image_listing import list_image_names
+from ..services.project_store import DOCUMENT_FILES, project_store
+from ..services.zip_stream import ZipEntry, file_entries, stream_zip
 
 router = APIRouter()
 
-# 历史记录存储
-HISTORY_FILE = os.path.join(settings.base_dir, "history.json")
-
 
 def get_project_path(project_name: str) -> str:
     """获取项目路径"""
@@ -27,45 +26,35 @@ def get_project_path(project_name: str) -> str:
     return os.path.join(settings.projects_dir, project_name)
 
 
-def load_history() -> List[Dict[str, Any]]:
-    """加载历史记录"""
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except:
-            return []
-    return []
-
-
-def save_history(history: List[Dict[str, Any]]):
-    """保存历史记录"""
-    # 只保留最近 100 条
-    history = history[-100:]
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+def add_history(action: str, description: str, project: Optional[str] = None):
+    """添加历史记录（追加一行，不重写历史文件）"""
+    history_store.append(action, description, project)
 
 
-def add_history(action: str, description: str, project: Optional[str] = None):
-    """添加历史记录"""
-    history = load_history()
-    history.append({
-        "action": action,
-        "description": description,
-        "project": project,
-        "timestamp": datetime.now().isoformat()
-    })
-    save_history(history)
+def _parse_time(value: Optional[str], name: str) -> Optional[str]:
+    """校验 ISO 时间参数，统一为 datetime.isoformat() 格式"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} 不是有效的 ISO 时间: {value}")
 
 
 @router.get("/history")
-async def get_history(limit: int = 50):
-    """获取操作历史"""
-    history = load_history()
-    return {
-        "total": len(history),
-        "items": list(reversed(history[-limit:]))
-    }
+async def get_history(
+    limit: int = Query(50, ge=1, le=500, description="每页数量"),
+    before: Optional[int] = Query(None, description="游标：上一页返回的 next_cursor"),
+    since: Optional[str] = Query(None, description="开始时间（ISO 格式，含）"),
+    until: Optional[str] = Query(None, description="结束时间（ISO 格式，含）"),
+):
+    """获取操作历史（最新的在前，按 next_cursor 翻页）"""
+    return history_store.query(
+        limit=limit,
+        before=before,
+        since=_parse_time(since, "since"),
+        until=_parse_time(until, "until"),
+    )
 
 
 @router.get("/export/{project_name:path}/{format_type}")
@@ -97,38 +86,12 @@ async def export_json(project_name: str, project_path: str) -> JSONResponse:
     }
     
     # 获取截图列表
-    is_downloads_2024 = project_name.startswith("downloads_2024/")
-    if is_downloads_2024:
-        screens_dir = project_path
-    else:
-        screens_dir = os.path.join(project_path, "Screens")
-        if not os.path.exists(screens_dir):
-            screens_dir = os.path.join(project_path, "screens")
-    
-    if os.path.exists(screens_dir):
-        screenshots = sorted([
-            f for f in os.listdir(screens_dir)
-            if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))
-        ])
-        data["screenshots"] = screenshots
+    screens_dir = _get_screens_dir(project_name, project_path)
+    data["screenshots"] = list_image_names(screens_dir)
     
-    # 获取 Onboarding 范围
-    range_file = os.path.join(project_path, "onboarding_range.json")
-    if os.path.exists(range_file):
-        with open(range_file, "r", encoding="utf-8") as f:
-            data["onboarding_range"] = json.load(f)
-    
-    # 获取分类数据
-    classification_file = os.path.join(project_path, "classification.json")
-    ai_file = os.path.join(project_path, "ai_analysis.json")
-    
-    if os.path.exists(classification_file):
-        with open(classification_file, "r", encoding="utf-8") as f:
-            data["classification"] = json.load(f)
-    elif os.path.exists(ai_file):
-        with open(ai_file, "r", encoding="utf-8") as f:
-            ai_data = json.load(f)
-            data["classification"] = ai_data.get("results", {})
+    # 获取 Onboarding 范围和分类数据
+    data["onboarding_range"] = project_store.load_onboarding_range(project_name)
+    data["classification"] = project_store.load_classifications(project_name)
     
     # 添加历史记录
     add_history("export", f"导出 {project_name} 为 JSON", project_name)
@@ -141,56 +104,70 @@ async def export_json(project_name: str, project_path: str) -> JSONResponse:
     )
 
 
-async def export_zip(project_name: str, project_path: str) -> StreamingResponse:
-    """导出为 ZIP 格式（包含截图）"""
-    is_downloads_2024 = project_name.startswith("downloads_2024/")
-    if is_downloads_2024:
-        screens_dir = project_path
-    else:
-        screens_dir = os.path.join(project_path, "Screens")
-        if not os.path.exists(screens_dir):
-            screens_dir = os.path.join(project_path, "screens")
-    
-    # 创建内存中的 ZIP
-    buffer = BytesIO()
+def _get_screens_dir(project_name: str, project_path: str) -> str:
+    """获取截图目录"""
+    if project_name.startswith("downloads_2024/"):
+        return project_path
+    screens_dir = os.path.join(project_path, "Screens")
+    if not os.path.exists(screens_dir):
+        screens_dir = os.path.join(project_path, "screens")
+    return screens_dir
+
+
+# 随截图一起导出的元数据文件
+METADATA_FILES = [
+    "onboarding_range.json",
+    "classification.json",
+    "ai_analysis.json",
+    "check_status.json",
+    "sort_order.json",
+]
+
+
+def _project_zip_entries(project_name: str, project_path: str, prefix: str = "") -> Iterator[ZipEntry]:
+    """项目的 ZIP 条目：截图 + 元数据（prefix 用于多项目导出时区分目录）"""
+    screens_dir = _get_screens_dir(project_name, project_path)
     
-    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-        # 添加截图
-        if os.path.exists(screens_dir):
-            for filename in os.listdir(screens_dir):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-                    file_path = os.path.join(screens_dir, filename)
-                    zf.write(file_path, f"screenshots/{filename}")
-        
-        # 添加元数据文件
-        metadata_files = [
-            "onboarding_range.json",
-            "classification.json",
-            "ai_analysis.json",
-            "check_status.json",
-            "sort_order.json",
-        ]
-        
-        for meta_file in metadata_files:
-            meta_path = os.path.join(project_path, meta_file)
-            if os.path.exists(meta_path):
-                zf.write(meta_path, f"metadata/{meta_file}")
-        
-        # 添加导出信息
-        export_info = {
-            "project": project_name,
-            "exported_at": datetime.now().isoformat(),
-            "source": "PM Tool v2"
-        }
-        zf.writestr("export_info.json", json.dumps(export_info, indent=2))
+    # 添加截图
+    yield from file_entries(screens_dir, list_image_names(screens_dir), f"{prefix}screenshots")
     
-    buffer.seek(0)
+    # 添加元数据文件（SQLite 存储的文档从 project_store 读取，格式与 JSON 文件相同）
+    stored_files = {} if project_store.backend == "json" else {v: k for k, v in DOCUMENT_FILES.items()}
+    for meta_file in METADATA_FILES:
+        if meta_file in stored_files:
+            document = project_store.load_document(project_name, stored_files[meta_file])
+            if document is not None:
+                yield f"{prefix}metadata/{meta_file}", json.dumps(document, ensure_ascii=False, indent=2).encode("utf-8")
+            continue
+        meta_path = os.path.join(project_path, meta_file)
+        if os.path.exists(meta_path):
+            yield f"{prefix}metadata/{meta_file}", meta_path
+
+
+def _export_info(projects: List[str]) -> bytes:
+    """导出信息"""
+    info: Dict[str, Any] = {
+        "exported_at": datetime.now().isoformat(),
+        "source": "PM Tool v2",
+    }
+    if len(projects) == 1:
+        info["project"] = projects[0]
+    else:
+        info["projects"] = projects
+    return json.dumps(info, indent=2).encode("utf-8")
+
+
+async def export_zip(project_name: str, project_path: str) -> StreamingResponse:
+    """导出为 ZIP 格式（包含截图，流式输出）"""
+    def entries() -> Iterator[ZipEntry]:
+        yield from _project_zip_entries(project_name, project_path)
+        yield "export_info.json", _export_info([project_name])
     
     # 添加历史记录
     add_history("export", f"导出 {project_name} 为 ZIP", project_name)
     
     return StreamingResponse(
-        buffer,
+        stream_zip(entries()),
         media_type="application/zip",
         headers={
             "Content-Disposition": f'attachment; filename="{project_name.replace("/", "_")}_export.zip"'
@@ -198,8 +175,39 @@ async def export_zip(project_name: str, project_path: str) -> StreamingResponse:
     )
 
 
+@router.get("/export-bundle")
+async def export_bundle(projects: List[str] = Query(..., description="项目名称列表")):
+    """
+    多项目导出为一个 ZIP（流式输出）
+    
+    每个项目放在以项目名命名的目录下（/ 替换为 _），结构与单项目导出相同。
+    """
+    project_paths = []
+    for project_name in dict.fromkeys(projects):
+        project_path = get_project_path(project_name)
+        if not os.path.exists(project_path):
+            raise HTTPException(status_code=404, detail=f"项目不存在: {project_name}")
+        project_paths.append((project_name, project_path))
+    
+    def entries() -> Iterator[ZipEntry]:
+        for project_name, project_path in project_paths:
+            folder = project_name.replace("/", "_")
+            yield from _project_zip_entries(project_name, project_path, prefix=f"{folder}/")
+        yield "export_info.json", _export_info([name for name, _ in project_paths])
+    
+    add_history("export", f"批量导出 {len(project_paths)} 个项目为 ZIP")
+    
+    return StreamingResponse(
+        stream_zip(entries()),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="pm_tool_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"'
+        }
+    )
+
+
 @router.post("/history/clear")
 async def clear_history():
     """清空历史记录"""
-    save_history([])
+    history_store.clear()
     return {"success": True, "message": "历史记录已清空"}
@@ -11,6 +11,9 @@ from pydantic import BaseModel
 from typing import Optional
 
 from ..config import settings
+from ..services.project_service import project_index
+from ..services.project_store import project_store
+from ..services.image_listing import list_images
 
 router = APIRouter()
 
@@ -50,12 +53,8 @@ def get_project_path(project_name: str) -> str:
 @router.get("/onboarding-range/{project_name:path}", response_model=OnboardingRange)
 async def get_onboarding_range(project_name: str):
     """获取项目的 Onboarding 范围"""
-    project_path = get_project_path(project_name)
-    range_file = os.path.join(project_path, "onboarding_range.json")
-    
-    if os.path.exists(range_file):
-        with open(range_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    data = project_store.load_onboarding_range(project_name)
+    if data is not None:
         return OnboardingRange(**data)
     
     return OnboardingRange(start=-1, end=-1)
@@ -69,45 +68,23 @@ async def save_onboarding_range(project_name: str, data: OnboardingRangeUpdate):
     if not os.path.exists(project_path):
         raise HTTPException(status_code=404, detail=f"项目不存在: {project_name}")
     
-    range_file = os.path.join(project_path, "onboarding_range.json")
-    backup_dir = os.path.join(project_path, "backups")
-    
     try:
-        # 1. 如果旧文件存在，先备份
-        if os.path.exists(range_file):
-            os.makedirs(backup_dir, exist_ok=True)
-            backup_file = os.path.join(
-                backup_dir, 
-                f"onboarding_range_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            )
-            import shutil
-            shutil.copy(range_file, backup_file)
-            
-            # 只保留最近 10 个备份
-            backups = sorted([
-                f for f in os.listdir(backup_dir) 
-                if f.startswith("onboarding_range_")
-            ], reverse=True)
-            for old_backup in backups[10:]:
-                os.remove(os.path.join(backup_dir, old_backup))
-        
-        # 2. 保存新数据
+        # 1. 保存新数据（JSON 后端会先备份旧文件）
         range_data = {
             "start": data.start,
             "end": data.end,
             "updated_at": datetime.now().isoformat()
         }
+        project_store.save_onboarding_range(project_name, range_data)
         
-        with open(range_file, "w", encoding="utf-8") as f:
-            json.dump(range_data, f, ensure_ascii=False, indent=2)
-        
-        # 3. 验证写入成功
-        with open(range_file, "r", encoding="utf-8") as f:
-            saved_data = json.load(f)
+        # 2. 验证写入成功
+        saved_data = project_store.load_onboarding_range(project_name) or {}
         
         if saved_data.get("start") != data.start or saved_data.get("end") != data.end:
             raise Exception("数据验证失败：写入的数据与预期不符")
         
+        project_index.refresh_project(project_name)
+        
         return {"success": True, "data": range_data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -144,10 +121,7 @@ async def set_check_status(project_name: str, data: CheckStatusUpdate):
     else:
         screens_path = os.path.join(project_path, "Screens")
     
-    screen_count = 0
-    if os.path.exists(screens_path):
-        screen_count = len([f for f in os.listdir(screens_path) 
-                          if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))])
+    screen_count = len(list_images(screens_path))
     
     try:
         status_data = {
@@ -159,6 +133,8 @@ async def set_check_status(project_name: str, data: CheckStatusUpdate):
         with open(status_file, "w", encoding="utf-8") as f:
             json.dump(status_data, f, ensure_ascii=False, indent=2)
         
+        project_index.refresh_project(project_name)
+        
         return {"success": True, "data": status_data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -174,16 +150,13 @@ async def get_all_onboarding():
         for project_name in os.listdir(settings.projects_dir):
             project_path = os.path.join(settings.projects_dir, project_name)
             if os.path.isdir(project_path):
-                range_file = os.path.join(project_path, "onboarding_range.json")
-                if os.path.exists(range_file):
-                    with open(range_file, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    if data.get("start", -1) >= 0:
-                        results.append({
-                            "project": project_name,
-                            "source": "projects",
-                            **data
-                        })
+                data = project_store.load_onboarding_range(project_name)
+                if data and data.get("start", -1) >= 0:
+                    results.append({
+                        "project": project_name,
+                        "source": "projects",
+                        **data
+                    })
     
     # 遍历 downloads_2024 目录
     if os.path.exists(settings.downloads_2024_dir):
@@ -192,21 +165,13 @@ async def get_all_onboarding():
             if os.path.isdir(app_path):
                 screens_path = os.path.join(app_path, "screenshots")
                 if os.path.exists(screens_path):
-                    range_file = os.path.join(screens_path, "onboarding_range.json")
-                    if os.path.exists(range_file):
-                        with open(range_file, "r", encoding="utf-8") as f:
-                            data = json.load(f)
-                        if data.get("start", -1) >= 0:
-                            results.append({
-                                "project": f"downloads_2024/{app_name}/screenshots",
-                                "source": "downloads_2024",
-                                **data
-                            })
+                    project_name = f"downloads_2024/{app_name}/screenshots"
+                    data = project_store.load_onboarding_range(project_name)
+                    if data and data.get("start", -1) >= 0:
+                        results.append({
+                            "project": project_name,
+                            "source": "downloads_2024",
+                            **data
+                        })
     
     return {"total": len(results), "items": results}
-
-
-
-
-
-
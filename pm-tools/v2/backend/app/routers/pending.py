@@ -7,11 +7,15 @@ import shutil
 from pathlib import Path
 from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, BackgroundTasks, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, UploadFile, File, Form
 from pydantic import BaseModel
 
 from app.config import settings
+from app.services.project_service import project_index
+from app.services.image_listing import list_image_names
+from app.services.thumbnail_service import clear_thumbnails
+from app.services.http_cache import file_response
+from app.services.atomic_file import write_bytes_atomic
 
 
 router = APIRouter()
@@ -150,13 +154,7 @@ def get_project_screens_dir(project_name: str) -> Optional[Path]:
         screens_dir = project_path / subdir if subdir else project_path
         if screens_dir.exists():
             # 检查是否有图片文件（支持多种格式）
-            has_images = (
-                list(screens_dir.glob('*.png')) or
-                list(screens_dir.glob('*.jpg')) or
-                list(screens_dir.glob('*.jpeg')) or
-                list(screens_dir.glob('*.webp'))
-            )
-            if has_images:
+            if list_image_names(screens_dir):
                 return screens_dir
     
     # 如果没有找到带图片的目录，但项目目录存在，返回项目目录本身
@@ -174,13 +172,10 @@ def get_next_filename(screens_dir: Path, position: int = -1) -> tuple:
     import re
     
     # 获取现有文件（支持多种格式，不限制开头字符）
-    existing = []
-    for ext in ['*.png', '*.jpg', '*.jpeg', '*.webp']:
-        existing.extend([
-            f.name for f in screens_dir.glob(ext)
-            if not f.name.startswith(('thumb', '_temp'))
-        ])
-    existing = sorted(existing)
+    existing = [
+        name for name in list_image_names(screens_dir)
+        if not name.startswith(('thumb', '_temp'))
+    ]
     
     if not existing:
         return ('0001.png', 0)
@@ -228,7 +223,7 @@ async def list_pending_screenshots():
 
 
 @router.get("/pending-thumbnail/{filename}")
-async def get_pending_thumbnail(filename: str):
+async def get_pending_thumbnail(request: Request, filename: str):
     """获取待处理截图的缩略图"""
     source_path = detect_apowersoft_folder()
     if not source_path:
@@ -238,11 +233,7 @@ async def get_pending_thumbnail(filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    return FileResponse(
-        file_path,
-        media_type="image/png",
-        headers={"Cache-Control": "public, max-age=60"}
-    )
+    return file_response(request, file_path, cache_control="public, max-age=60")
 
 
 @router.post("/import-screenshot", response_model=ImportResponse)
@@ -271,9 +262,9 @@ async def import_screenshot(req: ImportRequest):
         shutil.copy2(src_file, dst_file)
         
         # 清理缩略图缓存
-        thumb_dir = screens_dir / "thumbs_small"
-        if thumb_dir.exists():
-            shutil.rmtree(thumb_dir, ignore_errors=True)
+        clear_thumbnails(screens_dir)
+        
+        project_index.refresh_project(req.project)
         
         return ImportResponse(
             success=True,
@@ -392,13 +383,12 @@ async def upload_screenshot(
         
         # 保存文件
         content = await file.read()
-        with open(dst_file, 'wb') as f:
-            f.write(content)
+        write_bytes_atomic(dst_file, content)
         
         # 清理缩略图缓存
-        thumb_dir = screens_dir / "thumbs_small"
-        if thumb_dir.exists():
-            shutil.rmtree(thumb_dir, ignore_errors=True)
+        clear_thumbnails(screens_dir)
+        
+        project_index.refresh_project(project)
         
         return {
             "success": True,
@@ -1,11 +1,12 @@
 """
 项目 API 路由
 """
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 from typing import Optional
 
 from app.models.project import Project, ProjectListResponse
-from app.services.project_service import get_all_projects
+from app.services.fast_json import model_response
+from app.services.project_service import get_all_projects, get_project as find_project
 
 
 router = APIRouter()
@@ -16,7 +17,7 @@ async def list_projects(
     source: Optional[str] = Query(None, description="过滤来源: projects 或 downloads_2024"),
     search: Optional[str] = Query(None, description="搜索关键词"),
     checked: Optional[bool] = Query(None, description="过滤已检查/未检查"),
-) -> ProjectListResponse:
+) -> Response:
     """
     获取项目列表
     
@@ -24,19 +25,8 @@ async def list_projects(
     - **search**: 按名称搜索
     - **checked**: 过滤检查状态
     """
-    # #region agent log
-    import json as _json
-    with open(r"c:\Users\WIN\Desktop\Cursor Project\.cursor\debug.log", "a", encoding="utf-8") as _f:
-        _f.write(_json.dumps({"location":"projects.py:list_projects","message":"API_CALLED","data":{"source":source,"search":search},"timestamp":__import__("time").time()*1000,"hypothesisId":"A"}) + "\n")
-    # #endregion
-    
     projects = get_all_projects()
     
-    # #region agent log
-    with open(r"c:\Users\WIN\Desktop\Cursor Project\.cursor\debug.log", "a", encoding="utf-8") as _f:
-        _f.write(_json.dumps({"location":"projects.py:list_projects","message":"PROJECTS_LOADED","data":{"count":len(projects)},"timestamp":__import__("time").time()*1000,"hypothesisId":"A"}) + "\n")
-    # #endregion
-    
     # 过滤
     if source:
         projects = [p for p in projects if p.source == source]
@@ -53,7 +43,8 @@ async def list_projects(
     checked_count = sum(1 for p in projects if p.checked)
     onboarding_count = sum(1 for p in projects if p.onboarding_start > 0)
     
-    return ProjectListResponse(
+    # 项目列表由服务层构造，直接序列化，跳过 response_model 的再次校验
+    return model_response(ProjectListResponse(
         projects=projects,
         total=len(projects),
         stats={
@@ -61,7 +52,7 @@ async def list_projects(
             "checked": checked_count,
             "onboarding_marked": onboarding_count,
         }
-    )
+    ))
 
 
 @router.get("/projects/{project_name:path}", response_model=Project)
@@ -69,10 +60,8 @@ async def get_project(project_name: str) -> Project:
     """
     获取单个项目信息
     """
-    projects = get_all_projects()
-    
-    for p in projects:
-        if p.name == project_name:
-            return p
+    project = find_project(project_name)
+    if project:
+        return project
     
     raise HTTPException(status_code=404, detail=f"项目不存在: {project_name}")
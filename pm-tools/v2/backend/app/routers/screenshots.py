@@ -2,29 +2,46 @@
 截图 API 路由
 """
 from pathlib import Path
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
+from urllib.parse import quote, urlencode
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request
+from pydantic import BaseModel
 from typing import Optional
 
 from app.config import settings
 from app.models.screenshot import ScreenshotListResponse
+from app.services.fast_json import model_response
+from app.services.http_cache import file_response, is_not_modified, not_modified_response
 from app.services.screenshot_service import (
-    get_project_screenshots,
-    get_classification_stats,
+    get_project_manifest,
     get_screenshot_path,
-    get_thumbnail_path,
+)
+from app.services.sprite_service import get_sprite_sheet
+from app.services.thumbnail_service import (
+    choose_format,
+    get_media_type,
+    get_thumbnail as render_thumbnail,
+    get_pregenerate_status,
+    is_pregenerating,
+    pregenerate_project,
 )
 
 
 router = APIRouter()
 
 
+class PregenerateRequest(BaseModel):
+    """缩略图预生成请求"""
+    sizes: Optional[list[str]] = None     # 默认全部尺寸
+    formats: Optional[list[str]] = None   # 默认 settings.thumb_format
+
+
 @router.get("/project-screenshots/{project_name:path}", response_model=ScreenshotListResponse)
 async def list_screenshots(
+    request: Request,
     project_name: str,
     stage: Optional[str] = Query(None, description="过滤 Stage"),
     module: Optional[str] = Query(None, description="过滤 Module"),
-) -> ScreenshotListResponse:
+):
     """
     获取项目的截图列表
     
@@ -32,58 +49,46 @@ async def list_screenshots(
     - **stage**: 过滤 Stage (Onboarding, Core, Monetization)
     - **module**: 过滤 Module
     """
-    screenshots = get_project_screenshots(project_name)
+    manifest = get_project_manifest(project_name)
     
-    if not screenshots:
+    if not manifest or not manifest.screenshots:
         raise HTTPException(status_code=404, detail=f"项目不存在或没有截图: {project_name}")
     
-    # 过滤
-    if stage:
-        screenshots = [
-            s for s in screenshots 
-            if s.classification and s.classification.stage == stage
-        ]
-    
-    if module:
-        screenshots = [
-            s for s in screenshots 
-            if s.classification and s.classification.module == module
-        ]
+    # 清单版本未变时直接 304
+    etag = f'"{manifest.version}-{stage or ""}-{module or ""}"'
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
     
-    # 获取统计
-    all_screenshots = get_project_screenshots(project_name)
-    stages, modules = get_classification_stats(all_screenshots)
+    # 过滤（使用清单中的 Stage/Module 索引）
+    screenshots = manifest.filter(stage=stage, module=module)
     
-    return ScreenshotListResponse(
+    response = ScreenshotListResponse(
         project=project_name,
         screenshots=screenshots,
         total=len(screenshots),
-        stages=stages,
-        modules=modules,
+        stages=manifest.stages,
+        modules=manifest.modules,
     )
+    # 直接序列化模型，跳过 response_model 的再次校验
+    return model_response(response, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 
 @router.get("/screenshots/{project_name:path}/{filename}")
-async def get_screenshot(project_name: str, filename: str):
+async def get_screenshot(request: Request, project_name: str, filename: str):
     """
-    获取截图原图
+    获取截图原图（Content-Type 按扩展名）
     """
     file_path = get_screenshot_path(project_name, filename)
     
     if not file_path:
         raise HTTPException(status_code=404, detail="截图不存在")
     
-    return FileResponse(
-        file_path,
-        media_type="image/png",
-        headers={
-            "Cache-Control": "public, max-age=86400",
-        }
-    )
+    return file_response(request, file_path, cache_control="public, max-age=86400")
 
 
 @router.get("/thumbnails/{project_name:path}/{filename}")
 async def get_thumbnail(
+    request: Request,
     project_name: str, 
     filename: str,
     size: str = Query("small", description="缩略图尺寸: small, medium, large"),
@@ -92,26 +97,58 @@ async def get_thumbnail(
     获取截图缩略图
     
     - **size**: small (120px), medium (240px), large (480px)
+    - 客户端 Accept 支持 image/webp 时返回 WebP，否则返回 PNG
     """
-    if size not in ["small", "medium", "large"]:
+    if size not in settings.thumb_sizes:
         size = "small"
     
-    file_path = get_thumbnail_path(project_name, filename, size)
+    fmt = choose_format(request.headers.get("accept"))
+    file_path = await render_thumbnail(project_name, filename, size, fmt)
     
     if not file_path:
         raise HTTPException(status_code=404, detail="缩略图不存在")
     
-    return FileResponse(
+    return file_response(
+        request,
         file_path,
-        media_type="image/png",
-        headers={
-            "Cache-Control": "public, max-age=3600",
-        }
+        cache_control="public, max-age=3600",
+        media_type=get_media_type(fmt),
+        headers={"Vary": "Accept"},
     )
 
 
+@router.post("/thumbnail-jobs/{project_name:path}")
+async def start_thumbnail_pregenerate(
+    project_name: str,
+    background_tasks: BackgroundTasks,
+    request: Optional[PregenerateRequest] = None,
+):
+    """
+    后台预生成项目所有截图的缩略图（默认全部尺寸）
+    """
+    if not get_project_manifest(project_name):
+        raise HTTPException(status_code=404, detail=f"项目不存在或没有截图: {project_name}")
+    
+    if is_pregenerating(project_name):
+        raise HTTPException(status_code=409, detail=f"缩略图预生成进行中: {project_name}")
+    
+    request = request or PregenerateRequest()
+    background_tasks.add_task(pregenerate_project, project_name, request.sizes, request.formats)
+    
+    return {"message": f"Thumbnail pregeneration started for {project_name}", "status": "pending"}
+
+
+@router.get("/thumbnail-jobs/{project_name:path}")
+async def get_thumbnail_pregenerate_status(project_name: str):
+    """获取缩略图预生成进度"""
+    status = get_pregenerate_status(project_name)
+    if not status:
+        return {"project": project_name, "status": "not_started"}
+    return status
+
+
 @router.get("/logo/{app_name}")
-async def get_app_logo(app_name: str):
+async def get_app_logo(request: Request, app_name: str):
     """
     获取应用 Logo
     
@@ -123,10 +160,85 @@ async def get_app_logo(app_name: str):
     if not logo_path.exists():
         raise HTTPException(status_code=404, detail=f"Logo not found: {app_name}")
     
-    return FileResponse(
-        logo_path,
-        media_type="image/png",
-        headers={
-            "Cache-Control": "public, max-age=604800",  # 缓存 7 天
-        }
+    return file_response(request, logo_path, cache_control="public, max-age=604800")  # 缓存 7 天
+
+
+@router.get("/sprites/{project_name:path}")
+async def get_sprite_map(
+    request: Request,
+    project_name: str,
+    size: str = Query("small", description="缩略图尺寸: small, medium, large"),
+    page: int = Query(0, ge=0, description="页码（从 0 开始）"),
+    page_size: int = Query(None, ge=1, le=200, description="每页截图数，默认 settings.sprite_page_size"),
+    stage: Optional[str] = Query(None, description="过滤 Stage"),
+    module: Optional[str] = Query(None, description="过滤 Module"),
+):
+    """
+    获取一页缩略图的精灵图坐标（offset map）
+    
+    返回的 sheet_url 指向拼好的精灵图，每张截图通过 x/y/width/height 定位，
+    网格视图一页只需 2 次请求。sheet_url 带清单版本号，可长期缓存。
+    """
+    if size not in settings.thumb_sizes:
+        size = "small"
+    
+    fmt = choose_format(request.headers.get("accept"))
+    sheet = await get_sprite_sheet(project_name, size, fmt, page, page_size, stage, module)
+    
+    if not sheet:
+        raise HTTPException(status_code=404, detail=f"项目不存在或没有截图: {project_name}")
+    
+    params = {
+        "size": size,
+        "format": sheet["format"],
+        "page": page,
+        "page_size": sheet["page_size"],
+        "v": sheet["version"],
+    }
+    if stage:
+        params["stage"] = stage
+    if module:
+        params["module"] = module
+    
+    sheet.pop("path")
+    sheet["sheet_url"] = f"/api/sprite-sheets/{quote(project_name)}?{urlencode(params)}" if sheet["tiles"] else None
+    return sheet
+
+
+@router.get("/sprite-sheets/{project_name:path}")
+async def get_sprite_image(
+    request: Request,
+    project_name: str,
+    size: str = Query("small", description="缩略图尺寸: small, medium, large"),
+    format: str = Query("png", description="图片格式: webp, png"),
+    page: int = Query(0, ge=0, description="页码（从 0 开始）"),
+    page_size: int = Query(None, ge=1, le=200, description="每页截图数"),
+    stage: Optional[str] = Query(None, description="过滤 Stage"),
+    module: Optional[str] = Query(None, description="过滤 Module"),
+    v: Optional[str] = Query(None, description="清单版本号（来自 /api/sprites）"),
+):
+    """
+    获取精灵图图片
+    """
+    if size not in settings.thumb_sizes:
+        size = "small"
+    if format not in ("webp", "png"):
+        format = "png"
+    
+    sheet = await get_sprite_sheet(project_name, size, format, page, page_size, stage, module)
+    
+    if not sheet or not sheet["path"]:
+        raise HTTPException(status_code=404, detail="精灵图不存在")
+    
+    # URL 中的版本号与当前清单一致时内容不会再变，可长期缓存
+    if v == sheet["version"]:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+    
+    return file_response(
+        request,
+        sheet["path"],
+        cache_control=cache_control,
+        media_type=get_media_type(sheet["format"]),
     )
@@ -0,0 +1,41 @@
+"""
+截图全文搜索 API
+"""
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.services.screenshot_search import screenshot_search
+
+
+router = APIRouter()
+
+
+@router.get("/search")
+async def search_screenshots(
+    q: str = Query("", description="关键词，空格分隔表示同时包含，双引号表示短语"),
+    stage: Optional[str] = Query(None, description="过滤 Stage"),
+    module: Optional[str] = Query(None, description="过滤 Module"),
+    screen_type: Optional[str] = Query(None, description="过滤截图类型"),
+    product: Optional[str] = Query(None, description="过滤产品（名称或文件夹名）"),
+    limit: int = Query(20, ge=1, le=100, description="每页数量"),
+    offset: int = Query(0, ge=0, description="偏移量"),
+):
+    """
+    跨产品搜索截图
+
+    搜索命名、核心功能、产品洞察、标签和设计亮点（中英文），按相关度排序，
+    例如 `q="free trial"&module=Paywall` 查找所有提到免费试用的付费墙。
+    """
+    if not q.strip() and not any((stage, module, screen_type, product)):
+        raise HTTPException(status_code=400, detail="请提供搜索关键词或筛选条件")
+
+    return screenshot_search.search(
+        q,
+        stage=stage,
+        module=module,
+        screen_type=screen_type,
+        product=product,
+        limit=limit,
+        offset=offset,
+    )
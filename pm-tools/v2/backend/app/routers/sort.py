@@ -1,7 +1,7 @@
 """
 截图排序相关 API
 - 保存排序
-- 应用排序（重命名文件）
+- 应用排序（重命名文件）/ 撤销应用排序
 - 删除截图
 - 恢复截图
 """
@@ -14,6 +14,10 @@ from pydantic import BaseModel
 from typing import List, Optional
 
 from ..config import settings
+from ..services.project_service import project_index
+from ..services.image_listing import list_image_names, list_project_images
+from ..services.thumbnail_service import clear_thumbnails
+from ..services import sort_backup
 
 router = APIRouter()
 
@@ -36,6 +40,12 @@ class DeleteScreensRequest(BaseModel):
     files: List[str]
 
 
+class UndoSortRequest(BaseModel):
+    """撤销应用排序请求"""
+    project: str
+    backup: Optional[str] = None  # 备份 ID，默认最近一次
+
+
 class RestoreScreensRequest(BaseModel):
     """恢复截图请求"""
     project: str
@@ -70,14 +80,6 @@ async def save_sort_order(data: SaveSortRequest):
     if not os.path.exists(project_path):
         raise HTTPException(status_code=404, detail=f"项目不存在: {data.project}")
     
-    # #region agent log
-    import json as _json
-    screens_dir = get_screens_dir(data.project, project_path)
-    actual_files = sorted([f for f in os.listdir(screens_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))]) if os.path.exists(screens_dir) else []
-    with open(r"c:\Users\WIN\Desktop\Cursor Project\.cursor\debug.log", "a", encoding="utf-8") as _f:
-        _f.write(_json.dumps({"location":"sort.py:save_sort_order","message":"SAVE_REQUEST","data":{"project":data.project,"order_count":len(data.order),"first5_order":[item.original_file for item in data.order[:5]],"last3_order":[item.original_file for item in data.order[-3:]],"actual_file_count":len(actual_files),"first5_actual":actual_files[:5],"last3_actual":actual_files[-3:]},"timestamp":__import__("time").time()*1000,"hypothesisId":"A"}) + "\n")
-    # #endregion
-    
     sort_file = os.path.join(project_path, "sort_order.json")
     backup_dir = os.path.join(project_path, "backups")
     
@@ -134,7 +136,7 @@ async def apply_sort_order(data: SaveSortRequest):
     安全措施：
     1. 验证数据一致性
     2. 使用两阶段重命名避免冲突
-    3. 保留完整备份
+    3. 重命名前写入重命名清单（可通过 /undo-sort-order 精确撤销）
     """
     project_path = get_project_path(data.project)
     
@@ -148,21 +150,9 @@ async def apply_sort_order(data: SaveSortRequest):
         raise HTTPException(status_code=404, detail="截图目录不存在")
     
     try:
-        # ========== 1. 收集实际存在的图片文件 ==========
-        actual_files = set()
-        image_extensions = ('.png', '.jpg', '.jpeg', '.webp')
-        
-        # 根目录文件
-        for f in os.listdir(screens_dir):
-            if f.lower().endswith(image_extensions) and os.path.isfile(os.path.join(screens_dir, f)):
-                actual_files.add(f)
-        
-        # screenshots 子目录文件
+        # ========== 1. 收集实际存在的图片文件（根目录 + screenshots 子目录） ==========
+        actual_files = {entry.name for entry in list_project_images(screens_dir)}
         screenshots_subdir = os.path.join(screens_dir, "screenshots")
-        if os.path.exists(screenshots_subdir):
-            for f in os.listdir(screenshots_subdir):
-                if f.lower().endswith(image_extensions):
-                    actual_files.add(f"screenshots/{f}")
         
         # ========== 2. 验证排序数据 ==========
         order_files = set(item.original_file for item in data.order)
@@ -182,31 +172,17 @@ async def apply_sort_order(data: SaveSortRequest):
         for i, item in enumerate(data.order):
             item.new_index = i + 1
         
-        # ========== 3. 创建备份 ==========
-        backup_base = os.path.dirname(project_path)
-        folder_name = os.path.basename(project_path)
-        backup_dir = os.path.join(backup_base, f"{folder_name}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
-        shutil.copytree(screens_dir, backup_dir)
+        # ========== 3. 记录重命名清单（代替复制整个截图目录） ==========
+        entries = sort_backup.plan_renames(screens_dir, data.order)
+        backup_id = sort_backup.create_manifest(project_path, data.project, entries)
         
         # ========== 4. 两阶段安全重命名 ==========
         # 阶段一：所有文件先重命名为临时名称（避免冲突）
-        temp_mapping = {}  # original_path -> temp_path
-        
-        for item in data.order:
-            old_name = item.original_file
-            
-            # 确定源文件路径
-            if "/" in old_name or "\\" in old_name:
-                old_path = os.path.join(screens_dir, old_name.replace("/", os.sep).replace("\\", os.sep))
-            else:
-                old_path = os.path.join(screens_dir, old_name)
-            
-            if os.path.exists(old_path):
-                # 临时文件名使用 UUID 避免冲突
-                temp_name = f"_temp_{item.new_index:04d}_{os.path.basename(old_name)}"
-                temp_path = os.path.join(screens_dir, temp_name)
-                shutil.move(old_path, temp_path)
-                temp_mapping[temp_path] = item
+        for entry in entries:
+            shutil.move(
+                os.path.join(screens_dir, entry["from"].replace("/", os.sep)),
+                os.path.join(screens_dir, entry["temp"]),
+            )
         
         # 删除 screenshots 子目录（如果存在且已清空）
         if os.path.exists(screenshots_subdir):
@@ -216,42 +192,35 @@ async def apply_sort_order(data: SaveSortRequest):
                 pass
         
         # 阶段二：将临时文件重命名为最终名称
-        for temp_path, item in temp_mapping.items():
-            # 获取原始扩展名
-            original_ext = os.path.splitext(item.original_file)[1]
-            # 如果是子目录文件，只取文件名部分的扩展名
-            if "/" in item.original_file or "\\" in item.original_file:
-                original_ext = os.path.splitext(os.path.basename(item.original_file))[1]
-            
-            new_name = f"{item.new_index:04d}{original_ext}"
-            new_path = os.path.join(screens_dir, new_name)
-            
+        for entry in entries:
+            temp_path = os.path.join(screens_dir, entry["temp"])
             if os.path.exists(temp_path):
-                shutil.move(temp_path, new_path)
+                shutil.move(temp_path, os.path.join(screens_dir, entry["to"]))
+        
+        sort_backup.update_manifest(project_path, sort_backup.load_manifest(project_path, backup_id), "applied")
         
         # ========== 5. 清理缩略图缓存 ==========
-        for thumb_dir_name in ['thumbs_small', 'thumbs_medium', 'thumbs_large']:
-            thumb_dir = os.path.join(screens_dir, thumb_dir_name)
-            if os.path.exists(thumb_dir):
-                shutil.rmtree(thumb_dir, ignore_errors=True)
+        clear_thumbnails(screens_dir)
         
         # ========== 6. 保存应用记录 ==========
         sort_file = os.path.join(project_path, "sort_order_applied.json")
-        final_files = sorted([f for f in os.listdir(screens_dir) if f.lower().endswith(image_extensions)])
+        final_files = list_image_names(screens_dir)
         
         with open(sort_file, "w", encoding="utf-8") as f:
             json.dump({
                 "project": data.project,
                 "applied_at": datetime.now().isoformat(),
-                "backup_dir": backup_dir,
+                "backup": backup_id,
                 "final_count": len(final_files),
                 "order": [item.model_dump() for item in data.order]
             }, f, ensure_ascii=False, indent=2)
         
+        project_index.refresh_project(data.project)
+        
         return {
             "success": True,
-            "message": f"已重命名 {len(temp_mapping)} 张截图",
-            "backup_dir": backup_dir,
+            "message": f"已重命名 {len(entries)} 张截图",
+            "backup": backup_id,
             "final_count": len(final_files)
         }
         
@@ -261,6 +230,53 @@ async def apply_sort_order(data: SaveSortRequest):
         raise HTTPException(status_code=500, detail=f"重命名失败: {str(e)}")
 
 
+@router.get("/sort-backups/{project_name:path}")
+async def get_sort_backups(project_name: str):
+    """获取应用排序的备份清单列表（最新的在前）"""
+    project_path = get_project_path(project_name)
+    backups = sort_backup.list_manifests(project_path)
+    return {"total": len(backups), "backups": backups}
+
+
+@router.post("/undo-sort-order")
+async def undo_sort_order(data: UndoSortRequest):
+    """
+    撤销应用排序（按重命名清单把文件移回原路径）
+    
+    只能从最近一次开始依次撤销；截图在应用后被增删或修改时返回 409，不做任何改动。
+    """
+    project_path = get_project_path(data.project)
+    
+    if not os.path.exists(project_path):
+        raise HTTPException(status_code=404, detail=f"项目不存在: {data.project}")
+    
+    latest = sort_backup.latest_undoable(project_path)
+    if latest is None:
+        raise HTTPException(status_code=404, detail="没有可撤销的排序")
+    if data.backup and data.backup != latest["id"]:
+        raise HTTPException(status_code=409, detail=f"请先撤销更晚的排序: {latest['id']}")
+    
+    screens_dir = get_screens_dir(data.project, project_path)
+    
+    try:
+        restored_count = sort_backup.undo_renames(screens_dir, latest)
+    except sort_backup.SortUndoConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "conflicts": e.conflicts[:50]})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"撤销失败: {str(e)}")
+    
+    sort_backup.update_manifest(project_path, latest, "undone")
+    clear_thumbnails(screens_dir)
+    project_index.refresh_project(data.project)
+    
+    return {
+        "success": True,
+        "backup": latest["id"],
+        "restored_count": restored_count,
+        "message": f"已恢复 {restored_count} 张截图的原文件名"
+    }
+
+
 @router.post("/delete-screens")
 async def delete_screens(data: DeleteScreensRequest):
     """删除选中的截图（移动到 deleted 文件夹备份）"""
@@ -302,6 +318,8 @@ async def delete_screens(data: DeleteScreensRequest):
                 "files": deleted_files
             }, f, ensure_ascii=False, indent=2)
         
+        project_index.refresh_project(data.project)
+        
         return {
             "success": True,
             "deleted_count": deleted_count,
@@ -342,8 +360,7 @@ async def get_deleted_screens(project_name: str):
                 files = manifest.get("files", [])
                 deleted_at = manifest.get("deleted_at")
         else:
-            files = [f for f in os.listdir(batch_path) 
-                    if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))]
+            files = list_image_names(batch_path)
         
         if files:
             result["batches"].append({
@@ -371,18 +388,17 @@ async def restore_screens(data: RestoreScreensRequest):
     try:
         restored_count = 0
         
-        for filename in os.listdir(deleted_dir):
-            if filename == "manifest.json":
-                continue
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-                src_path = os.path.join(deleted_dir, filename)
-                dst_path = os.path.join(screens_dir, filename)
-                shutil.move(src_path, dst_path)
-                restored_count += 1
+        for filename in list_image_names(deleted_dir):
+            src_path = os.path.join(deleted_dir, filename)
+            dst_path = os.path.join(screens_dir, filename)
+            shutil.move(src_path, dst_path)
+            restored_count += 1
         
         # 删除空的备份目录
         shutil.rmtree(deleted_dir)
         
+        project_index.refresh_project(data.project)
+        
         return {
             "success": True,
             "restored_count": restored_count,
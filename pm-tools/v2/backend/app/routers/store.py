@@ -7,11 +7,11 @@ App Store 商店对比相关 API
 import os
 import json
 import csv
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Request
 from typing import Dict, Any, List, Optional
 
 from ..config import settings
+from ..services.http_cache import file_response, file_json_response
 
 router = APIRouter()
 
@@ -150,7 +150,7 @@ async def get_store_info(project_name: str):
 
 
 @router.get("/store-screenshot/{project_name:path}/{filename}")
-async def get_store_screenshot(project_name: str, filename: str):
+async def get_store_screenshot(request: Request, project_name: str, filename: str):
     """获取商店截图"""
     downloads_2024 = str(settings.downloads_2024_dir)
     if project_name.startswith("downloads_2024/"):
@@ -165,11 +165,11 @@ async def get_store_screenshot(project_name: str, filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="截图不存在")
     
-    return FileResponse(file_path)
+    return file_response(request, file_path, cache_control="public, max-age=86400")
 
 
 @router.get("/store-analysis/{project_name:path}")
-async def get_store_analysis(project_name: str):
+async def get_store_analysis(request: Request, project_name: str):
     """获取应用商城截图的 AI 分析数据"""
     downloads_2024 = str(settings.downloads_2024_dir)
     if project_name.startswith("downloads_2024/"):
@@ -183,12 +183,15 @@ async def get_store_analysis(project_name: str):
     if not os.path.exists(analysis_file):
         return {"success": False, "error": "分析数据不存在", "data": None}
     
-    try:
-        with open(analysis_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return {"success": True, "data": data}
-    except Exception as e:
-        return {"success": False, "error": str(e), "data": None}
+    def load():
+        try:
+            with open(analysis_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {"success": True, "data": data}
+        except Exception as e:
+            return {"success": False, "error": str(e), "data": None}
+    
+    return file_json_response(request, [analysis_file], load)
 
 
 @router.get("/store-analysis-all")
@@ -247,7 +250,7 @@ async def get_all_store_analysis():
 
 
 @router.get("/store-icon/{project_name:path}")
-async def get_store_icon(project_name: str):
+async def get_store_icon(request: Request, project_name: str):
     """获取应用图标"""
     downloads_2024 = str(settings.downloads_2024_dir)
     if project_name.startswith("downloads_2024/"):
@@ -262,7 +265,7 @@ async def get_store_icon(project_name: str):
     for icon_name in icon_names:
         icon_path = os.path.join(project_path, icon_name)
         if os.path.exists(icon_path):
-            return FileResponse(icon_path)
+            return file_response(request, icon_path, cache_control="public, max-age=604800")
     
     # 尝试在 store 目录中查找
     store_dir = os.path.join(project_path, "store")
@@ -270,7 +273,7 @@ async def get_store_icon(project_name: str):
         for icon_name in icon_names:
             icon_path = os.path.join(store_dir, icon_name)
             if os.path.exists(icon_path):
-                return FileResponse(icon_path)
+                return file_response(request, icon_path, cache_control="public, max-age=604800")
     
     raise HTTPException(status_code=404, detail="图标不存在")
 
@@ -280,7 +283,7 @@ async def get_store_icon(project_name: str):
 # ============================================================================
 
 @router.get("/store-analysis-v2/{project_name:path}")
-async def get_store_analysis_v2(project_name: str):
+async def get_store_analysis_v2(request: Request, project_name: str):
     """获取应用商城截图的 v2 分析数据（5层分析框架）"""
     downloads_2024 = str(settings.downloads_2024_dir)
     if project_name.startswith("downloads_2024/"):
@@ -293,27 +296,35 @@ async def get_store_analysis_v2(project_name: str):
     v2_file = os.path.join(project_path, "store_analysis_v2.json")
     v1_file = os.path.join(project_path, "store_analysis.json")
     
-    if os.path.exists(v2_file):
-        with open(v2_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return {"success": True, "data": data, "version": "v2"}
-    elif os.path.exists(v1_file):
-        with open(v1_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return {"success": True, "data": data, "version": "v1"}
-    else:
-        return {"success": False, "error": "分析数据不存在", "data": None}
+    for version, analysis_file in (("v2", v2_file), ("v1", v1_file)):
+        if os.path.exists(analysis_file):
+            def load(analysis_file=analysis_file, version=version):
+                with open(analysis_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                return {"success": True, "data": data, "version": version}
+            
+            return file_json_response(
+                request, [analysis_file], load, cache_key=f"store-analysis-v2:{project_name}"
+            )
+    
+    return {"success": False, "error": "分析数据不存在", "data": None}
 
 
 @router.get("/store-analysis-v2-all")
-async def get_all_store_analysis_v2():
-    """获取所有应用的 v2 分析数据（用于设计决策看板）"""
+async def get_all_store_analysis_v2(request: Request):
+    """
+    获取所有应用的 v2 分析数据（用于设计决策看板）
+
+    ETag 由所有分析文件的 stat 生成；文件不变时直接 304，
+    或复用上次序列化好的响应体（不重新读取、解析和序列化）。
+    """
     downloads_2024 = str(settings.downloads_2024_dir)
-    all_analysis = []
     
     if not os.path.exists(downloads_2024):
         return {"success": True, "data": [], "total": 0}
     
+    apps = []
+    sources = []
     for app_name in sorted(os.listdir(downloads_2024)):
         app_path = os.path.join(downloads_2024, app_name)
         if not os.path.isdir(app_path) or "_backup_" in app_name:
@@ -325,6 +336,24 @@ async def get_all_store_analysis_v2():
         if not os.path.exists(v2_file):
             continue
         
+        apps.append((app_name, v2_file, store_info_file))
+        sources.extend((v2_file, store_info_file))
+    
+    if not apps:
+        return {"success": True, "data": [], "total": 0}
+    
+    return file_json_response(
+        request,
+        sources,
+        lambda: _load_all_store_analysis_v2(apps),
+        cache_key="store-analysis-v2-all",
+    )
+
+
+def _load_all_store_analysis_v2(apps: list) -> dict:
+    all_analysis = []
+    
+    for app_name, v2_file, store_info_file in apps:
         try:
             with open(v2_file, "r", encoding="utf-8") as f:
                 data = json.load(f)
@@ -347,7 +376,7 @@ async def get_all_store_analysis_v2():
 
 
 @router.get("/store-statistics")
-async def get_store_statistics():
+async def get_store_statistics(request: Request):
     """获取商店截图统计数据（用于统计仪表盘）"""
     reports_dir = os.path.join(str(settings.data_dir), "reports")
     stats_file = os.path.join(reports_dir, "store_statistics.json")
@@ -355,16 +384,19 @@ async def get_store_statistics():
     if not os.path.exists(stats_file):
         return {"success": False, "error": "统计数据不存在", "data": None}
     
-    try:
-        with open(stats_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return {"success": True, "data": data}
-    except Exception as e:
-        return {"success": False, "error": str(e), "data": None}
+    def load():
+        try:
+            with open(stats_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {"success": True, "data": data}
+        except Exception as e:
+            return {"success": False, "error": str(e), "data": None}
+    
+    return file_json_response(request, [stats_file], load, cache_key="store-statistics")
 
 
 @router.get("/store-design-patterns")
-async def get_store_design_patterns():
+async def get_store_design_patterns(request: Request):
     """获取设计模式库数据"""
     reports_dir = os.path.join(str(settings.data_dir), "reports")
     patterns_file = os.path.join(reports_dir, "design_patterns.json")
@@ -372,16 +404,19 @@ async def get_store_design_patterns():
     if not os.path.exists(patterns_file):
         return {"success": False, "error": "设计模式库不存在", "data": None}
     
-    try:
-        with open(patterns_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return {"success": True, "data": data}
-    except Exception as e:
-        return {"success": False, "error": str(e), "data": None}
+    def load():
+        try:
+            with open(patterns_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {"success": True, "data": data}
+        except Exception as e:
+            return {"success": False, "error": str(e), "data": None}
+    
+    return file_json_response(request, [patterns_file], load, cache_key="store-design-patterns")
 
 
 @router.get("/store-vitaflow-recommendations")
-async def get_vitaflow_recommendations():
+async def get_vitaflow_recommendations(request: Request):
     """获取 VitaFlow 设计推荐数据"""
     reports_dir = os.path.join(str(settings.data_dir), "reports")
     rec_file = os.path.join(reports_dir, "vitaflow_recommendations.json")
@@ -389,12 +424,15 @@ async def get_vitaflow_recommendations():
     if not os.path.exists(rec_file):
         return {"success": False, "error": "推荐数据不存在", "data": None}
     
-    try:
-        with open(rec_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return {"success": True, "data": data}
-    except Exception as e:
-        return {"success": False, "error": str(e), "data": None}
+    def load():
+        try:
+            with open(rec_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {"success": True, "data": data}
+        except Exception as e:
+            return {"success": False, "error": str(e), "data": None}
+    
+    return file_json_response(request, [rec_file], load, cache_key="store-vitaflow-recommendations")
 
 
 @router.get("/store-position-comparison/{position}")
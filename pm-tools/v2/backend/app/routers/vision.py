@@ -2,14 +2,23 @@
 Vision Analysis API Router
 提供截图分析和 API 配置功能
 """
+import json
 import asyncio
+from datetime import datetime
 from typing import Optional
-from pathlib import Path
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from app.config import settings
-from app.services.vision_analysis_service import vision_service, VisionAnalysisService
+from app.services.analysis_job_store import job_store, ACTIVE_STATUSES, RESUMABLE_STATUSES
+from app.services.job_events import job_events, sse_stream
+from app.services.swimlane_aggregate import swimlane_aggregate
+from app.services.vision_analysis_service import vision_service, create_vision_service
+from app.services.vision_scheduler import PipelineResult, get_scheduler_stats, latency_observer, run_pipeline
+from app.services.vision_cache import vision_cache
+from app.services.image_listing import list_images
+from app.services.image_preprocess import image_preprocessor
 
 router = APIRouter()
 
@@ -31,18 +40,42 @@ class AnalysisRequest(BaseModel):
     end_index: Optional[int] = None
 
 
-class AnalysisStatus(BaseModel):
-    """分析状态"""
-    app_id: str
-    status: str  # pending, running, completed, failed
-    progress: int = 0
-    total: int = 0
-    current_screen: Optional[str] = None
-    error: Optional[str] = None
+# App 配置
+APPS = {
+    "flo": {"name": "Flo", "dir": "Flo", "expected": 100},
+    "yazio": {"name": "Yazio", "dir": "Yazio", "expected": 98},
+    "cal_ai": {"name": "Cal AI", "dir": "Cal_AI", "expected": 37},
+    "noom": {"name": "Noom", "dir": "Noom", "expected": 114},
+}
+
+# 正在运行的任务（任务 ID -> asyncio.Task），用于取消
+_running_tasks: dict[int, asyncio.Task] = {}
+
+# 正在分析的截图（任务 ID -> 文件名），只用于状态展示
+_current_screen: dict[int, str] = {}
+
+
+def get_app_status(app_id: str) -> dict:
+    """App 最近一次分析任务的状态"""
+    job = job_store.get_latest_job(app_id)
+    if not job:
+        return {"app_id": app_id, "status": "not_started", "progress": 0, "total": 0}
+    status = job_store.get_status(job["id"])
+    status["current_screen"] = _current_screen.get(job["id"])
+    return status
+
 
+def _publish_status(app_id: str, job_id: int, event: str = "status"):
+    """广播任务状态（有订阅者时才计算）"""
+    if job_events.subscriber_count(app_id):
+        job_events.publish(app_id, event, job_store.get_status(job_id))
 
-# 全局状态存储
-_analysis_status: dict[str, AnalysisStatus] = {}
+
+def _launch(job_id: int):
+    """在后台运行任务"""
+    task = asyncio.create_task(run_analysis_task(job_id))
+    _running_tasks[job_id] = task
+    task.add_done_callback(lambda _: _running_tasks.pop(job_id, None))
 
 
 # ============================================================================
@@ -57,10 +90,21 @@ async def get_api_status():
         "openai_configured": openai_ok,
         "anthropic_configured": anthropic_ok,
         "ready": openai_ok or anthropic_ok,
-        "dual_model_ready": openai_ok and anthropic_ok
+        "dual_model_ready": openai_ok and anthropic_ok,
+        "provider": settings.vision_provider,
+        "scheduler": get_scheduler_stats(),
+        "cache": vision_cache.stats(),
+        "preprocess": image_preprocessor.stats.to_dict(),
     }
 
 
+@router.post("/vision/cache/clear")
+async def clear_vision_cache(model: Optional[str] = None):
+    """清空模型输出缓存（可指定模型）"""
+    deleted = vision_cache.clear(model)
+    return {"success": True, "deleted": deleted}
+
+
 @router.post("/vision/configure")
 async def configure_api_keys(config: APIKeysConfig):
     """配置 API Keys"""
@@ -73,7 +117,7 @@ async def configure_api_keys(config: APIKeysConfig):
         settings.anthropic_api_key = config.anthropic_api_key
     
     # 重新初始化服务
-    vision_service = VisionAnalysisService()
+    vision_service = create_vision_service()
     
     openai_ok, anthropic_ok = vision_service.is_configured()
     return {
@@ -85,14 +129,50 @@ async def configure_api_keys(config: APIKeysConfig):
 
 @router.get("/vision/analysis/{app_id}/status")
 async def get_analysis_status(app_id: str):
-    """获取分析状态"""
-    if app_id not in _analysis_status:
-        return AnalysisStatus(app_id=app_id, status="not_started")
-    return _analysis_status[app_id]
+    """
+    获取分析状态
+    
+    包含进度、吞吐（张/分钟）、预计剩余时间（eta_seconds）和各 Provider 的延迟分位数。
+    """
+    return get_app_status(app_id)
+
+
+@router.get("/vision/analysis/{app_id}/events")
+async def stream_analysis_events(app_id: str, include_results: bool = True, once: bool = False):
+    """
+    分析进度事件流（SSE，替代轮询 status）
+    
+    事件:
+        status   - 连接时的状态快照，以及任务开始时
+        results  - 连接时已完成的截图结果（include_results=true）
+        screen   - 每完成一张截图：index、filename、result（ScreenAnalysis）或 error，附带最新状态
+        finished - 任务结束（completed / failed / cancelled）
+    
+    once=true 时收到 finished 后关闭连接（最近的任务已结束时发送快照和 finished 后立即关闭），
+    否则保持连接等待下一次任务。
+    """
+    if app_id not in APPS:
+        raise HTTPException(status_code=404, detail=f"Unknown app: {app_id}")
+    
+    def snapshot() -> list:
+        initial = [("status", get_app_status(app_id))]
+        job = job_store.get_latest_job(app_id)
+        if include_results and job:
+            initial.append(("results", job_store.load_results(job["id"])))
+        # 任务已经结束时不会再有 finished 事件，直接补发
+        if once and job and job["status"] not in ACTIVE_STATUSES:
+            initial.append(("finished", job_store.get_status(job["id"])))
+        return initial
+    
+    return StreamingResponse(
+        sse_stream(job_events, app_id, snapshot, until=("finished",) if once else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/vision/analyze")
-async def start_analysis(request: AnalysisRequest, background_tasks: BackgroundTasks):
+async def start_analysis(request: AnalysisRequest):
     """启动截图分析任务"""
     app_id = request.app_id
     
@@ -104,92 +184,129 @@ async def start_analysis(request: AnalysisRequest, background_tasks: BackgroundT
             detail="API Keys not configured. Please configure via /api/vision/configure"
         )
     
+    if app_id not in APPS:
+        raise HTTPException(status_code=404, detail=f"Unknown app: {app_id}")
+    
     # 检查是否已在运行
-    if app_id in _analysis_status and _analysis_status[app_id].status == "running":
+    latest = job_store.get_latest_job(app_id)
+    if latest and latest["status"] in ACTIVE_STATUSES:
         raise HTTPException(
             status_code=409,
             detail=f"Analysis for {app_id} is already running"
         )
     
-    # 初始化状态
-    _analysis_status[app_id] = AnalysisStatus(
-        app_id=app_id,
-        status="pending",
-        progress=0,
-        total=0
-    )
+    job_id = job_store.create_job(app_id, request.start_index, request.end_index)
+    _launch(job_id)
     
-    # 在后台执行分析
-    background_tasks.add_task(
-        run_analysis_task,
-        app_id,
-        request.start_index,
-        request.end_index
-    )
+    return {"message": f"Analysis started for {app_id}", "status": "pending", "job_id": job_id}
+
+
+@router.post("/vision/analysis/{app_id}/resume")
+async def resume_analysis(app_id: str):
+    """从上次完成处继续（中断、失败或取消的任务），失败的截图会重试"""
+    job = job_store.get_latest_job(app_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"No analysis job for {app_id}")
+    if job["status"] not in RESUMABLE_STATUSES:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Analysis for {app_id} is {job['status']}, cannot resume"
+        )
+    
+    job_store.mark_pending(job["id"])
+    _launch(job["id"])
     
-    return {"message": f"Analysis started for {app_id}", "status": "pending"}
+    return {"message": f"Analysis resumed for {app_id}", "status": "pending", "job_id": job["id"]}
 
 
-async def run_analysis_task(app_id: str, start_index: int, end_index: Optional[int]):
-    """后台分析任务"""
-    import json
-    from datetime import datetime
+@router.post("/vision/analysis/{app_id}/cancel")
+async def cancel_analysis(app_id: str):
+    """取消正在运行的任务（已完成的截图保留，可稍后 resume）"""
+    job = job_store.get_latest_job(app_id)
+    if not job or job["status"] not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"No running analysis for {app_id}")
     
-    # App 配置
-    APPS = {
-        "flo": {"name": "Flo", "dir": "Flo"},
-        "yazio": {"name": "Yazio", "dir": "Yazio"},
-        "cal_ai": {"name": "Cal AI", "dir": "Cal_AI"},
-        "noom": {"name": "Noom", "dir": "Noom"},
-    }
+    job_store.request_cancel(job["id"])
+    task = _running_tasks.get(job["id"])
+    if task:
+        task.cancel()
+    else:
+        # 没有对应的后台任务（例如进程重启过），直接标记
+        job_store.mark_finished(job["id"], "cancelled")
+        _publish_status(app_id, job["id"], "finished")
     
-    if app_id not in APPS:
-        _analysis_status[app_id] = AnalysisStatus(
-            app_id=app_id,
-            status="failed",
-            error=f"Unknown app: {app_id}"
-        )
-        return
+    return {"message": f"Analysis cancelled for {app_id}", "job_id": job["id"]}
+
+
+async def run_analysis_task(job_id: int):
+    """
+    后台分析任务
     
+    每张截图完成后立即写入任务存储（检查点），续跑时跳过已完成的截图；
+    全部结束后由检查点汇总生成泳道图 JSON。
+    """
+    job = job_store.get_job(job_id)
+    app_id = job["app_id"]
+    start_index = job["start_index"]
+    end_index = job["end_index"]
     app_config = APPS[app_id]
     screenshots_dir = settings.downloads_dir / app_config["dir"]
     
     # 获取截图文件列表
-    screenshot_files = sorted([
-        f for f in screenshots_dir.iterdir()
-        if f.suffix.lower() in [".png", ".jpg", ".jpeg", ".webp"]
-    ])
+    screenshot_files = [screenshots_dir / e.name for e in list_images(screenshots_dir)]
     
     if end_index:
         screenshot_files = screenshot_files[:end_index]
     if start_index > 1:
         screenshot_files = screenshot_files[start_index - 1:]
     
-    total = len(screenshot_files)
-    _analysis_status[app_id] = AnalysisStatus(
-        app_id=app_id,
-        status="running",
-        progress=0,
-        total=total
-    )
+    job_store.mark_started(job_id, len(screenshot_files))
+    _publish_status(app_id, job_id)
+    
+    # 运行期间的进度在内存中维护，检查点和耗时在线程中写入，不阻塞事件循环
+    progress = await asyncio.to_thread(job_store.progress, job_id)
+    pipeline = PipelineResult()
+    
+    async def checkpoint(index: int, filename: str, result, error: Optional[str]):
+        data = result.model_dump() if result else None
+        await asyncio.to_thread(job_store.record_screen, job_id, index, filename, data, error)
+        progress.record_screen(index, error)
+        _current_screen[job_id] = filename
+        if job_events.subscriber_count(app_id):
+            job_events.publish(app_id, "screen", {
+                "index": index,
+                "filename": filename,
+                "result": data,
+                "error": error,
+                "status": progress.status(pipeline.bytes_original, pipeline.bytes_sent),
+            })
+    
+    async def record_latency(provider: str, seconds: float):
+        progress.record_latency(provider, seconds)
+        await asyncio.to_thread(job_store.record_latency, job_id, provider, seconds)
+    
+    # 记录本任务的模型调用耗时（流水线内的子任务继承该上下文）
+    latency_observer.set(record_latency)
     
     try:
-        results = []
-        
-        for i, file in enumerate(screenshot_files):
-            _analysis_status[app_id].progress = i
-            _analysis_status[app_id].current_screen = file.name
-            
-            # 分析单张截图
-            result = await vision_service.analyze_screenshot(
-                image_path=file,
-                index=i + start_index,
-                use_dual_model=True
+        # 并发流水线分析（按 Provider 限流，GPT/Opus 两阶段重叠执行）
+        try:
+            await run_pipeline(
+                vision_service,
+                screenshot_files,
+                start_index=start_index,
+                skip_indexes=job_store.done_indexes(job_id),
+                checkpoint=checkpoint,
+                pipeline=pipeline,
             )
-            results.append(result)
-            
-            # 短暂延迟避免 rate limit
-            await asyncio.sleep(0.5)
+        finally:
+            # 累加到任务上（续跑时之前各轮的字节数保留）
+            job_store.add_input_bytes(job_id, pipeline.bytes_original, pipeline.bytes_sent)
+        
+        results = job_store.load_results(job_id)
+        failures = job_store.load_failures(job_id)
+        if not results and failures:
+            raise RuntimeError(failures[0]["error"])
         
         # 保存结果
         output_dir = settings.data_dir / "analysis" / "swimlane"
@@ -210,46 +327,34 @@ async def run_analysis_task(app_id: str, start_index: int, end_index: Optional[i
                 "total_pages": len(results),
                 "by_type": {}
             },
-            "screens": [
-                {
-                    "index": r.index,
-                    "filename": r.filename,
-                    "primary_type": r.primary_type,
-                    "secondary_type": r.secondary_type,
-                    "phase": r.phase,
-                    "psychology": r.psychology,
-                    "ui_pattern": r.ui_pattern,
-                    "copy": {
-                        "headline": r.copy.headline,
-                        "subheadline": r.copy.subheadline,
-                        "cta": r.copy.cta
-                    },
-                    "insight": r.insight,
-                    "confidence": r.confidence,
-                    "analyzed_by": r.analyzed_by
-                }
-                for r in results
-            ],
+            "screens": results,
             "flow_patterns": {},
             "design_insights": {}
         }
         
         with open(output_path, "w", encoding="utf-8") as f:
             json.dump(output_data, f, ensure_ascii=False, indent=2)
+        swimlane_aggregate.refresh_app(app_id)
         
-        _analysis_status[app_id] = AnalysisStatus(
-            app_id=app_id,
-            status="completed",
-            progress=total,
-            total=total
+        job_store.mark_finished(
+            job_id,
+            "completed",
+            (
+                f"{len(failures)} screenshots failed: "
+                + ", ".join(f["filename"] for f in failures)
+            ) if failures else None
         )
     
+    except asyncio.CancelledError:
+        job_store.mark_finished(job_id, "cancelled")
+        raise
+    
     except Exception as e:
-        _analysis_status[app_id] = AnalysisStatus(
-            app_id=app_id,
-            status="failed",
-            error=str(e)
-        )
+        job_store.mark_finished(job_id, "failed", str(e))
+    
+    finally:
+        _current_screen.pop(job_id, None)
+        _publish_status(app_id, job_id, "finished")
 
 
 @router.get("/vision/apps")
@@ -257,23 +362,11 @@ async def list_available_apps():
     """列出可分析的 App"""
     apps = []
     
-    APPS = {
-        "flo": {"name": "Flo", "dir": "Flo", "expected": 100},
-        "yazio": {"name": "Yazio", "dir": "Yazio", "expected": 98},
-        "cal_ai": {"name": "Cal AI", "dir": "Cal_AI", "expected": 37},
-        "noom": {"name": "Noom", "dir": "Noom", "expected": 114},
-    }
-    
     for app_id, config in APPS.items():
         screenshots_dir = settings.downloads_dir / config["dir"]
         
         # 统计截图数量
-        screenshot_count = 0
-        if screenshots_dir.exists():
-            screenshot_count = len([
-                f for f in screenshots_dir.iterdir()
-                if f.suffix.lower() in [".png", ".jpg", ".jpeg", ".webp"]
-            ])
+        screenshot_count = len(list_images(screenshots_dir))
         
         # 检查是否已分析
         analysis_path = settings.data_dir / "analysis" / "swimlane" / f"{app_id}.json"
@@ -284,7 +377,7 @@ async def list_available_apps():
             "screenshot_count": screenshot_count,
             "expected_count": config["expected"],
             "analyzed": analysis_path.exists(),
-            "status": _analysis_status.get(app_id, AnalysisStatus(app_id=app_id, status="not_started"))
+            "status": get_app_status(app_id)
         })
     
     return apps
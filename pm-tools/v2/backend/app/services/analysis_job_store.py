@@ -0,0 +1,369 @@
+"""
+视觉分析任务存储（SQLite）
+- 任务状态持久化，服务重启后不丢失
+- 每张截图完成即写入检查点，中断后可从已完成处继续
+- 记录每次模型调用耗时，用于统计吞吐、ETA 和各 Provider 的延迟分位数
+- 累计各轮运行（含续跑）发送给模型的图片字节数
+"""
+import json
+import math
+import time
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from app.config import settings
+
+
+# 任务状态
+ACTIVE_STATUSES = ("pending", "running")
+RESUMABLE_STATUSES = ("interrupted", "failed", "cancelled")
+
+# 统计延迟分位数时每个 Provider 最多取最近的 N 次调用
+_LATENCY_WINDOW = 1000
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    """最近秩法分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _latency_summary(latencies: dict[str, list[float]]) -> dict:
+    """各 Provider 的调用次数和 p50/p90/p99 延迟"""
+    summary = {}
+    for provider, values in latencies.items():
+        values = sorted(values)
+        summary[provider] = {
+            "count": len(values),
+            "p50": round(_percentile(values, 50), 3),
+            "p90": round(_percentile(values, 90), 3),
+            "p99": round(_percentile(values, 99), 3),
+        }
+    return summary
+
+
+class JobProgress:
+    """
+    运行中任务的内存进度
+
+    由 get_status 的结果初始化，之后随检查点在内存中更新；每张截图完成后推送的状态
+    据此生成（结构与 get_status 相同），不必在事件循环上重新查询数据库。
+    """
+
+    def __init__(self, status: dict, failed_indexes: set[int], latencies: dict[str, list[float]]):
+        self._base = status
+        self._failed = set(failed_indexes)
+        self._done = status["progress"] - len(self._failed)
+        self._finished_this_run = 0
+        self._started = time.time()
+        self._latencies = {p: deque(v, maxlen=_LATENCY_WINDOW) for p, v in latencies.items()}
+
+    def record_screen(self, index: int, error: Optional[str] = None):
+        if error is None:
+            self._failed.discard(index)
+            self._done += 1
+        else:
+            self._failed.add(index)
+        self._finished_this_run += 1
+
+    def record_latency(self, provider: str, seconds: float):
+        self._latencies.setdefault(provider, deque(maxlen=_LATENCY_WINDOW)).append(seconds)
+
+    def status(self, bytes_original: int = 0, bytes_sent: int = 0) -> dict:
+        """
+        当前状态
+
+        Args:
+            bytes_original / bytes_sent: 本轮尚未累加到任务上的图片字节数
+        """
+        total = self._base["total"]
+        failed = len(self._failed)
+        elapsed = max(time.time() - self._started, 1e-6)
+        throughput = round(self._finished_this_run / elapsed * 60, 2)
+        remaining = max(0, total - self._done - failed)
+        base_bytes = self._base["input_bytes"]
+        original = base_bytes["original"] + bytes_original
+        sent = base_bytes["sent"] + bytes_sent
+        return {
+            **self._base,
+            "progress": self._done + failed,
+            "failed": failed,
+            "throughput_per_min": throughput,
+            "eta_seconds": round(remaining / throughput * 60, 1) if throughput > 0 else None,
+            "latency": _latency_summary(self._latencies),
+            "input_bytes": {"original": original, "sent": sent, "saved": original - sent},
+        }
+
+
+class AnalysisJobStore:
+    """分析任务存储"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    app_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    start_index INTEGER NOT NULL,
+                    end_index INTEGER,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    bytes_original INTEGER NOT NULL DEFAULT 0,
+                    bytes_sent INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_app ON jobs (app_id, id);
+
+                CREATE TABLE IF NOT EXISTS job_screens (
+                    job_id INTEGER NOT NULL,
+                    idx INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    finished_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, idx)
+                );
+
+                CREATE TABLE IF NOT EXISTS job_latency (
+                    job_id INTEGER NOT NULL,
+                    provider TEXT NOT NULL,
+                    seconds REAL NOT NULL,
+                    recorded_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_latency_job ON job_latency (job_id, provider);
+            """)
+            # 旧数据库补充字节统计列
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("bytes_original", "bytes_sent"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor
+
+    def _query(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    # ------------------------------------------------------------------
+    # 任务
+    # ------------------------------------------------------------------
+
+    def create_job(self, app_id: str, start_index: int, end_index: Optional[int]) -> int:
+        """创建任务（pending），返回任务 ID"""
+        cursor = self._execute(
+            "INSERT INTO jobs (app_id, status, start_index, end_index, created_at) VALUES (?, 'pending', ?, ?, ?)",
+            (app_id, start_index, end_index, time.time()),
+        )
+        return cursor.lastrowid
+
+    def get_job(self, job_id: int) -> Optional[dict]:
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return dict(rows[0]) if rows else None
+
+    def get_latest_job(self, app_id: str) -> Optional[dict]:
+        """App 最近一次任务"""
+        rows = self._query("SELECT * FROM jobs WHERE app_id = ? ORDER BY id DESC LIMIT 1", (app_id,))
+        return dict(rows[0]) if rows else None
+
+    def mark_started(self, job_id: int, total: int):
+        """开始（或继续）运行：记录本轮开始时间，用于计算吞吐"""
+        self._execute(
+            "UPDATE jobs SET status = 'running', total = ?, error = NULL, cancel_requested = 0, "
+            "started_at = ?, finished_at = NULL WHERE id = ?",
+            (total, time.time(), job_id),
+        )
+
+    def mark_pending(self, job_id: int):
+        """重新排队（续跑）"""
+        self._execute("UPDATE jobs SET status = 'pending', error = NULL WHERE id = ?", (job_id,))
+
+    def mark_finished(self, job_id: int, status: str, error: Optional[str] = None):
+        """结束任务：completed / failed / cancelled"""
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, error, time.time(), job_id),
+        )
+
+    def add_input_bytes(self, job_id: int, original: int, sent: int):
+        """累加本轮发送的图片字节数（续跑不覆盖之前各轮）"""
+        self._execute(
+            "UPDATE jobs SET bytes_original = bytes_original + ?, bytes_sent = bytes_sent + ? WHERE id = ?",
+            (original, sent, job_id),
+        )
+
+    def request_cancel(self, job_id: int):
+        self._execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+
+    def mark_interrupted(self) -> int:
+        """启动时调用：上次进程退出时仍在运行的任务标记为 interrupted"""
+        cursor = self._execute(
+            "UPDATE jobs SET status = 'interrupted', finished_at = ? WHERE status IN ('pending', 'running')",
+            (time.time(),),
+        )
+        return cursor.rowcount
+
+    # ------------------------------------------------------------------
+    # 检查点
+    # ------------------------------------------------------------------
+
+    def record_screen(self, job_id: int, index: int, filename: str, result: Any = None, error: Optional[str] = None):
+        """记录单张截图结果（失败的截图续跑时会重试并覆盖）"""
+        self._execute(
+            "INSERT OR REPLACE INTO job_screens (job_id, idx, filename, status, result, error, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_id,
+                index,
+                filename,
+                "done" if error is None else "failed",
+                json.dumps(result, ensure_ascii=False) if result is not None else None,
+                error,
+                time.time(),
+            ),
+        )
+
+    def done_indexes(self, job_id: int) -> set[int]:
+        """已完成的截图序号"""
+        rows = self._query("SELECT idx FROM job_screens WHERE job_id = ? AND status = 'done'", (job_id,))
+        return {row["idx"] for row in rows}
+
+    def load_results(self, job_id: int) -> list[dict]:
+        """已完成截图的结果（按序号排序）"""
+        rows = self._query(
+            "SELECT result FROM job_screens WHERE job_id = ? AND status = 'done' ORDER BY idx",
+            (job_id,),
+        )
+        return [json.loads(row["result"]) for row in rows]
+
+    def load_failures(self, job_id: int) -> list[dict]:
+        rows = self._query(
+            "SELECT idx, filename, error FROM job_screens WHERE job_id = ? AND status = 'failed' ORDER BY idx",
+            (job_id,),
+        )
+        return [{"index": row["idx"], "filename": row["filename"], "error": row["error"]} for row in rows]
+
+    def recent_latencies(self, job_id: int) -> dict[str, list[float]]:
+        """各 Provider 最近 _LATENCY_WINDOW 次调用的耗时（按时间先后）"""
+        latencies = {}
+        for (provider,) in self._query("SELECT DISTINCT provider FROM job_latency WHERE job_id = ?", (job_id,)):
+            rows = self._query(
+                "SELECT seconds FROM job_latency WHERE job_id = ? AND provider = ? "
+                "ORDER BY recorded_at DESC LIMIT ?",
+                (job_id, provider, _LATENCY_WINDOW),
+            )
+            latencies[provider] = [row["seconds"] for row in reversed(rows)]
+        return latencies
+
+    def progress(self, job_id: int) -> JobProgress:
+        """运行中任务的内存进度（开始运行后调用一次）"""
+        return JobProgress(
+            self.get_status(job_id),
+            {f["index"] for f in self.load_failures(job_id)},
+            self.recent_latencies(job_id),
+        )
+
+    def record_latency(self, job_id: int, provider: str, seconds: float):
+        self._execute(
+            "INSERT INTO job_latency (job_id, provider, seconds, recorded_at) VALUES (?, ?, ?, ?)",
+            (job_id, provider, seconds, time.time()),
+        )
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def get_status(self, job_id: int) -> Optional[dict]:
+        """
+        任务状态
+
+        包含进度、本轮吞吐（张/分钟）、预计剩余时间以及各 Provider 的 p50/p90/p99 延迟。
+        """
+        job = self.get_job(job_id)
+        if not job:
+            return None
+
+        counts = {
+            row["status"]: row["n"]
+            for row in self._query(
+                "SELECT status, COUNT(*) AS n FROM job_screens WHERE job_id = ? GROUP BY status",
+                (job_id,),
+            )
+        }
+        done = counts.get("done", 0)
+        failed = counts.get("failed", 0)
+
+        # 本轮吞吐：从本轮开始以来完成的截图数
+        throughput = None
+        eta_seconds = None
+        if job["started_at"]:
+            end = job["finished_at"] or time.time()
+            elapsed = max(end - job["started_at"], 1e-6)
+            finished_this_run = self._query(
+                "SELECT COUNT(*) AS n FROM job_screens WHERE job_id = ? AND finished_at >= ?",
+                (job_id, job["started_at"]),
+            )[0]["n"]
+            throughput = round(finished_this_run / elapsed * 60, 2)
+            remaining = max(0, job["total"] - done - failed)
+            if job["status"] == "running" and throughput > 0:
+                eta_seconds = round(remaining / throughput * 60, 1)
+
+        latency = _latency_summary(self.recent_latencies(job_id))
+
+        return {
+            "job_id": job["id"],
+            "app_id": job["app_id"],
+            "status": job["status"],
+            "progress": done + failed,
+            "total": job["total"],
+            "failed": failed,
+            "error": job["error"],
+            "cancel_requested": bool(job["cancel_requested"]),
+            "created_at": _iso(job["created_at"]),
+            "started_at": _iso(job["started_at"]),
+            "finished_at": _iso(job["finished_at"]),
+            "throughput_per_min": throughput,
+            "eta_seconds": eta_seconds,
+            "latency": latency,
+            "input_bytes": {
+                "original": job["bytes_original"],
+                "sent": job["bytes_sent"],
+                "saved": job["bytes_original"] - job["bytes_sent"],
+            },
+        }
+
+
+# 全局任务存储
+job_store = AnalysisJobStore(settings.data_dir / "analysis" / "jobs.sqlite3")
@@ -0,0 +1,45 @@
+"""
+原子文件写入
+先写同目录下的临时文件并 fsync，再 os.replace 覆盖目标：
+读取方要么看到旧文件，要么看到完整的新文件，进程崩溃也不会留下写了一半的 JSON。
+"""
+import os
+import json
+import threading
+from pathlib import Path
+from typing import Any, Union
+
+
+def _fsync_dir(directory: Path):
+    """fsync 目录，使 rename 本身落盘（Windows 不支持，跳过）"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_bytes_atomic(path: Union[str, Path], data: bytes):
+    """原子写入字节"""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(path.parent)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json_atomic(path: Union[str, Path], data: Any, indent: int = 2):
+    """原子写入 JSON（UTF-8，保留中文）"""
+    write_bytes_atomic(path, json.dumps(data, ensure_ascii=False, indent=indent).encode("utf-8"))
@@ -0,0 +1,321 @@
+"""
+内容寻址 Blob 存储（截图去重）
+- 同一张截图在 downloads_2024/<App>、projects/<项目>/Screens 之间往往有多份完整副本
+- blob 按 sha256 存放：{data_dir}/blobs/ab/abcdef...；截图目录中的文件替换为指向 blob 的硬链接，
+  所有读取路径不变（截图接口、缩略图、导出照常工作），重复内容只占一份磁盘空间
+- blob 设为只读（0444，硬链接共享权限）：原地改写会直接失败，不会同时改掉所有共享该 blob 的文件；
+  写入截图必须整体替换（atomic_file.write_bytes_atomic），上传和下载脚本都已如此
+- 备份（<App>_backup_*）和回收站（deleted/<批次>）同样链接到 blob，只占元数据；
+  需要独立副本的快照目录可在迁移时选择不链接（migrate_blob_store.py --private-snapshots）
+- 每个目录一个清单 .blobs.json（相对路径 -> sha256 / size / mtime_ns），用于完整性检查；
+  排序、删除、上传等操作不维护清单，verify 先按当前目录内容校正清单再检查
+- 引用计数即 blob 的硬链接数 - 1（由文件系统维护，不会过期），为 0 时 GC 删除
+- Windows 上只读属性会阻止重命名和删除，且不支持硬链接的文件系统无法去重：这两种情况只记录清单
+"""
+import os
+import json
+import stat
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+from app.config import settings
+from app.services.atomic_file import write_json_atomic
+from app.services.image_listing import is_image_file
+
+
+# 目录清单文件名
+MANIFEST_NAME = ".blobs.json"
+
+_CHUNK_SIZE = 1024 * 1024
+
+# blob 只读权限
+_BLOB_MODE = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+
+def file_sha256(path: Union[str, Path]) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _iter_images(directory: Path) -> Iterator[str]:
+    """
+    目录下的截图（相对路径）：目录本身和 screenshots 子目录，与 list_project_images 的范围一致
+    （thumbs_*、deleted/ 等子目录不包含；跳过隐藏文件和排序的临时文件）
+    """
+    for subdir in ("", "screenshots"):
+        path = directory / subdir if subdir else directory
+        if not path.is_dir():
+            continue
+        for entry in os.scandir(path):
+            name = entry.name
+            if name.startswith((".", "_temp_", "_undo_")) or not is_image_file(name) or not entry.is_file():
+                continue
+            yield f"{subdir}/{name}" if subdir else name
+
+
+def is_snapshot_directory(directory: Path) -> bool:
+    """备份副本或回收站批次"""
+    return "_backup_" in directory.name or directory.parent.name == "deleted"
+
+
+def load_manifest(directory: Path) -> dict[str, dict]:
+    """目录清单 相对路径 -> {"sha256", "size", "mtime_ns"}（不存在或损坏时为空）"""
+    try:
+        with open(directory / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def write_manifest(directory: Path, files: dict[str, dict]):
+    path = directory / MANIFEST_NAME
+    if files:
+        write_json_atomic(path, {"version": 1, "files": files})
+    else:
+        path.unlink(missing_ok=True)
+
+
+class BlobStore:
+    """sha256 -> 文件"""
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.link_enabled = os.name != "nt"
+        self._inodes: Optional[dict[tuple[int, int], str]] = None
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def iter_blobs(self) -> Iterator[tuple[str, os.stat_result]]:
+        """所有 blob (digest, stat)"""
+        if not self.root.exists():
+            return
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.startswith("."):
+                    yield entry.name, entry.stat()
+
+    def _inode_index(self) -> dict[tuple[int, int], str]:
+        """(设备, inode) -> digest：已链接到 blob 的文件无需重新计算哈希"""
+        if self._inodes is None:
+            self._inodes = {(st.st_dev, st.st_ino): digest for digest, st in self.iter_blobs()}
+        return self._inodes
+
+    def digest_of(self, path: Union[str, Path]) -> Optional[str]:
+        """文件已是某个 blob 的硬链接时返回其 digest（不读内容）"""
+        st = os.stat(path)
+        return self._inode_index().get((st.st_dev, st.st_ino))
+
+    @staticmethod
+    def _seal(blob: Path):
+        """blob 设为只读（所有硬链接共享）"""
+        if blob.stat().st_mode & 0o222:
+            os.chmod(blob, _BLOB_MODE)
+
+    def put(self, path: Union[str, Path]) -> tuple[str, int]:
+        """
+        把文件纳入 blob 存储（原地转换）
+
+        - blob 不存在：为文件创建一个只读的 blob 硬链接（不复制内容）
+        - blob 已存在：文件原子替换为指向 blob 的硬链接，释放重复内容
+
+        Returns:
+            (digest, 释放的字节数)
+        """
+        path = Path(path)
+        digest = self.digest_of(path)
+        if digest is not None:
+            self._seal(self.blob_path(digest))
+            return digest, 0
+
+        digest = file_sha256(path)
+        if not self.link_enabled:
+            return digest, 0
+        blob = self.blob_path(digest)
+        st = os.stat(path)
+
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, blob)
+            except OSError:
+                return digest, 0  # 不支持硬链接：只记录清单
+            self._seal(blob)
+            self._inode_index()[(st.st_dev, st.st_ino)] = digest
+            return digest, 0
+
+        if blob.stat().st_size != st.st_size:
+            raise ValueError(f"blob 与文件大小不一致，blob 可能已损坏: {blob}")
+
+        self._seal(blob)
+        tmp_path = path.with_name(f".{path.name}.blob.tmp")
+        try:
+            os.link(blob, tmp_path)
+        except OSError:
+            return digest, 0
+        os.replace(tmp_path, path)
+        # 文件原本还有其他硬链接时并未释放空间
+        return digest, st.st_size if st.st_nlink == 1 else 0
+
+    def detach(self, path: Union[str, Path]):
+        """把链接到 blob 的文件换回独立副本（保留修改时间，排序撤销的指纹不受影响）"""
+        path = Path(path)
+        st = os.stat(path)
+        tmp_path = path.with_name(f".{path.name}.detach.tmp")
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    # ==================== 目录清单 ====================
+
+    def scan_directory(self, directory: Path, previous: Optional[dict[str, dict]] = None) -> dict[str, dict]:
+        """
+        按目录当前内容生成清单
+
+        已链接的文件从 inode 得到 digest；未链接的文件沿用旧清单中 size + mtime_ns 相同的记录
+        （重命名不改变二者，排序、删除后仍能用原哈希校验），找不到时才计算哈希
+        """
+        previous = previous or {}
+        by_stat = {(info.get("size"), info.get("mtime_ns")): info["sha256"] for info in previous.values()}
+        files = {}
+        for rel in _iter_images(directory):
+            path = directory / rel
+            st = path.stat()
+            digest = self.digest_of(path)
+            if digest is None:
+                old = previous.get(rel)
+                if old and old.get("size") == st.st_size and old.get("mtime_ns") == st.st_mtime_ns:
+                    digest = old["sha256"]
+                else:
+                    digest = by_stat.get((st.st_size, st.st_mtime_ns)) or file_sha256(path)
+            files[rel] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        return files
+
+    def index_directory(self, directory: Union[str, Path], link: bool = True, write: bool = True) -> dict:
+        """
+        为目录生成清单
+
+        Args:
+            link: 把文件转换为 blob 硬链接；为 False 时已链接的文件换回独立副本
+            write: 为 False 时不改动任何文件（包括清单），只统计
+
+        Returns:
+            {"files", "bytes", "freed", "unlinked", "digests": {sha256: size}}
+        """
+        directory = Path(directory)
+        stats = {"files": 0, "bytes": 0, "freed": 0, "unlinked": 0, "digests": {}}
+        if write:
+            for rel in _iter_images(directory):
+                path = directory / rel
+                if link:
+                    stats["freed"] += self.put(path)[1]
+                elif self.digest_of(path) is not None:
+                    self.detach(path)
+
+        files = self.scan_directory(directory, load_manifest(directory))
+        for rel, info in files.items():
+            if self.digest_of(directory / rel) is None:
+                stats["unlinked"] += 1
+            stats["files"] += 1
+            stats["bytes"] += info["size"]
+            stats["digests"][info["sha256"]] = info["size"]
+        if write:
+            write_manifest(directory, files)
+        return stats
+
+    def verify(self, directories: Iterable[Path], refresh: bool = True) -> dict:
+        """
+        完整性检查：先按目录当前内容校正清单，再重新计算哈希（每个 blob 只计算一次）
+
+        Args:
+            refresh: 校正后的清单写回磁盘
+
+        Returns:
+            {"checked", "stale", "corrupted": [...]}，stale 为清单中已不存在（被重命名、删除）的记录数
+        """
+        blob_ok: dict[str, bool] = {}
+        report = {"checked": 0, "stale": 0, "corrupted": []}
+        for directory in directories:
+            previous = load_manifest(directory)
+            files = self.scan_directory(directory, previous)
+            report["stale"] += len(previous.keys() - files.keys())
+            if refresh and (files or previous):
+                write_manifest(directory, files)
+
+            for rel, info in files.items():
+                path = directory / rel
+                report["checked"] += 1
+                digest = info["sha256"]
+                if self.digest_of(path) == digest:
+                    if digest not in blob_ok:
+                        blob_ok[digest] = file_sha256(self.blob_path(digest)) == digest
+                    ok = blob_ok[digest]
+                else:
+                    ok = file_sha256(path) == digest
+                if not ok:
+                    report["corrupted"].append(str(path))
+        return report
+
+    def refcounts(self) -> dict[str, int]:
+        """digest -> 引用数（blob 之外的硬链接数）"""
+        return {digest: st.st_nlink - 1 for digest, st in self.iter_blobs()}
+
+    def gc(self, dry_run: bool = False) -> dict:
+        """
+        删除没有任何引用的 blob
+
+        Returns:
+            {"removed", "freed"}
+        """
+        removed, freed = 0, 0
+        for digest, count in self.refcounts().items():
+            if count > 0:
+                continue
+            blob = self.blob_path(digest)
+            size = blob.stat().st_size
+            if not dry_run:
+                blob.unlink()
+                if self._inodes is not None:
+                    self._inodes = {k: v for k, v in self._inodes.items() if v != digest}
+            removed += 1
+            freed += size
+        return {"removed": removed, "freed": freed}
+
+
+def image_directories() -> Iterator[Path]:
+    """
+    含截图的目录（每个生成一个清单）
+
+    downloads_2024/<App>（含 *_backup_*）及其 deleted/<批次>；projects/<项目>/Screens 及其 deleted/<批次>
+    """
+    def with_trash(project_dir: Path, screens_dir: Path) -> Iterator[Path]:
+        if screens_dir.is_dir():
+            yield screens_dir
+        deleted = project_dir / "deleted"
+        if deleted.is_dir():
+            yield from sorted(p for p in deleted.iterdir() if p.is_dir())
+
+    if settings.downloads_dir.exists():
+        for app_dir in sorted(p for p in settings.downloads_dir.iterdir() if p.is_dir()):
+            yield from with_trash(app_dir, app_dir)
+    if settings.projects_dir.exists():
+        for project_dir in sorted(p for p in settings.projects_dir.iterdir() if p.is_dir()):
+            screens = project_dir / "Screens"
+            if not screens.is_dir():
+                screens = project_dir / "screens"
+            yield from with_trash(project_dir, screens)
+
+
+# 全局 blob 存储
+blob_store = BlobStore(settings.data_dir / "blobs")
@@ -0,0 +1,117 @@
+"""
+分类更新写入合并（write-behind）
+- UI 连续调整分类时每次点击都是一个请求；原来每个请求都完整读写 classification.json 和 ai_analysis.json
+- 现在请求先把改动合并进项目的待写队列，等待 settings.classify_flush_delay 秒的合并窗口，
+  窗口内的所有改动由一次 project_store.update_classifications 写入
+- 每个项目一把 asyncio.Lock：同一项目的写入串行执行，刷新期间到达的改动进入下一次刷新
+- 请求等待包含自己改动的那次刷新完成后才返回，成功响应即表示已落盘；刷新失败时所有等待者收到同一异常
+- 读取分类时叠加尚未写入和正在写入的改动（overlay），读到的总是最新值
+"""
+import asyncio
+
+from app.config import settings
+from app.services.project_store import project_store
+
+
+class ClassificationWriter:
+    """按项目合并分类更新"""
+
+    def __init__(self, store, delay: float):
+        self.store = store
+        self.delay = delay
+        self._pending: dict[str, dict[str, dict]] = {}         # 项目 -> filename -> 字段
+        self._inflight: dict[str, dict[str, dict]] = {}        # 正在写入的改动（写完前 overlay 仍可见）
+        self._flushes: dict[str, asyncio.Future] = {}          # 项目 -> 下一次刷新
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._wake = asyncio.Event()                           # flush_all 时提前结束合并窗口
+        self.stats = {"submitted": 0, "flushes": 0}
+
+    def _lock(self, project: str) -> asyncio.Lock:
+        lock = self._locks.get(project)
+        if lock is None:
+            lock = self._locks[project] = asyncio.Lock()
+        return lock
+
+    async def submit(self, project: str, changes: dict[str, dict]) -> int:
+        """
+        提交改动并等待写入完成
+
+        Args:
+            changes: filename -> 要写入的字段
+
+        Returns:
+            本次提交的截图数
+        """
+        pending = self._pending.setdefault(project, {})
+        for filename, fields in changes.items():
+            pending.setdefault(filename, {}).update(fields)
+        self.stats["submitted"] += 1
+
+        future = self._flushes.get(project)
+        if future is None:
+            future = self._flushes[project] = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(self._flush_later(project, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        # shield：请求被取消时不影响其他等待同一次刷新的请求
+        await asyncio.shield(future)
+        return len(changes)
+
+    async def _flush_later(self, project: str, future: asyncio.Future):
+        if self.delay > 0:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+        await self._flush(project, future)
+
+    async def _flush(self, project: str, future: asyncio.Future):
+        async with self._lock(project):
+            # 取走改动后，新到达的改动会创建下一次刷新（等待锁）
+            if self._flushes.get(project) is future:
+                del self._flushes[project]
+            changes = self._pending.pop(project, {})
+            if not changes:
+                if not future.done():
+                    future.set_result(0)
+                return
+            self._inflight[project] = changes
+            try:
+                count = await asyncio.to_thread(self.store.update_classifications, project, changes)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception()  # 没有等待者时不报 "exception was never retrieved"
+                return
+            finally:
+                self._inflight.pop(project, None)
+            self.stats["flushes"] += 1
+            if not future.done():
+                future.set_result(count)
+
+    def overlay(self, project: str, classifications: dict) -> dict:
+        """把尚未写入的改动叠加到读取结果上"""
+        batches = [batch for batch in (self._inflight.get(project), self._pending.get(project)) if batch]
+        if not batches:
+            return classifications
+        merged = dict(classifications)
+        # 先叠加正在写入的，再叠加更新的待写改动
+        for batch in batches:
+            for filename, fields in batch.items():
+                merged[filename] = {**merged.get(filename, {}), **fields}
+        return merged
+
+    async def flush_all(self):
+        """立即写入所有待写改动（应用退出时调用）：提前结束合并窗口，等待已排定的刷新完成"""
+        self._wake.set()
+        try:
+            while self._tasks:
+                await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        finally:
+            self._wake.clear()
+
+
+# 全局写入器
+classification_writer = ClassificationWriter(project_store, settings.classify_flush_delay)
@@ -0,0 +1,214 @@
+"""
+响应压缩中间件（gzip / brotli）
+- 按 Accept-Encoding 协商编码（q 值相同时优先 brotli），brotli 需安装 brotli 或 brotlicffi 包
+- 只压缩完整响应体（单条 body 消息）的文本类响应，且大于 settings.compression_min_size；
+  流式响应（SSE、打包下载的 zip、大文件）原样透传
+- 带 ETag 的响应（汇总数据、分析文件等）按 (路径, ETag, 编码) 缓存压缩结果：
+  数据不变时重复请求只需一次字典查找，不再重新压缩
+- 压缩后的响应使用弱 ETag（W/"..."），条件请求比较时忽略 W/ 前缀，304 仍然有效
+"""
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+# 可压缩的 Content-Type（前缀匹配）；text/event-stream 是流式响应，单独排除
+_COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+_EXCLUDED_TYPES = ("text/event-stream",)
+
+# 超过该字节数时在线程池中压缩，避免阻塞事件循环
+_THREAD_THRESHOLD = 256 * 1024
+
+
+def supported_encodings() -> tuple[str, ...]:
+    """服务端支持的编码（按优先级）"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    按 Accept-Encoding 选择编码
+
+    Returns:
+        "br" / "gzip"，客户端不接受任何支持的编码时返回 None
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in supported_encodings():
+        q = qualities.get(coding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """按编码压缩"""
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.compression_brotli_quality)
+    # mtime=0：相同内容输出相同字节
+    return gzip.compress(body, compresslevel=settings.compression_gzip_level, mtime=0)
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    if content_type.startswith(_EXCLUDED_TYPES):
+        return False
+    return content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+class CompressedCache:
+    """压缩结果 LRU 缓存（按总字节数限制）"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key: tuple, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+# 全局压缩缓存
+compressed_cache = CompressedCache(settings.compression_cache_mb * 1024 * 1024)
+
+
+class CompressionMiddleware:
+    """gzip / brotli 响应压缩（纯 ASGI 中间件，不影响流式响应）"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: Optional[int] = None,
+        cache: Optional[CompressedCache] = None,
+    ):
+        self.app = app
+        self.minimum_size = settings.compression_min_size if minimum_size is None else minimum_size
+        self.cache = compressed_cache if cache is None else cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message: Optional[Message] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            # 第一条 body 消息：决定是否压缩
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start_message["headers"])
+            if (
+                message.get("more_body", False)
+                or start_message["status"] != 200
+                or "content-encoding" in headers
+                or not is_compressible(headers.get("content-type", ""))
+                or len(body) < self.minimum_size
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            headers.add_vary_header("Accept-Encoding")
+            if encoding is not None:
+                body = await self._compress(scope, headers.get("etag"), body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+
+            start_message["headers"] = headers.raw
+            passthrough = True
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _compress(self, scope: Scope, etag: Optional[str], body: bytes, encoding: str) -> bytes:
+        key = None
+        if etag:
+            key = (scope.get("path", ""), scope.get("query_string", b""), etag, encoding)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        if len(body) > _THREAD_THRESHOLD:
+            compressed = await anyio.to_thread.run_sync(compress, body, encoding)
+        else:
+            compressed = compress(body, encoding)
+
+        if key is not None:
+            self.cache.put(key, compressed)
+        return compressed
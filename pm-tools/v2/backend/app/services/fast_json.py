@@ -0,0 +1,77 @@
+"""
+快速 JSON 序列化
+- FastJSONResponse：全局默认响应类，用 orjson 渲染（未安装时回退到标准库 json）
+- dumps()：直接序列化 pydantic 模型、dict、list，不经过 jsonable_encoder
+- 响应体可以是预先序列化好的 bytes：不变的汇总数据序列化一次，之后直接复用
+- model_response()：热点列表接口绕过 response_model 的重复校验
+  （路由上保留 response_model，仅用于 OpenAPI 文档）
+"""
+import json
+from datetime import date, datetime
+from pathlib import PurePath
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """orjson / json 无法直接处理的类型"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, PurePath):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    # 与 jsonable_encoder 一致：非字符串 key 转为字符串
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        """序列化为 UTF-8 JSON 字节"""
+        return orjson.dumps(content, default=_default, option=_OPTIONS)
+else:
+    def dumps(content: Any) -> bytes:
+        """序列化为 UTF-8 JSON 字节"""
+        return json.dumps(
+            content, ensure_ascii=False, separators=(",", ":"), default=_default
+        ).encode("utf-8")
+
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    orjson 渲染的 JSON 响应
+
+    content 为 bytes 时视为已序列化的 JSON，原样作为响应体。
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return dumps(content)
+
+
+def model_response(
+    model: BaseModel,
+    status_code: int = 200,
+    headers: Optional[dict] = None,
+) -> FastJSONResponse:
+    """
+    直接返回 pydantic 模型（跳过 FastAPI 对 response_model 的再次校验和转换）
+
+    模型由服务层构造、类型已确定时使用。
+    """
+    return FastJSONResponse(model.model_dump_json().encode("utf-8"), status_code=status_code, headers=headers)
@@ -0,0 +1,252 @@
+"""
+操作历史存储（追加写 JSONL）
+- 每条记录一行追加到 history.jsonl，新增记录只写一行，不再整文件读取和重写
+- 记录带递增 id，/api/history 以 id 作为游标分页（before=上一页最后一条的 id）
+- 内存只缓存最近 settings.history_memory_items 条：常见的"最近 N 条"请求直接从内存返回；
+  更早的记录从文件末尾向前按块读取，不加载整个文件
+- 文件超过 settings.history_max_bytes 时轮转为 history.1.jsonl、history.2.jsonl ...，
+  保留 settings.history_backups 个
+- 首次使用时导入旧的 history.json（列表格式，或 {"recent_actions": [...]} 格式），原文件改名为 history.json.imported
+"""
+import os
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+from app.config import settings
+
+
+# 反向读取文件的块大小
+_BLOCK_SIZE = 64 * 1024
+
+
+def _read_lines_reversed(path: Path) -> Iterator[bytes]:
+    """从文件末尾向前逐行读取（跳过空行）"""
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return
+    with f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            size = min(_BLOCK_SIZE, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if remainder.strip():
+            yield remainder
+
+
+def _legacy_entries(data: Union[list, dict]) -> list[dict]:
+    """旧 history.json -> 按时间正序的记录"""
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+
+    # {"projects": [...], "recent_actions": [{"type", "description", "time"}]}，最新的在前
+    entries = []
+    for item in reversed(data.get("recent_actions") or []):
+        timestamp = item.get("timestamp") or item.get("time") or ""
+        try:
+            timestamp = datetime.fromisoformat(timestamp).isoformat()
+        except ValueError:
+            pass
+        entries.append({
+            "action": item.get("action") or item.get("type") or "unknown",
+            "description": item.get("description", ""),
+            "project": item.get("project"),
+            "timestamp": timestamp,
+        })
+    return entries
+
+
+class HistoryStore:
+    """操作历史（最新的记录在前返回）"""
+
+    def __init__(self, path: Union[str, Path], max_bytes: int, backups: int, memory_items: int,
+                 legacy_path: Optional[Union[str, Path]] = None):
+        self.path = Path(path)
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._recent: deque[dict] = deque(maxlen=max(1, memory_items))
+        self._count = 0
+        self._last_id = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    # ==================== 文件 ====================
+
+    def _rotated_path(self, n: int) -> Path:
+        return self.path.with_name(f"{self.path.stem}.{n}{self.path.suffix}")
+
+    def _files_newest_first(self) -> list[Path]:
+        return [self.path] + [self._rotated_path(n) for n in range(1, self.backups + 1)]
+
+    def _ensure_loaded(self):
+        """首次使用时导入旧文件，并从文件末尾加载最近的记录"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if not self.path.exists() and self.legacy_path and self.legacy_path.exists():
+                self._import_legacy()
+
+            self._count = 0
+            for path in self._files_newest_first():
+                try:
+                    with open(path, "rb") as f:
+                        self._count += sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(_BLOCK_SIZE), b""))
+                except OSError:
+                    pass
+
+            recent = []
+            for entry in self._iter_files():
+                recent.append(entry)
+                if len(recent) >= self._recent.maxlen:
+                    break
+            self._recent.extend(reversed(recent))
+            self._last_id = recent[0]["id"] if recent else 0
+            self._loaded = True
+
+    def _import_legacy(self):
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                entries = _legacy_entries(json.load(f))
+        except (OSError, ValueError, AttributeError):
+            return
+        with open(self.path, "w", encoding="utf-8") as f:
+            for i, entry in enumerate(entries, 1):
+                f.write(json.dumps({"id": i, **entry}, ensure_ascii=False) + "\n")
+        os.replace(self.legacy_path, self.legacy_path.with_name(self.legacy_path.name + ".imported"))
+
+    def _iter_files(self, skip: int = 0) -> Iterator[dict]:
+        """从文件读取记录（最新的在前），跳过最新的 skip 行"""
+        for path in self._files_newest_first():
+            for line in _read_lines_reversed(path):
+                if skip:
+                    skip -= 1
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def _rotate(self):
+        """history.jsonl -> history.1.jsonl -> ...，超出保留数的最旧文件删除"""
+        oldest = self._rotated_path(self.backups)
+        if self.backups == 0 or oldest.exists():
+            dropped = self.path if self.backups == 0 else oldest
+            try:
+                with open(dropped, "rb") as f:
+                    self._count -= sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(_BLOCK_SIZE), b""))
+            except OSError:
+                pass
+        for n in range(self.backups, 0, -1):
+            source = self.path if n == 1 else self._rotated_path(n - 1)
+            if source.exists():
+                os.replace(source, self._rotated_path(n))
+        if self.backups == 0:
+            self.path.unlink(missing_ok=True)
+        # 内存缓存只保留仍在文件中的记录
+        while len(self._recent) > self._count:
+            self._recent.popleft()
+
+    # ==================== 读写 ====================
+
+    def append(self, action: str, description: str, project: Optional[str] = None) -> dict:
+        """追加一条记录"""
+        self._ensure_loaded()
+        with self._lock:
+            entry = {
+                "id": self._last_id + 1,
+                "action": action,
+                "description": description,
+                "project": project,
+                "timestamp": datetime.now().isoformat(),
+            }
+            line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+            try:
+                size = self.path.stat().st_size
+            except OSError:
+                size = 0
+            if size and size + len(line) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "ab") as f:
+                f.write(line)
+            self._last_id = entry["id"]
+            self._count += 1
+            self._recent.append(entry)
+            return entry
+
+    def _iter_newest_first(self) -> Iterator[dict]:
+        """所有记录（最新的在前）：先读内存缓存，再从文件读更早的记录"""
+        with self._lock:
+            recent = list(self._recent)
+        yield from reversed(recent)
+        if len(recent) < self._count:
+            yield from self._iter_files(skip=len(recent))
+
+    def query(self, limit: int = 50, before: Optional[int] = None,
+              since: Optional[str] = None, until: Optional[str] = None) -> dict:
+        """
+        分页查询（最新的在前）
+
+        Args:
+            before: 游标，只返回 id 小于它的记录
+            since / until: ISO 时间范围（含边界）
+
+        Returns:
+            {"total", "items", "next_cursor"}，next_cursor 为 None 表示没有更多
+        """
+        self._ensure_loaded()
+        items = []
+        has_more = False
+        for entry in self._iter_newest_first():
+            if before is not None and entry.get("id", 0) >= before:
+                continue
+            timestamp = entry.get("timestamp", "")
+            if until is not None and timestamp > until:
+                continue
+            if since is not None and timestamp < since:
+                # 记录按时间追加，更早的都不在范围内
+                break
+            if len(items) >= limit:
+                has_more = True
+                break
+            items.append(entry)
+
+        return {
+            "total": self._count,
+            "items": items,
+            "next_cursor": items[-1]["id"] if has_more and items else None,
+        }
+
+    def clear(self):
+        """清空历史（包括轮转文件）"""
+        self._ensure_loaded()
+        with self._lock:
+            for path in self._files_newest_first():
+                path.unlink(missing_ok=True)
+            self._recent.clear()
+            self._count = 0
+
+
+# 全局历史存储
+history_store = HistoryStore(
+    settings.base_dir / "history.jsonl",
+    max_bytes=settings.history_max_bytes,
+    backups=settings.history_backups,
+    memory_items=settings.history_memory_items,
+    legacy_path=settings.base_dir / "history.json",
+)
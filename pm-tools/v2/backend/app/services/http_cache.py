@@ -0,0 +1,196 @@
+"""
+HTTP 条件请求 - 图片/JSON 接口共用的 ETag / Last-Modified / 304 处理
+- 文件：强 ETag 由 (inode, size, mtime_ns) 生成，无需读取文件内容
+- 基于文件的 JSON：ETag 由源文件 stat 组合而成，命中时不读取也不解析文件
+- If-None-Match 优先于 If-Modified-Since（RFC 9110）
+- JSON 响应体可按 (cache_key, ETag) 缓存序列化后的字节，版本不变时不重复序列化
+- 根据扩展名返回正确的 Content-Type
+"""
+import os
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence, Union
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+from app.services.fast_json import FastJSONResponse, dumps
+
+
+# 扩展名 -> MIME
+IMAGE_MEDIA_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+    ".svg": "image/svg+xml",
+    ".ico": "image/x-icon",
+}
+
+PathLike = Union[str, Path]
+
+# cache_key -> (ETag, 序列化后的响应体)
+_serialized: dict[str, tuple[str, bytes]] = {}
+
+
+def guess_media_type(path: PathLike, default: str = "application/octet-stream") -> str:
+    """根据扩展名推断 Content-Type"""
+    return IMAGE_MEDIA_TYPES.get(os.path.splitext(os.fspath(path))[1].lower(), default)
+
+
+def stat_etag(*stats: os.stat_result) -> str:
+    """由一个或多个文件的 (inode, size, mtime_ns) 生成强 ETag"""
+    base = "|".join(f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}" for st in stats)
+    if len(stats) == 1:
+        return f'"{base}"'
+    return f'"{hashlib.sha1(base.encode()).hexdigest()[:20]}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 比较（弱比较，忽略 W/ 前缀）"""
+    if if_none_match.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == target for tag in if_none_match.split(","))
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    判断客户端缓存是否仍然有效
+
+    有 If-None-Match 时只比较 ETag；否则比较 If-Modified-Since（精确到秒）。
+    """
+    if request.method not in ("GET", "HEAD"):
+        return False
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+
+    return False
+
+
+def _validator_headers(etag: str, last_modified: Optional[float], cache_control: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def _json_body(etag: str, loader: Callable[[], Any], cache_key: Optional[str]) -> Any:
+    """响应内容；提供 cache_key 时按 ETag 缓存序列化结果"""
+    if cache_key is None:
+        return loader()
+    cached = _serialized.get(cache_key)
+    if cached and cached[0] == etag:
+        return cached[1]
+    body = dumps(loader())
+    _serialized[cache_key] = (etag, body)
+    return body
+
+
+def not_modified_response(etag: str, last_modified: Optional[float] = None, cache_control: str = "no-cache") -> Response:
+    """304 响应（只带校验头，不带响应体）"""
+    return Response(status_code=304, headers=_validator_headers(etag, last_modified, cache_control))
+
+
+def file_response(
+    request: Request,
+    path: PathLike,
+    cache_control: str = "public, max-age=3600",
+    media_type: Optional[str] = None,
+    headers: Optional[dict] = None,
+) -> Response:
+    """
+    带条件请求支持的文件响应
+
+    Args:
+        request: 当前请求
+        path: 文件路径（调用方已确认存在）
+        cache_control: Cache-Control 头
+        media_type: Content-Type，默认按扩展名推断
+        headers: 额外响应头（如 Vary）
+    """
+    st = os.stat(path)
+    etag = stat_etag(st)
+    response_headers = _validator_headers(etag, st.st_mtime, cache_control)
+    if headers:
+        response_headers.update(headers)
+
+    if is_not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=response_headers)
+
+    return FileResponse(
+        path,
+        media_type=media_type or guess_media_type(path),
+        headers=response_headers,
+        stat_result=st,
+    )
+
+
+def file_json_response(
+    request: Request,
+    paths: Sequence[PathLike],
+    loader: Callable[[], Any],
+    cache_control: str = "no-cache",
+    cache_key: Optional[str] = None,
+) -> Response:
+    """
+    基于源文件的条件 JSON 响应
+
+    ETag/Last-Modified 由源文件的 stat 生成，命中缓存时直接返回 304，
+    不调用 loader（不读取、不解析 JSON）。不存在的文件不参与计算。
+
+    Args:
+        request: 当前请求
+        paths: 响应内容依赖的文件
+        loader: 生成响应内容的函数（可抛出 HTTPException）
+        cache_control: Cache-Control 头
+        cache_key: 提供时缓存序列化后的响应体，源文件不变时直接复用
+    """
+    stats = []
+    for path in paths:
+        try:
+            stats.append(os.stat(path))
+        except OSError:
+            continue
+
+    if not stats:
+        return FastJSONResponse(loader())
+
+    etag = stat_etag(*stats)
+    last_modified = max(st.st_mtime for st in stats)
+
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified, cache_control)
+
+    body = _json_body(etag, loader, cache_key)
+    return FastJSONResponse(body, headers=_validator_headers(etag, last_modified, cache_control))
+
+
+def etag_json_response(
+    request: Request,
+    etag: str,
+    loader: Callable[[], Any],
+    cache_control: str = "no-cache",
+    cache_key: Optional[str] = None,
+) -> Response:
+    """
+    由调用方提供 ETag 的条件 JSON 响应（内存数据的版本号等）
+
+    命中缓存时直接返回 304，不调用 loader。提供 cache_key 时缓存序列化后的响应体。
+    """
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, cache_control=cache_control)
+    body = _json_body(etag, loader, cache_key)
+    return FastJSONResponse(body, headers={"ETag": etag, "Cache-Control": cache_control})
@@ -0,0 +1,98 @@
+"""
+图片枚举服务 - 所有路由共用的截图目录列举
+- 每个目录只做一次 os.scandir
+- 按目录 mtime 缓存结果（目录内增删/重命名文件都会更新 mtime）
+"""
+import os
+import threading
+from pathlib import Path
+from typing import NamedTuple, Union
+
+
+# 支持的截图格式
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+class ImageEntry(NamedTuple):
+    """图片条目"""
+    name: str       # 相对目录的文件名（子目录文件带前缀，如 screenshots/xxx.webp）
+    size: int       # 字节数
+    mtime: float    # 修改时间
+
+
+# 目录路径 -> (目录 mtime_ns, 排序后的条目)
+_cache: dict[str, tuple[int, tuple[ImageEntry, ...]]] = {}
+_lock = threading.Lock()
+
+
+def is_image_file(filename: str) -> bool:
+    """是否为支持的截图文件"""
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def list_images(directory: Union[str, Path]) -> list[ImageEntry]:
+    """
+    列出目录下的图片文件（按文件名排序，不递归）
+
+    目录不存在时返回空列表。已有文件被原地覆盖不会改变目录 mtime，
+    此时 size/mtime 可能是旧值，但文件列表本身总是准确的。
+    """
+    path = os.fspath(directory)
+    try:
+        dir_mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return []
+
+    cached = _cache.get(path)
+    if cached and cached[0] == dir_mtime:
+        return list(cached[1])
+
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if not is_image_file(entry.name):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append(ImageEntry(entry.name, stat.st_size, stat.st_mtime))
+    except OSError:
+        return []
+
+    entries.sort(key=lambda e: e.name)
+    with _lock:
+        _cache[path] = (dir_mtime, tuple(entries))
+    return entries
+
+
+def list_project_images(screens_dir: Union[str, Path], subdir: str = "screenshots") -> list[ImageEntry]:
+    """
+    列出项目截图：根目录 + screenshots 子目录
+
+    子目录条目的 name 带 "screenshots/" 前缀，整体按文件名（不含前缀）排序，
+    与截图列表接口的展示顺序一致。
+    """
+    entries = list_images(screens_dir)
+    sub_entries = [
+        e._replace(name=f"{subdir}/{e.name}")
+        for e in list_images(os.path.join(os.fspath(screens_dir), subdir))
+    ]
+    if not sub_entries:
+        return entries
+
+    return sorted(entries + sub_entries, key=lambda e: os.path.basename(e.name))
+
+
+def list_image_names(directory: Union[str, Path]) -> list[str]:
+    """列出目录下的图片文件名（已排序）"""
+    return [e.name for e in list_images(directory)]
+
+
+def clear_cache():
+    """清空缓存"""
+    with _lock:
+        _cache.clear()
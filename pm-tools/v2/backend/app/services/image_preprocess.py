@@ -0,0 +1,282 @@
+"""
+视觉模型输入预处理
+- 裁掉设备外框（透明或深色纯色边框，内部屏幕为手机屏幕比例且边缘完整）；没有外框的竖屏截图裁掉顶部状态栏
+- 长边缩放到 settings.vision_max_long_edge，重新编码为 JPEG/WebP
+- 编码结果按 (原图内容哈希, 预处理参数) 缓存到 data/cache/vision_inputs，
+  GPT / Opus 两个阶段、重试以及重复运行都复用同一份数据
+- 统计节省的字节数
+"""
+import io
+import hashlib
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+from PIL import Image, ImageChops
+
+from app.config import settings
+from app.services.vision_cache import sha256_bytes
+
+
+# 预处理算法版本（算法改动时递增，使旧缓存失效）
+_VERSION = 3
+
+# 深色外框的亮度上限、颜色容差
+_FRAME_MAX_LUMA = 40
+_FRAME_TOLERANCE = 12
+
+# 外框四边都至少占宽/高的比例才裁剪（深色模式界面两侧留白但顶部有状态栏，不会被当作外框）
+_FRAME_MIN_RATIO = 0.02
+
+# 外框内屏幕的特征：长短边比例在手机屏幕范围内、占整张图的面积比例下限，
+# 以及屏幕四条边（向内缩进一点以避开圆角）中段被内容覆盖的比例下限。
+# 深色启动页、深色引导页四周同样是纯色，但内容（Logo、文字块）的边界不满足这些条件
+_SCREEN_ASPECT = (1.6, 2.4)
+_SCREEN_MIN_AREA = 0.4
+_SCREEN_EDGE_INSET = 0.02
+_SCREEN_EDGE_COVERAGE = 0.95
+
+# 宽高比超过该值视为竖屏手机截图（才裁状态栏）
+_PORTRAIT_RATIO = 1.6
+
+_MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class PreparedImage(NamedTuple):
+    """发送给模型的图片"""
+    data: bytes
+    media_type: str
+    original_size: int      # 原图字节数
+
+
+class PreprocessStats:
+    """预处理统计（进程内累计）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.cache_hits = 0
+        self.bytes_original = 0
+        self.bytes_sent = 0
+
+    def record(self, original: int, sent: int, cache_hit: bool):
+        with self._lock:
+            self.images += 1
+            self.cache_hits += int(cache_hit)
+            self.bytes_original += original
+            self.bytes_sent += sent
+
+    def to_dict(self) -> dict:
+        return {
+            "enabled": settings.vision_preprocess,
+            "images": self.images,
+            "cache_hits": self.cache_hits,
+            "bytes_original": self.bytes_original,
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.bytes_original - self.bytes_sent,
+        }
+
+
+def _output_format() -> str:
+    return settings.vision_image_format if settings.vision_image_format in _MEDIA_TYPES else "jpeg"
+
+
+def _options_key(crop: bool) -> str:
+    """影响输出的参数"""
+    fmt = _output_format()
+    text = (
+        f"v{_VERSION}-{int(crop)}-{settings.vision_status_bar_ratio}-"
+        f"{settings.vision_max_long_edge}-{fmt}-{settings.vision_image_quality}"
+    )
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+def _is_screen(mask: Image.Image, bbox: tuple[int, int, int, int]) -> bool:
+    """
+    内容边界是否像外框内的手机屏幕
+
+    Args:
+        mask: 非外框像素为 255 的 L 图
+        bbox: 内容边界
+    """
+    left, top, right, bottom = bbox
+    w, h = right - left, bottom - top
+    if not _SCREEN_ASPECT[0] <= max(w, h) / min(w, h) <= _SCREEN_ASPECT[1]:
+        return False
+    if w * h < mask.width * mask.height * _SCREEN_MIN_AREA:
+        return False
+
+    # 屏幕是实心矩形：四条边（缩进避开圆角）的中间 80% 应几乎全部是内容
+    dx, dy = max(1, round(w * _SCREEN_EDGE_INSET)), max(1, round(h * _SCREEN_EDGE_INSET))
+    mx, my = w // 10, h // 10
+    edges = (
+        (left + mx, top + dy, right - mx, top + dy + 1),
+        (left + mx, bottom - dy - 1, right - mx, bottom - dy),
+        (left + dx, top + my, left + dx + 1, bottom - my),
+        (right - dx - 1, top + my, right - dx, bottom - my),
+    )
+    for box in edges:
+        line = mask.crop(box)
+        if line.histogram()[255] < line.width * line.height * _SCREEN_EDGE_COVERAGE:
+            return False
+    return True
+
+
+def _crop_frame(img: Image.Image) -> Optional[Image.Image]:
+    """
+    裁掉设备外框：四角颜色一致且为透明或深色、四边都有一圈同色边框，
+    且框内是手机屏幕比例的完整矩形时，按屏幕边界裁剪
+
+    Returns:
+        裁剪后的图片；不是外框时返回 None
+    """
+    width, height = img.size
+    rgba = img.convert("RGBA")
+    corners = [rgba.getpixel(xy) for xy in ((0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1))]
+
+    if all(c[3] == 0 for c in corners):
+        diff = rgba.getchannel("A")
+        threshold = 0
+    else:
+        r, g, b, _ = corners[0]
+        if any(max(abs(c[i] - corners[0][i]) for i in range(3)) > _FRAME_TOLERANCE for c in corners):
+            return None
+        if 0.299 * r + 0.587 * g + 0.114 * b > _FRAME_MAX_LUMA:
+            return None
+        rgb = rgba.convert("RGB")
+        diff = ImageChops.difference(rgb, Image.new("RGB", rgb.size, (r, g, b))).convert("L")
+        threshold = _FRAME_TOLERANCE
+    mask = diff.point(lambda v: 255 if v > threshold else 0)
+    bbox = mask.getbbox()
+
+    if not bbox:
+        return None
+    left, top, right, bottom = bbox
+    if min(left, width - right) < width * _FRAME_MIN_RATIO:
+        return None
+    if min(top, height - bottom) < height * _FRAME_MIN_RATIO:
+        return None
+    if not _is_screen(mask, bbox):
+        return None
+    return img.crop(bbox)
+
+
+def _crop_status_bar(img: Image.Image) -> Image.Image:
+    """裁掉竖屏截图顶部状态栏"""
+    width, height = img.size
+    ratio = settings.vision_status_bar_ratio
+    if ratio <= 0 or height / width < _PORTRAIT_RATIO:
+        return img
+    return img.crop((0, int(height * ratio), width, height))
+
+
+def _encode(img: Image.Image, fmt: str) -> bytes:
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, "WEBP", quality=settings.vision_image_quality, method=4)
+    else:
+        img.save(buf, "JPEG", quality=settings.vision_image_quality, optimize=True)
+    return buf.getvalue()
+
+
+def preprocess_bytes(data: bytes, crop: bool = True) -> tuple[bytes, str]:
+    """
+    预处理图片
+
+    Returns:
+        (编码后的字节, 媒体类型)
+    """
+    fmt = _output_format()
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        if crop:
+            # 外框内的截图边界已确定，再裁状态栏会裁掉真实内容
+            framed = _crop_frame(img)
+            img = framed if framed is not None else _crop_status_bar(img)
+
+        max_edge = settings.vision_max_long_edge
+        if max_edge and max(img.size) > max_edge:
+            scale = max_edge / max(img.size)
+            img = img.resize(
+                (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                Image.LANCZOS,
+            )
+        return _encode(img, fmt), _MEDIA_TYPES[fmt]
+
+
+def _sniff_media_type(data: bytes) -> str:
+    """原图的媒体类型（按文件头判断）"""
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/png"
+
+
+class ImagePreprocessor:
+    """带磁盘缓存的预处理器"""
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        self.cache_dir = Path(cache_dir)
+        self.stats = PreprocessStats()
+
+    def prepare(self, image_path: Union[str, Path], crop: bool = True) -> PreparedImage:
+        """
+        读取截图并返回发送给模型的数据
+
+        Args:
+            image_path: 截图路径
+            crop: 是否裁剪外框和状态栏（商店宣传图等完整设计稿应传 False）
+        """
+        image_path = Path(image_path)
+        with open(image_path, "rb") as f:
+            original = f.read()
+
+        if not settings.vision_preprocess:
+            return self._passthrough(original)
+
+        fmt = _output_format()
+        cache_path = self.cache_dir / f"{sha256_bytes(original)}_{_options_key(crop)}.{fmt}"
+
+        try:
+            data = cache_path.read_bytes()
+            self.stats.record(len(original), len(data), True)
+            return PreparedImage(data, _MEDIA_TYPES[fmt], len(original))
+        except FileNotFoundError:
+            pass
+
+        try:
+            data, media_type = preprocess_bytes(original, crop)
+        except Exception as e:
+            print(f"[WARN] 图片预处理失败，发送原图: {image_path.name}: {e}")
+            return self._passthrough(original)
+
+        # 处理后反而更大（小图标等）时发送原图
+        if len(data) >= len(original):
+            return self._passthrough(original)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".tmp{threading.get_ident()}")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(cache_path)
+
+        self.stats.record(len(original), len(data), False)
+        return PreparedImage(data, media_type, len(original))
+
+    def _passthrough(self, original: bytes) -> PreparedImage:
+        self.stats.record(len(original), len(original), False)
+        return PreparedImage(original, _sniff_media_type(original), len(original))
+
+
+# 全局预处理器
+image_preprocessor = ImagePreprocessor(settings.cache_dir / "vision_inputs")
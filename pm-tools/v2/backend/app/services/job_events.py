@@ -0,0 +1,109 @@
+"""
+分析任务事件广播（进程内）
+- 分析任务每完成一张截图发布一次事件，SSE 连接订阅后实时推送
+- 每个订阅者一个有界队列：客户端读得慢时丢弃最旧的事件，不阻塞分析任务
+- 事件按 App 分组，自增 ID 可作为 SSE 的 id 字段
+"""
+import json
+import asyncio
+import itertools
+from typing import Any, AsyncIterator, Callable, Optional
+
+
+# 每个订阅者最多积压的事件数
+_QUEUE_SIZE = 256
+
+# 无事件时的心跳间隔（秒），防止代理断开空闲连接
+HEARTBEAT_SECONDS = 15.0
+
+
+class JobEventBus:
+    """按 App 分组的事件广播"""
+
+    def __init__(self):
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._ids = itertools.count(1)
+
+    def publish(self, app_id: str, event: str, data: Any):
+        """发布事件（只能在事件循环线程中调用）"""
+        subscribers = self._subscribers.get(app_id)
+        if not subscribers:
+            return
+
+        message = (next(self._ids), event, data)
+        for queue in subscribers:
+            if queue.full():
+                # 慢客户端：丢弃最旧的事件
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def subscribe(self, app_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_SIZE)
+        self._subscribers.setdefault(app_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, app_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(app_id)
+        if subscribers:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[app_id]
+
+    def subscriber_count(self, app_id: Optional[str] = None) -> int:
+        if app_id is not None:
+            return len(self._subscribers.get(app_id, ()))
+        return sum(len(s) for s in self._subscribers.values())
+
+
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """格式化为一条 SSE 消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    lines.extend(f"data: {line}" for line in payload.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+async def sse_stream(
+    bus: JobEventBus,
+    app_id: str,
+    snapshot: Callable[[], list[tuple[str, Any]]],
+    until: Optional[tuple[str, ...]] = None,
+) -> AsyncIterator[str]:
+    """
+    订阅 App 事件并输出 SSE 文本
+
+    Args:
+        bus: 事件广播
+        app_id: App ID
+        snapshot: 订阅后调用，返回先发送的 (event, data)，如当前状态快照和已完成的结果
+        until: 收到这些事件后结束流（如任务结束），None 表示一直保持连接；
+            快照中已包含这些事件时发送完快照即结束
+    """
+    # 先订阅再生成快照，两者之间发布的事件进入队列，不会丢失
+    queue = bus.subscribe(app_id)
+    try:
+        initial = snapshot()
+        for event, data in initial:
+            yield format_sse(event, data)
+        if until and any(event in until for event, _ in initial):
+            return
+
+        while True:
+            try:
+                event_id, event, data = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            yield format_sse(event, data, event_id)
+            if until and event in until:
+                return
+    finally:
+        bus.unsubscribe(app_id, queue)
+
+
+# 全局事件广播
+job_events = JobEventBus()
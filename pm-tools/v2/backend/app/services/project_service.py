@@ -1,35 +1,40 @@
 """
 项目服务 - 业务逻辑
 """
+import os
 import json
+import asyncio
+import threading
 from pathlib import Path
 from typing import Optional
 
 from app.config import settings
 from app.models.project import Project
+from app.services.image_listing import list_project_images
+from app.services.project_store import ONBOARDING_RANGE, project_store
 
 
 # Mobbin 来源的 App 列表
 MOBBIN_APPS = {"Cal_AI", "Fitbit"}
 
+# 决定项目信息的路径：目录本身（截图增删）、screenshots 子目录、检查状态文件
+# （Onboarding 范围使用 project_store 的签名）
+_SIGNATURE_PATHS = ("", "screenshots", "check_status.json")
+
 
 def get_all_projects() -> list[Project]:
-    """获取所有项目（仅从 downloads_2024 目录加载）"""
-    projects: list[Project] = []
-    
-    # 仅扫描 downloads_2024 目录（新数据）
-    if settings.downloads_dir.exists():
-        for item in settings.downloads_dir.iterdir():
-            if item.is_dir() and "_backup" not in item.name:
-                project = _load_project_from_downloads_dir(item)
-                if project:
-                    # 显示所有项目，包括空项目（screen_count = 0）
-                    projects.append(project)
-    
-    # 按截图数量排序（空项目排在最后）
-    projects.sort(key=lambda x: (-x.screen_count if x.screen_count > 0 else float('inf')))
-    
-    return projects
+    """获取所有项目（从内存索引读取，不访问磁盘）"""
+    return project_index.get_all()
+
+
+def get_project(project_name: str) -> Optional[Project]:
+    """按名称获取单个项目"""
+    return project_index.get(project_name)
+
+
+def _sort_projects(projects: list[Project]) -> list[Project]:
+    """按截图数量排序（空项目排在最后）"""
+    return sorted(projects, key=lambda x: (-x.screen_count if x.screen_count > 0 else float('inf')))
 
 
 def _load_project_from_downloads_dir(path: Path) -> Optional[Project]:
@@ -37,15 +42,7 @@ def _load_project_from_downloads_dir(path: Path) -> Optional[Project]:
     name = path.name
     
     # 计算截图数量（支持多种格式和 screenshots 子目录）
-    screen_count = 0
-    # 根目录的截图
-    for ext in ["*.png", "*.jpg", "*.jpeg", "*.webp"]:
-        screen_count += len(list(path.glob(ext)))
-    # screenshots 子目录的截图
-    screenshots_dir = path / "screenshots"
-    if screenshots_dir.exists():
-        for ext in ["*.png", "*.jpg", "*.jpeg", "*.webp"]:
-            screen_count += len(list(screenshots_dir.glob(ext)))
+    screen_count = len(list_project_images(path))
     
     # 根据来源设置数据来源和颜色（显示名只用项目名，不带前缀）
     if name in MOBBIN_APPS:
@@ -95,14 +92,12 @@ def _load_check_status(path: Path) -> tuple[bool, Optional[str]]:
 
 def _load_onboarding_range(path: Path) -> tuple[int, int]:
     """加载 Onboarding 范围"""
-    ob_file = path / "onboarding_range.json"
-    if ob_file.exists():
-        try:
-            with open(ob_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
+    try:
+        data = project_store.load_onboarding_range(f"downloads_2024/{path.name}")
+        if data:
             return data.get("start", -1), data.get("end", -1)
-        except:
-            pass
+    except:
+        pass
     return -1, -1
 
 
@@ -112,3 +107,140 @@ def get_project_path(project_name: str) -> Path:
         app_name = project_name.replace("downloads_2024/", "")
         return settings.downloads_dir / app_name
     return settings.projects_dir / project_name
+
+
+# ============================================================================
+# 项目内存索引
+# ============================================================================
+
+def _project_signature(path: Path) -> tuple:
+    """项目签名：相关路径的 mtime，任一变化即需要重新加载"""
+    signature = []
+    for rel in _SIGNATURE_PATHS:
+        try:
+            signature.append((path / rel if rel else path).stat().st_mtime_ns)
+        except OSError:
+            signature.append(None)
+    signature.append(project_store.signature(f"downloads_2024/{path.name}", ONBOARDING_RANGE))
+    return tuple(signature)
+
+
+class ProjectIndex:
+    """
+    项目内存索引
+    
+    启动时完整扫描一次，之后通过 mtime 扫描增量更新：
+    只有目录或状态文件 mtime 发生变化的项目才会重新加载。
+    列表接口直接读取内存中的排序结果，不访问磁盘。
+    """
+    
+    def __init__(self, root: Path):
+        self.root = root
+        self._entries: dict[str, tuple[tuple, Project]] = {}
+        self._root_mtime: Optional[int] = None
+        self._sorted: list[Project] = []
+        self._by_name: dict[str, Project] = {}
+        self._built = False
+        self._lock = threading.RLock()
+    
+    def get_all(self) -> list[Project]:
+        """获取所有项目（已排序）"""
+        if not self._built:
+            self.refresh()
+        return list(self._sorted)
+    
+    def get(self, project_name: str) -> Optional[Project]:
+        """按名称获取项目"""
+        if not self._built:
+            self.refresh()
+        return self._by_name.get(project_name)
+    
+    def refresh(self) -> int:
+        """
+        mtime 扫描，重新加载发生变化的项目
+        
+        Returns:
+            变化（新增/删除/更新）的项目数量
+        """
+        with self._lock:
+            changed = 0
+            
+            try:
+                root_mtime = self.root.stat().st_mtime_ns
+            except OSError:
+                root_mtime = None
+            
+            # 根目录变化说明有项目增删，重新列目录
+            if root_mtime != self._root_mtime:
+                names = set()
+                if root_mtime is not None:
+                    with os.scandir(self.root) as it:
+                        names = {
+                            entry.name for entry in it
+                            if entry.is_dir() and "_backup" not in entry.name
+                        }
+                for name in set(self._entries) - names:
+                    del self._entries[name]
+                    changed += 1
+                for name in names - set(self._entries):
+                    changed += self._reload(name)
+                self._root_mtime = root_mtime
+            
+            for name in list(self._entries):
+                changed += self._reload(name)
+            
+            if changed or not self._built:
+                self._publish()
+            self._built = True
+            return changed
+    
+    def refresh_project(self, project_name: str):
+        """立即重新加载单个项目（写操作完成后调用）"""
+        if not project_name.startswith("downloads_2024/"):
+            return
+        name = project_name.replace("downloads_2024/", "").split("/")[0]
+        if not name or "_backup" in name:
+            return
+        
+        with self._lock:
+            if self._reload(name):
+                self._publish()
+    
+    async def watch(self, interval: float):
+        """后台轮询 mtime，持续增量更新索引"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                print(f"[WARN] 项目索引刷新失败: {e}")
+    
+    def _reload(self, name: str) -> int:
+        """签名变化时重新加载项目，返回是否有变化"""
+        path = self.root / name
+        signature = _project_signature(path)
+        
+        if signature[0] is None:
+            # 目录已被删除
+            return 1 if self._entries.pop(name, None) else 0
+        
+        cached = self._entries.get(name)
+        if cached and cached[0] == signature:
+            return 0
+        
+        project = _load_project_from_downloads_dir(path)
+        if project is None:
+            return 1 if self._entries.pop(name, None) else 0
+        
+        self._entries[name] = (signature, project)
+        return 1
+    
+    def _publish(self):
+        """重建排序列表和名称映射（整体替换，读取方无需加锁）"""
+        projects = _sort_projects([project for _, project in self._entries.values()])
+        self._by_name = {p.name: p for p in projects}
+        self._sorted = projects
+
+
+# 全局索引实例
+project_index = ProjectIndex(settings.downloads_dir)
@@ -0,0 +1,339 @@
+"""
+项目数据存储
+- 分类（classification.json）、AI 分析结果（ai_analysis.json）、Onboarding 范围（onboarding_range.json）
+  统一经过 project_store 读写，路由和服务不再直接打开这些文件
+- 后端由 settings.storage_backend 选择：
+  - json：读写项目目录下的 JSON 文件（原有行为）
+  - dual：过渡模式，从 SQLite 读取，同时写入 SQLite 和 JSON 文件（仍读 JSON 的脚本不受影响）；
+    JSON 文件被外部修改（mtime 与同步时不同）时自动重新导入
+  - sqlite：只读写 SQLite；首次访问尚未导入的文档时从 JSON 文件导入一次
+- SQLite 中逐截图条目单独成行（DBManager 的 project_documents / project_entries 表）：
+  存放在独立的 settings.project_store_path，不与 migrate.py 会整体重建的 pm_tool.db 共用文件；
+  更新分类只读写涉及的行，不再整文件解析和重写；文档 revision 用作截图清单等缓存的签名
+- JSON 文件原子写入（临时文件 + fsync + rename）；分类更新经 classification_writer 合并后批量写入
+- 一次性导入全部项目：python scripts/import_project_store.py
+"""
+import os
+import json
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional
+
+from app.config import settings
+from app.services.atomic_file import write_json_atomic
+from data.csv_data.db_manager import DBManager
+
+
+# 文档类型 -> 项目目录下的文件名
+CLASSIFICATION = "classification"
+AI_ANALYSIS = "ai_analysis"
+ONBOARDING_RANGE = "onboarding_range"
+DOCUMENT_FILES = {
+    CLASSIFICATION: "classification.json",
+    AI_ANALYSIS: "ai_analysis.json",
+    ONBOARDING_RANGE: "onboarding_range.json",
+}
+
+# onboarding_range.json 保留的备份数
+_RANGE_BACKUPS = 10
+
+
+def project_path(project_name: str) -> Path:
+    """获取项目路径"""
+    if project_name.startswith("downloads_2024/"):
+        return settings.downloads_dir / project_name.replace("downloads_2024/", "")
+    return settings.projects_dir / project_name
+
+
+def iter_project_names() -> Iterator[str]:
+    """所有可能有项目文档的项目名（projects、downloads_2024 及其 screenshots 子目录）"""
+    if settings.projects_dir.exists():
+        for entry in sorted(settings.projects_dir.iterdir()):
+            if entry.is_dir():
+                yield entry.name
+    if settings.downloads_dir.exists():
+        for entry in sorted(settings.downloads_dir.iterdir()):
+            if entry.is_dir() and "_backup" not in entry.name:
+                yield f"downloads_2024/{entry.name}"
+                if (entry / "screenshots").is_dir():
+                    yield f"downloads_2024/{entry.name}/screenshots"
+
+
+def _split_document(kind: str, data: dict) -> tuple[Optional[dict], dict]:
+    """JSON 文件内容 -> (header, 逐截图条目)"""
+    if kind == CLASSIFICATION:
+        return None, data
+    if kind == AI_ANALYSIS:
+        header = {k: v for k, v in data.items() if k != "results"}
+        return header, data.get("results") or {}
+    return data, {}
+
+
+class JsonProjectStore:
+    """读写项目目录下的 JSON 文件"""
+
+    backend = "json"
+
+    def document_path(self, project: str, kind: str) -> Path:
+        return project_path(project) / DOCUMENT_FILES[kind]
+
+    def read_document(self, project: str, kind: str) -> Optional[dict]:
+        """读取 JSON 文件（不存在时为 None）"""
+        path = self.document_path(project, kind)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load_document(self, project: str, kind: str) -> Optional[dict]:
+        """完整文档内容（与 JSON 文件格式相同）"""
+        return self.read_document(project, kind)
+
+    def _write_document(self, project: str, kind: str, data: dict):
+        write_json_atomic(self.document_path(project, kind), data)
+
+    def load_analysis_results(self, project: str) -> dict:
+        """AI 分析结果（ai_analysis.json 的 results）"""
+        data = self.read_document(project, AI_ANALYSIS)
+        return data.get("results", {}) if data else {}
+
+    def load_classifications(self, project: str) -> dict:
+        """分类数据：classification.json，不存在时使用 AI 分析结果"""
+        data = self.read_document(project, CLASSIFICATION)
+        if data is not None:
+            return data
+        return self.load_analysis_results(project)
+
+    def update_classifications(self, project: str, changes: dict[str, dict]) -> int:
+        """
+        合并更新截图分类
+
+        Args:
+            changes: filename -> 要写入的字段
+
+        Returns:
+            更新的截图数
+        """
+        # 每个文件只读一次
+        ai_data = self.read_document(project, AI_ANALYSIS)
+        classifications = self.read_document(project, CLASSIFICATION)
+        if classifications is None:
+            classifications = ai_data.get("results", {}) if ai_data else {}
+
+        for filename, fields in changes.items():
+            classifications.setdefault(filename, {}).update(fields)
+
+        self._write_document(project, CLASSIFICATION, classifications)
+
+        # 如果有 ai_analysis.json，也更新它
+        if ai_data is not None:
+            ai_data["results"] = classifications
+            self._write_document(project, AI_ANALYSIS, ai_data)
+
+        return len(changes)
+
+    def load_onboarding_range(self, project: str) -> Optional[dict]:
+        """Onboarding 范围（未设置时为 None）"""
+        return self.read_document(project, ONBOARDING_RANGE)
+
+    def save_onboarding_range(self, project: str, data: dict):
+        """保存 Onboarding 范围（旧文件先备份到 backups/，只保留最近 10 个）"""
+        range_file = self.document_path(project, ONBOARDING_RANGE)
+        if range_file.exists():
+            backup_dir = range_file.parent / "backups"
+            backup_dir.mkdir(exist_ok=True)
+            shutil.copy(
+                range_file,
+                backup_dir / f"onboarding_range_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            )
+            backups = sorted(
+                (f for f in os.listdir(backup_dir) if f.startswith("onboarding_range_")),
+                reverse=True,
+            )
+            for old_backup in backups[_RANGE_BACKUPS:]:
+                os.remove(backup_dir / old_backup)
+
+        self._write_document(project, ONBOARDING_RANGE, data)
+
+    def source_mtime(self, project: str, kind: str) -> Optional[int]:
+        """JSON 文件的 mtime_ns（不存在时为 None）"""
+        try:
+            return self.document_path(project, kind).stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def signature(self, project: str, kind: str) -> Optional[tuple]:
+        """文档签名（变化即需要重新加载），不存在时为 None"""
+        try:
+            st = self.document_path(project, kind).stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+
+class SqliteProjectStore:
+    """
+    SQLite 项目数据存储
+
+    dual_write=True 时为过渡模式：同时写入 JSON 文件，并以 JSON 文件 mtime 检测外部修改。
+    legacy_path 为早先存放项目文档的数据库：db_path 首次创建时从中复制已有文档。
+    """
+
+    def __init__(self, db_path: Path, dual_write: bool = False, legacy_path: Optional[Path] = None):
+        self.db_path = Path(db_path)
+        self.dual_write = dual_write
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self.json_store = JsonProjectStore()
+        self._db = None
+
+    @property
+    def backend(self) -> str:
+        return "dual" if self.dual_write else "sqlite"
+
+    @property
+    def db(self) -> DBManager:
+        if self._db is None:
+            created = not self.db_path.exists()
+            db = DBManager(str(self.db_path))
+            if created and self.legacy_path and self.legacy_path.exists():
+                copied = db.copy_project_documents_from(str(self.legacy_path))
+                if copied:
+                    print(f"[INFO] 从 {self.legacy_path} 复制了 {copied} 个项目文档到 {self.db_path}")
+            self._db = db
+        return self._db
+
+    # ==================== 导入与同步 ====================
+
+    def import_document(self, project: str, kind: str) -> bool:
+        """从 JSON 文件导入（整体替换），文件不存在时返回 False"""
+        mtime = self.json_store.source_mtime(project, kind)
+        data = self.json_store.read_document(project, kind)
+        if data is None:
+            return False
+        header, entries = _split_document(kind, data)
+        self.db.put_project_document(project, kind, header, entries, source_mtime_ns=mtime)
+        return True
+
+    def import_all(self, force: bool = False) -> dict[str, int]:
+        """
+        导入所有项目的 JSON 文件
+
+        Args:
+            force: 已导入的文档也重新导入
+
+        Returns:
+            {文档类型: 导入数量}
+        """
+        counts = {kind: 0 for kind in DOCUMENT_FILES}
+        for project in iter_project_names():
+            for kind in DOCUMENT_FILES:
+                if not force and self.db.get_project_document_info(project, kind) is not None:
+                    continue
+                if self.import_document(project, kind):
+                    counts[kind] += 1
+        return counts
+
+    def _sync(self, project: str, kind: str) -> Optional[dict]:
+        """
+        确保文档已导入，返回文档元信息（SQLite 和 JSON 都没有时为 None）
+
+        sqlite 模式只在文档缺失时导入；dual 模式下 JSON 文件 mtime 与同步时不同也会重新导入。
+        """
+        info = self.db.get_project_document_info(project, kind)
+        if info is not None and not self.dual_write:
+            return info
+
+        mtime = self.json_store.source_mtime(project, kind)
+        if mtime is None or (info is not None and info["source_mtime_ns"] == mtime):
+            return info
+
+        if self.import_document(project, kind):
+            return self.db.get_project_document_info(project, kind)
+        return info
+
+    def _mark_synced(self, project: str, *kinds: str):
+        """记录写入后 JSON 文件的 mtime（dual 模式下自己的写入不触发重新导入）"""
+        for kind in kinds:
+            self.db.set_project_source_mtime(project, kind, self.json_store.source_mtime(project, kind))
+
+    # ==================== 读写 ====================
+
+    def load_document(self, project: str, kind: str) -> Optional[dict]:
+        if self._sync(project, kind) is None:
+            return None
+        header = self.db.get_project_header(project, kind)
+        if kind == CLASSIFICATION:
+            return self.db.get_project_entries(project, kind)
+        if kind == AI_ANALYSIS:
+            return {**(header or {}), "results": self.db.get_project_entries(project, kind)}
+        return header
+
+    def load_analysis_results(self, project: str) -> dict:
+        if self._sync(project, AI_ANALYSIS) is None:
+            return {}
+        return self.db.get_project_entries(project, AI_ANALYSIS)
+
+    def load_classifications(self, project: str) -> dict:
+        if self._sync(project, CLASSIFICATION) is not None:
+            return self.db.get_project_entries(project, CLASSIFICATION)
+        return self.load_analysis_results(project)
+
+    def update_classifications(self, project: str, changes: dict[str, dict]) -> int:
+        has_classification = self._sync(project, CLASSIFICATION) is not None
+        has_analysis = self._sync(project, AI_ANALYSIS) is not None
+
+        if self.dual_write:
+            self.json_store.update_classifications(project, changes)
+
+        with self.db.get_connection():
+            # 首次调整时以 AI 分析结果为基础（与 JSON 后端创建 classification.json 一致）
+            if not has_classification and has_analysis:
+                self.db.copy_project_document(project, AI_ANALYSIS, CLASSIFICATION)
+
+            current = self.db.get_project_entries(project, CLASSIFICATION, list(changes))
+            merged = {
+                filename: {**current.get(filename, {}), **fields}
+                for filename, fields in changes.items()
+            }
+            self.db.upsert_project_entries(project, CLASSIFICATION, merged)
+            if has_analysis:
+                self.db.upsert_project_entries(project, AI_ANALYSIS, merged)
+
+            self._mark_synced(project, CLASSIFICATION, AI_ANALYSIS)
+
+        return len(changes)
+
+    def load_onboarding_range(self, project: str) -> Optional[dict]:
+        if self._sync(project, ONBOARDING_RANGE) is None:
+            return None
+        return self.db.get_project_header(project, ONBOARDING_RANGE)
+
+    def save_onboarding_range(self, project: str, data: dict):
+        if self.dual_write:
+            self.json_store.save_onboarding_range(project, data)
+        with self.db.get_connection():
+            self.db.put_project_document(project, ONBOARDING_RANGE, data)
+            self._mark_synced(project, ONBOARDING_RANGE)
+
+    def signature(self, project: str, kind: str) -> Optional[tuple]:
+        info = self._sync(project, kind)
+        return (info["revision"],) if info else None
+
+
+def create_project_store(backend: Optional[str] = None):
+    """按配置创建存储后端（json / dual / sqlite）"""
+    backend = backend or settings.storage_backend
+    if backend == "json":
+        return JsonProjectStore()
+    if backend in ("dual", "sqlite"):
+        return SqliteProjectStore(
+            settings.project_store_path,
+            dual_write=backend == "dual",
+            legacy_path=settings.database_path,
+        )
+    raise ValueError(f"未知的存储后端: {backend}（可选 json / dual / sqlite）")
+
+
+# 全局存储实例
+project_store = create_project_store()
@@ -0,0 +1,74 @@
+"""
+截图全文搜索
+- 数据来自 data/csv_data/migrate.py 导入的 SQLite 数据库（DBManager 的 FTS5 索引）
+- 跨产品搜索命名、核心功能、产品洞察、标签、设计亮点，按 BM25 排序
+- 命中结果补充截图和缩略图 URL
+"""
+from pathlib import Path
+from typing import Optional, Union
+
+from app.config import settings
+from data.csv_data.db_manager import DBManager
+
+
+class ScreenshotSearch:
+    """截图搜索（数据库不存在时返回空结果，不创建数据库）"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self._db: Optional[DBManager] = None
+
+    @property
+    def available(self) -> bool:
+        return self.db_path.exists()
+
+    def _get_db(self) -> Optional[DBManager]:
+        if self._db is None and self.available:
+            self._db = DBManager(str(self.db_path))
+        return self._db
+
+    def search(
+        self,
+        query: str,
+        stage: Optional[str] = None,
+        module: Optional[str] = None,
+        screen_type: Optional[str] = None,
+        product: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> dict:
+        """
+        搜索截图
+
+        Returns:
+            {"hits": [...], "total", "limit", "offset", "has_more"}
+        """
+        db = self._get_db()
+        if db is None:
+            result = {"hits": [], "total": 0}
+        else:
+            result = db.search_screenshots(
+                query,
+                stage=stage,
+                module=module,
+                screen_type=screen_type,
+                product=product,
+                limit=limit,
+                offset=offset,
+            )
+
+        for hit in result["hits"]:
+            project = hit["folder_name"] or hit["product_name"]
+            hit["url"] = f"/api/screenshots/{project}/{hit['filename']}"
+            hit["thumb_url"] = f"/api/thumbnails/{project}/{hit['filename']}"
+
+        return {
+            **result,
+            "limit": limit,
+            "offset": offset,
+            "has_more": offset + len(result["hits"]) < result["total"],
+        }
+
+
+# 全局搜索实例
+screenshot_search = ScreenshotSearch(settings.database_path)
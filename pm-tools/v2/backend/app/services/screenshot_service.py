@@ -2,62 +2,155 @@
 截图服务 - 业务逻辑
 """
 import json
+import hashlib
+import threading
 from pathlib import Path
 from typing import Optional
 from collections import Counter
 
-from app.config import settings
 from app.models.screenshot import Screenshot, Classification
 from app.services.project_service import get_project_path
+from app.services.image_listing import list_images, list_project_images
+from app.services.project_store import AI_ANALYSIS, project_store
 
 
-def get_project_screenshots(project_name: str) -> list[Screenshot]:
-    """获取项目的所有截图"""
+class ScreenshotManifest:
+    """
+    项目截图清单（缓存单元）
+    
+    包含截图列表、分类统计以及按 Stage/Module 的倒排索引，
+    过滤请求直接在内存中完成。
+    """
+    
+    def __init__(self, project: str, signature: tuple, screenshots: list[Screenshot]):
+        self.project = project
+        self.signature = signature
+        self.screenshots = screenshots
+        self.stages, self.modules = get_classification_stats(screenshots)
+        
+        # Stage/Module -> 截图在列表中的位置
+        self.by_stage: dict[str, list[int]] = {}
+        self.by_module: dict[str, list[int]] = {}
+        for pos, s in enumerate(screenshots):
+            if s.classification:
+                if s.classification.stage:
+                    self.by_stage.setdefault(s.classification.stage, []).append(pos)
+                if s.classification.module:
+                    self.by_module.setdefault(s.classification.module, []).append(pos)
+        
+        self.version = hashlib.sha1(f"{project}|{signature}".encode("utf-8")).hexdigest()[:16]
+    
+    def filter(self, stage: Optional[str] = None, module: Optional[str] = None) -> list[Screenshot]:
+        """按 Stage/Module 过滤（保持原始顺序）"""
+        if not stage and not module:
+            return list(self.screenshots)
+        
+        positions: Optional[set[int]] = None
+        if stage:
+            positions = set(self.by_stage.get(stage, ()))
+        if module:
+            module_positions = set(self.by_module.get(module, ()))
+            positions = module_positions if positions is None else positions & module_positions
+        
+        return [self.screenshots[pos] for pos in sorted(positions)]
+
+
+# 项目名 -> 清单
+_manifest_cache: dict[str, ScreenshotManifest] = {}
+_manifest_lock = threading.Lock()
+
+
+def _stat_signature(path: Path) -> Optional[tuple[int, int]]:
+    """文件/目录的 (mtime_ns, size)，不存在时为 None"""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _resolve_screens_path(project_name: str, project_path: Path) -> Path:
+    """确定截图目录"""
+    if project_name.startswith("downloads_2024/"):
+        return project_path
+    return project_path / "Screens"
+
+
+def _manifest_signature(project_name: str, project_path: Path, screens_path: Path) -> tuple:
+    """清单签名：截图目录、screenshots 子目录、AI 分析结果（project_store 签名）以及 descriptions.json"""
+    return (
+        _stat_signature(screens_path),
+        _stat_signature(screens_path / "screenshots"),
+        project_store.signature(project_name, AI_ANALYSIS),
+        _stat_signature(project_path / "descriptions.json"),
+    )
+
+
+def get_project_manifest(project_name: str) -> Optional[ScreenshotManifest]:
+    """
+    获取项目截图清单（带缓存）
+    
+    每次调用只做几次 stat 校验签名，图片目录或 JSON 文件变化后才重新构建。
+    项目或截图目录不存在时返回 None。
+    """
     project_path = get_project_path(project_name)
+    screens_path = _resolve_screens_path(project_name, project_path)
     
-    if not project_path.exists():
-        return []
+    signature = _manifest_signature(project_name, project_path, screens_path)
+    if signature[0] is None:
+        _manifest_cache.pop(project_name, None)
+        return None
     
-    # 确定截图目录
+    cached = _manifest_cache.get(project_name)
+    if cached and cached.signature == signature:
+        return cached
+    
+    manifest = ScreenshotManifest(
+        project_name,
+        signature,
+        _build_screenshots(project_name, project_path, screens_path),
+    )
+    with _manifest_lock:
+        _manifest_cache[project_name] = manifest
+    return manifest
+
+
+def invalidate_manifest(project_name: Optional[str] = None):
+    """丢弃缓存的清单（不传参数时清空全部）"""
+    with _manifest_lock:
+        if project_name is None:
+            _manifest_cache.clear()
+        else:
+            _manifest_cache.pop(project_name, None)
+
+
+def get_project_screenshots(project_name: str) -> list[Screenshot]:
+    """获取项目的所有截图"""
+    manifest = get_project_manifest(project_name)
+    return list(manifest.screenshots) if manifest else []
+
+
+def _build_screenshots(project_name: str, project_path: Path, screens_path: Path) -> list[Screenshot]:
+    """从磁盘构建截图列表"""
     is_downloads = project_name.startswith("downloads_2024/")
-    if is_downloads:
-        screens_path = project_path
-    else:
-        screens_path = project_path / "Screens"
-    
-    if not screens_path.exists():
-        return []
     
     # 加载分类数据
-    classifications = _load_classifications(project_path)
+    classifications = _load_classifications(project_name)
     
     # 加载描述数据
     descriptions = _load_descriptions(project_path)
     
-    # 获取截图列表（支持多种格式和 screenshots 子目录）
-    image_files = []
-    extensions = ["*.png", "*.jpg", "*.jpeg", "*.webp"]
-    
-    # 根目录截图
-    for ext in extensions:
-        image_files.extend(screens_path.glob(ext))
-    
-    # screenshots 子目录截图（仅对 downloads_2024）
+    # 获取截图列表（支持多种格式，downloads_2024 额外包含 screenshots 子目录，已排序）
     if is_downloads:
-        screenshots_subdir = screens_path / "screenshots"
-        if screenshots_subdir.exists():
-            for ext in extensions:
-                image_files.extend(screenshots_subdir.glob(ext))
-    
-    # 排序
-    image_files = sorted(image_files, key=lambda x: x.name)
+        image_files = list_project_images(screens_path)
+    else:
+        image_files = list_images(screens_path)
     
     screenshots: list[Screenshot] = []
-    for idx, file_path in enumerate(image_files):
-        filename = file_path.name
-        # 标记来自 screenshots 子目录的文件
-        is_subdir = "screenshots" in str(file_path.parent)
-        actual_filename = f"screenshots/{filename}" if is_subdir else filename
+    for idx, entry in enumerate(image_files):
+        # 来自 screenshots 子目录的文件带有 "screenshots/" 前缀
+        actual_filename = entry.name
+        filename = Path(actual_filename).name
         
         # 获取分类
         classification = None
@@ -101,19 +194,12 @@ def get_classification_stats(screenshots: list[Screenshot]) -> tuple[dict, dict]
     return dict(stages), dict(modules)
 
 
-def _load_classifications(project_path: Path) -> dict:
-    """加载分类数据"""
-    ai_file = project_path / "ai_analysis.json"
-    
-    if ai_file.exists():
-        try:
-            with open(ai_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return data.get("results", {})
-        except:
-            pass
-    
-    return {}
+def _load_classifications(project_name: str) -> dict:
+    """加载分类数据（AI 分析结果）"""
+    try:
+        return project_store.load_analysis_results(project_name)
+    except:
+        return {}
 
 
 def _load_descriptions(project_path: Path) -> dict:
@@ -145,51 +231,3 @@ def get_screenshot_path(project_name: str, filename: str) -> Optional[Path]:
         return file_path
     
     return None
-
-
-def get_thumbnail_path(project_name: str, filename: str, size: str = "small") -> Optional[Path]:
-    """获取缩略图路径，如果不存在则生成"""
-    project_path = get_project_path(project_name)
-    
-    is_downloads = project_name.startswith("downloads_2024/")
-    if is_downloads:
-        # 支持 screenshots 子目录
-        src_path = project_path / filename
-        # 缩略图统一放在 thumbs_xxx 目录，使用扁平化文件名
-        thumb_dir = project_path / f"thumbs_{size}"
-        # 将路径中的 / 替换为 _ 以避免子目录问题
-        thumb_filename = filename.replace("/", "_").replace("\\", "_")
-        # 缩略图统一用 png 格式
-        thumb_filename = Path(thumb_filename).stem + ".png"
-    else:
-        src_path = project_path / "Screens" / filename
-        thumb_dir = project_path / f"Screens_thumbs_{size}"
-        thumb_filename = Path(filename).stem + ".png"
-    
-    if not src_path.exists():
-        return None
-    
-    # 确保缩略图目录存在
-    thumb_dir.mkdir(exist_ok=True)
-    
-    thumb_path = thumb_dir / thumb_filename
-    
-    # 如果缩略图不存在或源文件更新，重新生成
-    if not thumb_path.exists() or src_path.stat().st_mtime > thumb_path.stat().st_mtime:
-        _generate_thumbnail(src_path, thumb_path, settings.thumb_sizes.get(size, 120))
-    
-    return thumb_path if thumb_path.exists() else None
-
-
-def _generate_thumbnail(src_path: Path, thumb_path: Path, width: int):
-    """生成缩略图"""
-    try:
-        from PIL import Image
-        
-        with Image.open(src_path) as img:
-            ratio = width / img.width
-            new_height = int(img.height * ratio)
-            thumb = img.resize((width, new_height), Image.Resampling.LANCZOS)
-            thumb.save(thumb_path, "PNG", optimize=True)
-    except Exception as e:
-        print(f"[ERROR] 生成缩略图失败: {e}")
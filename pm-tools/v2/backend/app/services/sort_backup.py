@@ -0,0 +1,210 @@
+"""
+应用排序的备份（重命名清单）
+- apply-sort-order 只重命名文件、不改内容，备份不再 copytree 整个截图目录：
+  只记录每个文件的 原路径 -> 新文件名 以及指纹（size + mtime_ns + sha256，重命名不会改变它们），
+  不再产生 {项目}_backup_{时间戳} 副本目录
+- 撤销时先比较 size + mtime_ns，一致的文件再计算 sha256 比对内容
+  （同大小且保留时间戳的替换也能发现）；settings.sort_backup_hash=False 时只比较 size + mtime_ns
+- 清单在重命名之前写入（status=pending），完成后标记为 applied：中途失败也能按清单撤销
+- 撤销：校验指纹后两阶段重命名回原路径（包括 screenshots/ 子目录）
+- 清单保存在 {项目}/backups/sort_apply_{时间戳}.json，保留最近 settings.sort_backup_keep 个
+"""
+import os
+import json
+import hashlib
+import shutil
+from datetime import datetime
+from typing import Optional
+
+from app.config import settings
+from app.services.atomic_file import write_json_atomic
+
+
+MANIFEST_PREFIX = "sort_apply_"
+
+
+class SortUndoConflict(Exception):
+    """截图目录已与清单不一致，无法精确撤销"""
+
+    def __init__(self, conflicts: list[str]):
+        super().__init__(f"{len(conflicts)} 个文件与备份清单不一致")
+        self.conflicts = conflicts
+
+
+def _sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _fingerprint(path: str) -> dict:
+    st = os.stat(path)
+    fingerprint = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if settings.sort_backup_hash:
+        fingerprint["sha256"] = _sha256(path)
+    return fingerprint
+
+
+def _matches(path: str, entry: dict) -> bool:
+    """文件指纹与清单一致"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]:
+        return False
+    # size + mtime 一致后才读取内容计算哈希
+    if "sha256" in entry:
+        return _sha256(path) == entry["sha256"]
+    return True
+
+
+def _abs(screens_dir: str, relative: str) -> str:
+    return os.path.join(screens_dir, relative.replace("\\", "/").replace("/", os.sep))
+
+
+def plan_renames(screens_dir: str, order: list) -> list[dict]:
+    """
+    生成重命名清单
+
+    Args:
+        order: 带 original_file / new_index 的排序项（new_index 已连续）
+
+    Returns:
+        [{"from", "temp", "to", "size", "mtime_ns"[, "sha256"]}]，源文件不存在的项跳过
+    """
+    entries = []
+    for item in order:
+        old_name = item.original_file.replace("\\", "/")
+        old_path = _abs(screens_dir, old_name)
+        if not os.path.exists(old_path):
+            continue
+        basename = os.path.basename(old_name)
+        entries.append({
+            "from": old_name,
+            "temp": f"_temp_{item.new_index:04d}_{basename}",
+            "to": f"{item.new_index:04d}{os.path.splitext(basename)[1]}",
+            **_fingerprint(old_path),
+        })
+    return entries
+
+
+def _backup_dir(project_path: str) -> str:
+    return os.path.join(project_path, "backups")
+
+
+def _manifest_path(project_path: str, backup_id: str) -> str:
+    return os.path.join(_backup_dir(project_path), f"{MANIFEST_PREFIX}{backup_id}.json")
+
+
+def create_manifest(project_path: str, project: str, entries: list[dict]) -> str:
+    """写入清单（status=pending），返回备份 ID"""
+    backup_dir = _backup_dir(project_path)
+    os.makedirs(backup_dir, exist_ok=True)
+    backup_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    write_json_atomic(_manifest_path(project_path, backup_id), {
+        "id": backup_id,
+        "project": project,
+        "created_at": datetime.now().isoformat(),
+        "status": "pending",
+        "entries": entries,
+    })
+
+    # 只保留最近的清单
+    manifests = sorted(
+        (f for f in os.listdir(backup_dir) if f.startswith(MANIFEST_PREFIX) and f.endswith(".json")),
+        reverse=True,
+    )
+    for old in manifests[settings.sort_backup_keep:]:
+        os.remove(os.path.join(backup_dir, old))
+    return backup_id
+
+
+def load_manifest(project_path: str, backup_id: str) -> Optional[dict]:
+    path = _manifest_path(project_path, backup_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def update_manifest(project_path: str, manifest: dict, status: str):
+    manifest["status"] = status
+    manifest[f"{status}_at"] = datetime.now().isoformat()
+    write_json_atomic(_manifest_path(project_path, manifest["id"]), manifest)
+
+
+def list_manifests(project_path: str) -> list[dict]:
+    """备份列表（最新的在前，不含条目明细）"""
+    backup_dir = _backup_dir(project_path)
+    if not os.path.isdir(backup_dir):
+        return []
+    result = []
+    for name in sorted(os.listdir(backup_dir), reverse=True):
+        if not (name.startswith(MANIFEST_PREFIX) and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(backup_dir, name), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        entries = manifest.pop("entries", [])
+        result.append({**manifest, "count": len(entries)})
+    return result
+
+
+def latest_undoable(project_path: str) -> Optional[dict]:
+    """最近一次未撤销的清单（包括中途失败的 pending）"""
+    for summary in list_manifests(project_path):
+        if summary["status"] in ("applied", "pending"):
+            return load_manifest(project_path, summary["id"])
+    return None
+
+
+def undo_renames(screens_dir: str, manifest: dict) -> int:
+    """
+    按清单撤销重命名
+
+    每个文件可能在 to（已完成）、temp（中途失败）或 from（尚未移动）位置；
+    指纹不一致或原路径被其他文件占用时抛出 SortUndoConflict，不做任何改动。
+
+    Returns:
+        移回原路径的文件数
+    """
+    moves = []          # (当前路径, 原路径)
+    conflicts = []
+    for entry in manifest["entries"]:
+        source = _abs(screens_dir, entry["from"])
+        current = next(
+            (path for path in (_abs(screens_dir, entry["to"]), _abs(screens_dir, entry["temp"]))
+             if _matches(path, entry)),
+            None,
+        )
+        if current is None:
+            if not _matches(source, entry):
+                conflicts.append(entry["from"])
+            continue
+        moves.append((current, source))
+
+    # 原路径不能被清单以外的文件占用
+    vacated = {current for current, _ in moves}
+    for _, source in moves:
+        if os.path.exists(source) and source not in vacated:
+            conflicts.append(os.path.relpath(source, screens_dir))
+
+    if conflicts:
+        raise SortUndoConflict(conflicts)
+
+    # 两阶段重命名，避免互相覆盖
+    staged = []
+    for i, (current, source) in enumerate(moves):
+        temp_path = os.path.join(screens_dir, f"_undo_{i:04d}_{os.path.basename(source)}")
+        shutil.move(current, temp_path)
+        staged.append((temp_path, source))
+    for temp_path, source in staged:
+        os.makedirs(os.path.dirname(source), exist_ok=True)
+        shutil.move(temp_path, source)
+
+    return len(staged)
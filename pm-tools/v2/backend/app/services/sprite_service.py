@@ -0,0 +1,270 @@
+"""
+精灵图服务 - 网格视图一次请求拿到一页缩略图
+- 一页缩略图拼成一张图片，附带每张截图的坐标（offset map）
+- 缓存于 data/cache/sprites，按项目清单版本（manifest.version）命名，
+  截图目录或分类变化后自动换新文件；旧版本文件在后台延迟清理，
+  最近 settings.sprite_stale_grace 秒内仍被请求过的版本保留（避免删掉正要发送的文件）
+- 在缩略图进程池中拼图，不阻塞事件循环
+"""
+import os
+import json
+import hashlib
+import time
+import asyncio
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+from app.services.project_service import get_project_path
+from app.services.screenshot_service import get_project_manifest
+from app.services.thumbnail_service import THUMB_FORMATS, get_executor, resize_to_width
+
+
+# WebP 单边最大像素
+_WEBP_MAX_DIMENSION = 16383
+
+# 正在生成的精灵图（文件 key -> Future）
+_inflight: dict[str, asyncio.Future] = {}
+
+# 各缓存目录中每个清单版本最近一次被请求的时间（monotonic）
+_last_requested: dict[Path, dict[str, float]] = {}
+
+# 已排定清理的缓存目录 -> 当前版本
+_cleanup_pending: dict[Path, str] = {}
+
+
+def _project_cache_dir(project_name: str) -> Path:
+    """项目的精灵图缓存目录（项目名中的 / 替换为 __）"""
+    return settings.cache_dir / "sprites" / project_name.replace("/", "__")
+
+
+def _source_path(project_name: str, filename: str) -> Path:
+    """截图原图路径"""
+    project_path = get_project_path(project_name)
+    if project_name.startswith("downloads_2024/"):
+        return project_path / filename
+    return project_path / "Screens" / filename
+
+
+def _sheet_key(
+    version: str,
+    size: str,
+    fmt: str,
+    page: int,
+    page_size: int,
+    stage: Optional[str],
+    module: Optional[str],
+) -> str:
+    """精灵图文件名（不含扩展名），清单版本作为前缀"""
+    filters = hashlib.sha1(f"{stage or ''}|{module or ''}".encode("utf-8")).hexdigest()[:8]
+    return f"{version}_{size}_{fmt}_{page_size}_{page}_{filters}"
+
+
+def render_sprite(
+    sources: list[str],
+    sheet_path: str,
+    width: int,
+    columns: int,
+    fmt: str,
+    quality: int,
+) -> Optional[dict]:
+    """
+    拼接精灵图（在工作进程中执行）
+
+    每张截图缩放到固定宽度，按行排列，行高取该行最高的图。
+    返回 {"width", "height", "format", "tiles": [[x, y, w, h] | None, ...]}，
+    读取失败的截图对应 None。
+    """
+    try:
+        from PIL import Image
+
+        tiles: list[Optional[Image.Image]] = []
+        for src in sources:
+            try:
+                with Image.open(src) as img:
+                    tile = resize_to_width(img, width)
+                tiles.append(tile.convert("RGBA") if tile.mode != "RGBA" else tile)
+            except Exception as e:
+                print(f"[WARN] 精灵图跳过截图: {src}: {e}")
+                tiles.append(None)
+
+        # 计算布局
+        boxes: list[Optional[list[int]]] = []
+        y = 0
+        for row_start in range(0, len(tiles), columns):
+            row = tiles[row_start:row_start + columns]
+            row_height = max((t.height for t in row if t is not None), default=0)
+            for col, tile in enumerate(row):
+                boxes.append([col * width, y, width, tile.height] if tile is not None else None)
+            y += row_height
+
+        sheet_width = width * min(columns, max(1, len(tiles)))
+        sheet_height = max(1, y)
+
+        # WebP 尺寸受限，超出时回退 PNG
+        if fmt == "webp" and max(sheet_width, sheet_height) > _WEBP_MAX_DIMENSION:
+            fmt = "png"
+            sheet_path = os.path.splitext(sheet_path)[0] + THUMB_FORMATS["png"][1]
+
+        sheet = Image.new("RGBA", (sheet_width, sheet_height), (0, 0, 0, 0))
+        for tile, box in zip(tiles, boxes):
+            if tile is not None:
+                sheet.paste(tile, (box[0], box[1]))
+
+        os.makedirs(os.path.dirname(sheet_path), exist_ok=True)
+        tmp_path = f"{sheet_path}.{os.getpid()}.tmp"
+        pil_format = THUMB_FORMATS[fmt][0]
+        if pil_format == "WEBP":
+            sheet.save(tmp_path, pil_format, quality=quality, method=4)
+        else:
+            sheet.save(tmp_path, pil_format, optimize=True)
+        os.replace(tmp_path, sheet_path)
+
+        return {
+            "width": sheet_width,
+            "height": sheet_height,
+            "format": fmt,
+            "file": os.path.basename(sheet_path),
+            "tiles": boxes,
+        }
+    except Exception as e:
+        print(f"[ERROR] 生成精灵图失败: {sheet_path}: {e}")
+        return None
+
+
+def _remove_stale(cache_dir: Path, keep: set[str]):
+    """删除版本不在 keep 中的精灵图（在线程池中运行）"""
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.split("_", 1)[0] not in keep:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+    except OSError:
+        pass
+
+
+def _schedule_cleanup(cache_dir: Path, version: str):
+    """grace 秒后在后台清理旧版本，不在请求路径上删除文件"""
+    first = cache_dir not in _cleanup_pending
+    _cleanup_pending[cache_dir] = version
+    if not first:
+        return
+
+    loop = asyncio.get_running_loop()
+    grace = settings.sprite_stale_grace
+
+    def run():
+        current = _cleanup_pending.pop(cache_dir, version)
+        now = time.monotonic()
+        seen = _last_requested.get(cache_dir, {})
+        keep = {v for v, t in seen.items() if now - t < grace} | {current}
+        for v in list(seen):
+            if v not in keep:
+                del seen[v]
+        loop.run_in_executor(None, _remove_stale, cache_dir, keep)
+
+    loop.call_later(grace, run)
+
+
+async def _build_sheet(cache_dir: Path, key: str, version: str, sources: list[str], width: int, fmt: str) -> Optional[dict]:
+    """生成精灵图及其坐标文件（同一 key 的并发请求合并）"""
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    _schedule_cleanup(cache_dir, version)
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        get_executor(),
+        render_sprite,
+        sources,
+        str(cache_dir / f"{key}{THUMB_FORMATS[fmt][1]}"),
+        width,
+        settings.sprite_columns,
+        fmt,
+        settings.thumb_quality,
+    )
+    _inflight[key] = future
+    try:
+        layout = await future
+        if layout:
+            (cache_dir / f"{key}.json").write_text(json.dumps(layout), encoding="utf-8")
+        return layout
+    finally:
+        _inflight.pop(key, None)
+
+
+async def get_sprite_sheet(
+    project_name: str,
+    size: str = "small",
+    fmt: str = "png",
+    page: int = 0,
+    page_size: Optional[int] = None,
+    stage: Optional[str] = None,
+    module: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    获取一页精灵图（不存在时生成）
+
+    Returns:
+        {"project", "version", "size", "format", "page", "page_size", "pages", "total",
+         "width", "height", "path", "tiles": [{"filename", "x", "y", "width", "height"}]}
+        项目不存在时返回 None
+    """
+    manifest = get_project_manifest(project_name)
+    width = settings.thumb_sizes.get(size)
+    if not manifest or width is None:
+        return None
+
+    page_size = page_size or settings.sprite_page_size
+    screenshots = manifest.filter(stage=stage, module=module)
+    total = len(screenshots)
+    pages = max(1, (total + page_size - 1) // page_size)
+    page_items = screenshots[page * page_size:(page + 1) * page_size]
+
+    cache_dir = _project_cache_dir(project_name)
+    _last_requested.setdefault(cache_dir, {})[manifest.version] = time.monotonic()
+    key = _sheet_key(manifest.version, size, fmt, page, page_size, stage, module)
+
+    layout = None
+    layout_file = cache_dir / f"{key}.json"
+    if layout_file.exists():
+        try:
+            layout = json.loads(layout_file.read_text(encoding="utf-8"))
+            if not (cache_dir / layout["file"]).exists():
+                layout = None
+        except (OSError, ValueError, KeyError):
+            layout = None
+
+    if layout is None and page_items:
+        sources = [str(_source_path(project_name, s.filename)) for s in page_items]
+        layout = await _build_sheet(cache_dir, key, manifest.version, sources, width, fmt)
+        if layout is None:
+            return None
+
+    tiles = []
+    if layout:
+        for s, box in zip(page_items, layout["tiles"]):
+            if box is None:
+                continue
+            x, y, w, h = box
+            tiles.append({"filename": s.filename, "x": x, "y": y, "width": w, "height": h})
+
+    return {
+        "project": project_name,
+        "version": manifest.version,
+        "size": size,
+        "format": layout["format"] if layout else fmt,
+        "page": page,
+        "page_size": page_size,
+        "pages": pages,
+        "total": total,
+        "width": layout["width"] if layout else 0,
+        "height": layout["height"] if layout else 0,
+        "path": cache_dir / layout["file"] if layout else None,
+        "tiles": tiles,
+    }
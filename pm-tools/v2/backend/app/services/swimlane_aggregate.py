@@ -0,0 +1,236 @@
+"""
+泳道分析跨 App 聚合缓存
+- 启动时读取 data/analysis/swimlane/*.json 一次，按文件记录每个 App 的贡献
+- 之后按 (mtime_ns, size) 增量刷新：只重新解析变化的文件，
+  从汇总中减去旧贡献、加上新贡献
+- /analysis/compare* 等接口直接读取内存中的汇总，不访问磁盘
+- 刷新在私有的累加器上进行，完成后连同 ETag 一起发布为不可变快照；
+  读取方始终拿到同一版本的列表、汇总和 ETag
+- 派生结果（如推荐序列）按版本缓存，数据不变时不重复计算
+"""
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional
+
+from app.config import settings
+
+
+class AppContribution(NamedTuple):
+    """单个 App 分析文件的贡献"""
+    app_id: str
+    app: str                            # 显示名
+    declared_total: int                 # 文件中的 total_screens
+    phases: list
+    patterns: list
+    screens: list
+    by_type: dict                       # summary.by_type 原样保留
+    type_counts: Counter                # 类型 -> 数量
+
+
+def _load_contribution(path: Path) -> AppContribution:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    app_id = path.stem
+    by_type = data.get("summary", {}).get("by_type", {})
+    return AppContribution(
+        app_id=app_id,
+        app=data.get("app", app_id),
+        declared_total=data.get("total_screens", 0),
+        phases=data.get("phases", []),
+        patterns=data.get("patterns", []),
+        screens=data.get("screens", []),
+        by_type=by_type,
+        type_counts=Counter({code: info.get("count", 0) for code, info in by_type.items()}),
+    )
+
+
+class AggregateSnapshot(NamedTuple):
+    """某一版本的聚合结果（发布后不再修改）"""
+    etag: str
+    apps: list                          # list[AppContribution]，按 App ID 排序
+    type_counts: Counter                # 所有 App 的类型数量汇总
+    total_screens: int
+
+
+_EMPTY_SNAPSHOT = AggregateSnapshot('"swimlane-empty"', [], Counter(), 0)
+
+
+class SwimlaneAggregate:
+    """
+    泳道分析聚合
+
+    刷新只修改私有累加器，读取方拿到的是整体替换的快照，无需加锁。
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._entries: dict[str, tuple[tuple[int, int], AppContribution]] = {}
+        self._failed: dict[str, tuple[int, int]] = {}   # 解析失败的文件，mtime 变化前不再重试
+        # 刷新用的累加器（只在持锁时访问，不对外暴露）
+        self._type_counts: Counter = Counter()
+        self._total_screens = 0
+        self._snapshot = _EMPTY_SNAPSHOT
+        self._memo: dict[str, tuple[str, Any]] = {}
+        self._built = False
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def _ensure_built(self):
+        if not self._built:
+            self.refresh()
+
+    @property
+    def exists(self) -> bool:
+        self._ensure_built()
+        return self.directory.is_dir()
+
+    def snapshot(self) -> AggregateSnapshot:
+        """当前版本的聚合结果（同一请求内应只取一次，避免跨版本混用）"""
+        self._ensure_built()
+        return self._snapshot
+
+    @property
+    def etag(self) -> str:
+        """由所有文件的 (文件名, mtime, size) 生成，重启后内容不变则 ETag 不变"""
+        return self.snapshot().etag
+
+    @property
+    def apps(self) -> list[AppContribution]:
+        """所有 App 的贡献（按 App ID 排序）"""
+        return self.snapshot().apps
+
+    @property
+    def type_counts(self) -> Counter:
+        """所有 App 的类型数量汇总"""
+        return self.snapshot().type_counts
+
+    @property
+    def total_screens(self) -> int:
+        return self.snapshot().total_screens
+
+    def memo(self, key: str, builder: Callable[[AggregateSnapshot], Any], snapshot: Optional[AggregateSnapshot] = None) -> Any:
+        """按快照版本缓存派生结果（builder 只应读取传入的快照）"""
+        snapshot = snapshot or self.snapshot()
+        cached = self._memo.get(key)
+        if cached and cached[0] == snapshot.etag:
+            return cached[1]
+        value = builder(snapshot)
+        self._memo[key] = (snapshot.etag, value)
+        return value
+
+    # ------------------------------------------------------------------
+    # 刷新
+    # ------------------------------------------------------------------
+
+    def refresh(self) -> int:
+        """
+        mtime 扫描，重新解析发生变化的文件
+
+        Returns:
+            变化（新增/删除/更新）的文件数量
+        """
+        with self._lock:
+            stats: dict[str, tuple[int, int]] = {}
+            try:
+                with os.scandir(self.directory) as it:
+                    for entry in it:
+                        if entry.name.endswith(".json") and entry.is_file():
+                            st = entry.stat()
+                            stats[entry.name] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                pass
+
+            changed = 0
+            for name in set(self._entries) - set(stats):
+                self._subtract(self._entries.pop(name)[1])
+                changed += 1
+            for name in set(self._failed) - set(stats):
+                del self._failed[name]
+            for name, stat_key in stats.items():
+                changed += self._reload(name, stat_key)
+
+            if changed or not self._built:
+                self._publish()
+            self._built = True
+            return changed
+
+    def refresh_app(self, app_id: str):
+        """立即重新加载单个 App（写入分析文件后调用）"""
+        name = f"{app_id}.json"
+        with self._lock:
+            try:
+                st = (self.directory / name).stat()
+            except OSError:
+                self._failed.pop(name, None)
+                if name not in self._entries:
+                    return
+                self._subtract(self._entries.pop(name)[1])
+            else:
+                if not self._reload(name, (st.st_mtime_ns, st.st_size)):
+                    return
+            self._publish()
+
+    async def watch(self, interval: float):
+        """后台轮询 mtime，持续增量更新"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                print(f"[WARN] 泳道聚合刷新失败: {e}")
+
+    def _reload(self, name: str, stat_key: tuple[int, int]) -> int:
+        """文件变化时重新解析，返回是否有变化"""
+        cached = self._entries.get(name)
+        if cached and cached[0] == stat_key:
+            return 0
+        if self._failed.get(name) == stat_key:
+            return 0
+
+        try:
+            contribution = _load_contribution(self.directory / name)
+        except (json.JSONDecodeError, OSError, AttributeError, TypeError) as e:
+            print(f"[WARN] 跳过泳道分析文件 {name}: {e}")
+            # 解析失败（如正在写入）：移除旧贡献，下次 mtime 变化时再加载
+            self._failed[name] = stat_key
+            if cached:
+                self._subtract(self._entries.pop(name)[1])
+                return 1
+            return 0
+
+        self._failed.pop(name, None)
+        if cached:
+            self._subtract(cached[1])
+        self._entries[name] = (stat_key, contribution)
+        self._type_counts.update(contribution.type_counts)
+        self._total_screens += len(contribution.screens)
+        return 1
+
+    def _subtract(self, contribution: AppContribution):
+        self._type_counts.subtract(contribution.type_counts)
+        self._type_counts = +self._type_counts  # 去掉归零的类型
+        self._total_screens -= len(contribution.screens)
+
+    def _publish(self):
+        """由累加器生成新快照（列表、汇总和 ETag 一起整体替换）"""
+        apps = [c for _, c in sorted(self._entries.values(), key=lambda e: e[1].app_id)]
+        signature = "|".join(f"{name}:{key[0]}:{key[1]}" for name, (key, _) in sorted(self._entries.items()))
+        self._snapshot = AggregateSnapshot(
+            etag=f'"swimlane-{hashlib.sha1(signature.encode()).hexdigest()[:20]}"',
+            apps=apps,
+            type_counts=Counter(self._type_counts),
+            total_screens=self._total_screens,
+        )
+
+
+# 全局聚合实例
+swimlane_aggregate = SwimlaneAggregate(settings.data_dir / "analysis" / "swimlane")
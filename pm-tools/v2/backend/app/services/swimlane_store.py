@@ -0,0 +1,220 @@
+"""
+泳道分析索引存储（SQLite）
+- data/analysis/swimlane/{app_id}.json 仍是导入格式；文件 (mtime_ns, size) 变化时整体重新导入
+- 每张截图一行，按序号 / 类型 / 阶段建索引：单张查询、筛选、分页都不需要解析整个 JSON
+- 除 screens 外的顶层字段作为摘要（header）单独保存
+- 数据库可随时删除重建（data/cache/swimlane.sqlite3）
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+from app.config import settings
+
+
+class SwimlaneStore:
+    """泳道分析索引存储"""
+
+    def __init__(self, source_dir: Union[str, Path], db_path: Union[str, Path]):
+        self.source_dir = Path(source_dir)
+        self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS apps (
+                    app_id TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    screen_count INTEGER NOT NULL,
+                    header TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS screens (
+                    app_id TEXT NOT NULL,
+                    pos INTEGER NOT NULL,
+                    idx INTEGER,
+                    primary_type TEXT,
+                    phase TEXT,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (app_id, pos)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_screens_index ON screens (app_id, idx);
+                CREATE INDEX IF NOT EXISTS idx_screens_type ON screens (app_id, primary_type, pos);
+                CREATE INDEX IF NOT EXISTS idx_screens_phase ON screens (app_id, phase, pos);
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _query(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    # ------------------------------------------------------------------
+    # 导入
+    # ------------------------------------------------------------------
+
+    def sync(self, app_id: str) -> bool:
+        """
+        源 JSON 变化时重新导入
+
+        Returns:
+            App 是否存在（源文件被删除时同时删除索引）
+
+        Raises:
+            json.JSONDecodeError: 源文件不是合法 JSON
+        """
+        path = self.source_dir / f"{app_id}.json"
+        with self._lock:
+            conn = self._connect()
+            try:
+                st = path.stat()
+            except OSError:
+                with conn:
+                    conn.execute("DELETE FROM screens WHERE app_id = ?", (app_id,))
+                    conn.execute("DELETE FROM apps WHERE app_id = ?", (app_id,))
+                return False
+
+            row = conn.execute("SELECT mtime_ns, size FROM apps WHERE app_id = ?", (app_id,)).fetchone()
+            if row and row["mtime_ns"] == st.st_mtime_ns and row["size"] == st.st_size:
+                return True
+
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._import(conn, app_id, data, st)
+            return True
+
+    def sync_all(self) -> list[str]:
+        """同步目录下所有 App，返回 App ID 列表（无法解析的文件跳过）"""
+        app_ids = sorted(p.stem for p in self.source_dir.glob("*.json")) if self.source_dir.exists() else []
+        synced = []
+        for app_id in app_ids:
+            try:
+                self.sync(app_id)
+                synced.append(app_id)
+            except (json.JSONDecodeError, OSError, AttributeError):
+                continue
+
+        # 清理源文件已删除的 App
+        with self._lock:
+            conn = self._connect()
+            stale = [r["app_id"] for r in conn.execute("SELECT app_id FROM apps") if r["app_id"] not in synced]
+            with conn:
+                for app_id in stale:
+                    conn.execute("DELETE FROM screens WHERE app_id = ?", (app_id,))
+                    conn.execute("DELETE FROM apps WHERE app_id = ?", (app_id,))
+        return synced
+
+    def _import(self, conn: sqlite3.Connection, app_id: str, data: dict, st):
+        screens = data.get("screens", [])
+        header = {k: v for k, v in data.items() if k != "screens"}
+        with conn:
+            conn.execute("DELETE FROM screens WHERE app_id = ?", (app_id,))
+            conn.executemany(
+                "INSERT INTO screens (app_id, pos, idx, primary_type, phase, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        app_id,
+                        pos,
+                        screen.get("index"),
+                        screen.get("primary_type"),
+                        screen.get("phase"),
+                        json.dumps(screen, ensure_ascii=False),
+                    )
+                    for pos, screen in enumerate(screens)
+                ),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO apps (app_id, mtime_ns, size, screen_count, header) VALUES (?, ?, ?, ?, ?)",
+                (app_id, st.st_mtime_ns, st.st_size, len(screens), json.dumps(header, ensure_ascii=False)),
+            )
+
+    # ------------------------------------------------------------------
+    # 查询（调用前先 sync）
+    # ------------------------------------------------------------------
+
+    def get_header(self, app_id: str) -> Optional[dict]:
+        """除 screens 外的顶层字段"""
+        rows = self._query("SELECT header FROM apps WHERE app_id = ?", (app_id,))
+        return json.loads(rows[0]["header"]) if rows else None
+
+    def get_screen(self, app_id: str, index: int) -> Optional[dict]:
+        """按截图序号（screen.index）查询，重复时取第一个"""
+        rows = self._query(
+            "SELECT data FROM screens WHERE app_id = ? AND idx = ? ORDER BY pos LIMIT 1",
+            (app_id, index),
+        )
+        return json.loads(rows[0]["data"]) if rows else None
+
+    def list_screens(
+        self,
+        app_id: str,
+        start: int = 0,
+        limit: int = 100,
+        primary_type: Optional[str] = None,
+        phase: Optional[str] = None,
+        cursor: Optional[int] = None,
+    ) -> dict:
+        """
+        分页查询截图
+
+        Args:
+            start: 偏移量分页（兼容旧接口），提供 cursor 时忽略
+            limit: 每页数量
+            primary_type / phase: 服务端筛选
+            cursor: 游标分页，上一页返回的 next_cursor（内部位置，翻页代价与页码无关）
+        """
+        where = "app_id = ?"
+        params: list = [app_id]
+        if primary_type:
+            where += " AND primary_type = ?"
+            params.append(primary_type)
+        if phase:
+            where += " AND phase = ?"
+            params.append(phase)
+
+        total = self._query(f"SELECT COUNT(*) AS n FROM screens WHERE {where}", tuple(params))[0]["n"]
+
+        if cursor is not None:
+            rows = self._query(
+                f"SELECT pos, data FROM screens WHERE {where} AND pos > ? ORDER BY pos LIMIT ?",
+                (*params, cursor, limit),
+            )
+        else:
+            rows = self._query(
+                f"SELECT pos, data FROM screens WHERE {where} ORDER BY pos LIMIT ? OFFSET ?",
+                (*params, limit, start),
+            )
+
+        screens = [json.loads(row["data"]) for row in rows]
+        next_cursor = rows[-1]["pos"] if rows and len(rows) == limit else None
+        if next_cursor is not None:
+            more = self._query(
+                f"SELECT 1 FROM screens WHERE {where} AND pos > ? LIMIT 1", (*params, next_cursor)
+            )
+            if not more:
+                next_cursor = None
+
+        return {
+            "screens": screens,
+            "total": total,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+        }
+
+
+# 全局存储实例
+swimlane_store = SwimlaneStore(
+    settings.data_dir / "analysis" / "swimlane",
+    settings.cache_dir / "swimlane.sqlite3",
+)
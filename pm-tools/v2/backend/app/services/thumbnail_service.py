@@ -0,0 +1,261 @@
+"""
+缩略图服务
+- 在进程池中生成缩略图，不阻塞事件循环
+- 使用 Pillow draft()/reduce() 先做快速降采样，再 LANCZOS 精修
+- 输出 WebP（客户端不支持时回退 PNG）
+- 支持按项目后台预生成所有尺寸
+"""
+import os
+import shutil
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+from app.services.project_service import get_project_path
+
+
+# 格式 -> (Pillow 格式名, 扩展名, MIME)
+THUMB_FORMATS = {
+    "webp": ("WEBP", ".webp", "image/webp"),
+    "png": ("PNG", ".png", "image/png"),
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+# 正在生成的缩略图（目标路径 -> Future），同一张图的并发请求共享一次生成
+_inflight: dict[str, asyncio.Future] = {}
+
+# 预生成任务状态（项目名 -> 状态）
+_pregenerate_jobs: dict[str, dict] = {}
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """获取（懒加载）缩略图进程池"""
+    global _executor
+    if _executor is None:
+        workers = settings.thumb_workers or max(1, (os.cpu_count() or 2) // 2)
+        _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def shutdown_executor():
+    """关闭进程池（应用退出时调用）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def choose_format(accept: Optional[str]) -> str:
+    """根据 Accept 头选择缩略图格式"""
+    if settings.thumb_format == "webp" and accept and "image/webp" in accept:
+        return "webp"
+    return "png"
+
+
+def get_media_type(fmt: str) -> str:
+    """缩略图格式对应的 MIME 类型"""
+    return THUMB_FORMATS[fmt][2]
+
+
+def _thumbnail_location(project_name: str, filename: str, size: str, fmt: str) -> tuple[Path, Path]:
+    """返回 (源文件路径, 缩略图路径)"""
+    project_path = get_project_path(project_name)
+    ext = THUMB_FORMATS[fmt][1]
+
+    if project_name.startswith("downloads_2024/"):
+        # 支持 screenshots 子目录
+        src_path = project_path / filename
+        # 缩略图统一放在 thumbs_xxx 目录，将路径中的 / 替换为 _ 使用扁平化文件名
+        thumb_dir = project_path / f"thumbs_{size}"
+        thumb_filename = Path(filename.replace("/", "_").replace("\\", "_")).stem + ext
+    else:
+        src_path = project_path / "Screens" / filename
+        thumb_dir = project_path / f"Screens_thumbs_{size}"
+        thumb_filename = Path(filename).stem + ext
+
+    return src_path, thumb_dir / thumb_filename
+
+
+def _is_fresh(src_path: Path, thumb_path: Path) -> bool:
+    """缩略图存在且不早于源文件"""
+    try:
+        return thumb_path.stat().st_mtime >= src_path.stat().st_mtime
+    except OSError:
+        return False
+
+
+def resize_to_width(img, width: int):
+    """
+    将已打开的图片缩放到指定宽度（保持宽高比）
+
+    先用 draft()（JPEG 解码时降采样）和 reduce()（整数倍盒式缩小）
+    快速缩到目标尺寸的 2 倍左右，再用 LANCZOS 缩放到目标宽度。
+    reduce()/LANCZOS 不支持调色板（P）、1 位、I;16 等模式，先转换为 RGB/RGBA。
+    """
+    from PIL import Image
+
+    height = max(1, round(img.height * width / img.width))
+
+    img.draft("RGB", (width * 2, height * 2))
+    if img.mode not in ("RGB", "RGBA", "L", "LA"):
+        has_alpha = img.mode == "PA" or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+    factor = img.width // (width * 2)
+    if factor >= 2:
+        img = img.reduce(factor)
+
+    return img.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def render_thumbnail(src_path: str, thumb_path: str, width: int, fmt: str, quality: int) -> bool:
+    """生成单张缩略图（在工作进程中执行）"""
+    try:
+        from PIL import Image
+
+        with Image.open(src_path) as img:
+            thumb = resize_to_width(img, width)
+
+        if thumb.mode not in ("RGB", "RGBA"):
+            has_alpha = thumb.mode in ("LA", "PA") or "transparency" in thumb.info
+            thumb = thumb.convert("RGBA" if has_alpha else "RGB")
+
+        pil_format = THUMB_FORMATS[fmt][0]
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+
+        # 先写临时文件再原子替换，避免并发读取到半截文件
+        tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+        if pil_format == "WEBP":
+            thumb.save(tmp_path, pil_format, quality=quality, method=4)
+        else:
+            thumb.save(tmp_path, pil_format, optimize=True)
+        os.replace(tmp_path, thumb_path)
+        return True
+    except Exception as e:
+        print(f"[ERROR] 生成缩略图失败: {src_path}: {e}")
+        return False
+
+
+async def _render_async(src_path: Path, thumb_path: Path, width: int, fmt: str) -> bool:
+    """在进程池中生成缩略图（同一目标的并发请求合并）"""
+    key = str(thumb_path)
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        get_executor(),
+        render_thumbnail,
+        str(src_path), key, width, fmt, settings.thumb_quality,
+    )
+    _inflight[key] = future
+    try:
+        return await future
+    finally:
+        _inflight.pop(key, None)
+
+
+async def get_thumbnail(project_name: str, filename: str, size: str = "small", fmt: str = "png") -> Optional[Path]:
+    """获取缩略图路径，不存在或已过期时在进程池中生成"""
+    width = settings.thumb_sizes.get(size)
+    if width is None:
+        return None
+
+    src_path, thumb_path = _thumbnail_location(project_name, filename, size, fmt)
+
+    if _is_fresh(src_path, thumb_path):
+        return thumb_path
+    if not src_path.exists():
+        return None
+
+    ok = await _render_async(src_path, thumb_path, width, fmt)
+    return thumb_path if ok else None
+
+
+def clear_thumbnails(screens_dir):
+    """删除截图目录下所有尺寸的缩略图缓存"""
+    for size in settings.thumb_sizes:
+        thumb_dir = os.path.join(screens_dir, f"thumbs_{size}")
+        if os.path.exists(thumb_dir):
+            shutil.rmtree(thumb_dir, ignore_errors=True)
+
+
+# ============================================================================
+# 预生成
+# ============================================================================
+
+def get_pregenerate_status(project_name: str) -> Optional[dict]:
+    """获取预生成任务状态"""
+    return _pregenerate_jobs.get(project_name)
+
+
+def is_pregenerating(project_name: str) -> bool:
+    """项目是否正在预生成"""
+    job = _pregenerate_jobs.get(project_name)
+    return bool(job and job["status"] == "running")
+
+
+async def pregenerate_project(
+    project_name: str,
+    sizes: Optional[list[str]] = None,
+    formats: Optional[list[str]] = None,
+):
+    """
+    后台预生成项目所有截图的缩略图
+
+    Args:
+        project_name: 项目名称
+        sizes: 尺寸列表，默认 settings.thumb_sizes 的全部尺寸
+        formats: 格式列表，默认 [settings.thumb_format]
+    """
+    from app.services.screenshot_service import get_project_screenshots
+
+    sizes = [s for s in (sizes or list(settings.thumb_sizes)) if s in settings.thumb_sizes]
+    formats = [f for f in (formats or [settings.thumb_format]) if f in THUMB_FORMATS]
+    filenames = [s.filename for s in get_project_screenshots(project_name)]
+
+    job = {
+        "project": project_name,
+        "status": "running",
+        "sizes": sizes,
+        "formats": formats,
+        "total": len(filenames) * len(sizes) * len(formats),
+        "done": 0,
+        "generated": 0,
+        "failed": 0,
+        "started_at": datetime.now().isoformat(),
+        "finished_at": None,
+    }
+    _pregenerate_jobs[project_name] = job
+
+    # 控制提交给进程池的任务数，避免一次性排入上千个任务
+    semaphore = asyncio.Semaphore(max(2, (settings.thumb_workers or os.cpu_count() or 2) * 2))
+
+    async def build(filename: str, size: str, fmt: str):
+        async with semaphore:
+            src_path, thumb_path = _thumbnail_location(project_name, filename, size, fmt)
+            if not _is_fresh(src_path, thumb_path):
+                if await _render_async(src_path, thumb_path, settings.thumb_sizes[size], fmt):
+                    job["generated"] += 1
+                else:
+                    job["failed"] += 1
+            job["done"] += 1
+
+    try:
+        await asyncio.gather(*[
+            build(filename, size, fmt)
+            for filename in filenames
+            for size in sizes
+            for fmt in formats
+        ])
+        job["status"] = "completed"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now().isoformat()
@@ -1,18 +1,28 @@
 """
 Vision Analysis Service
 使用 GPT-5.2 和 Claude Opus 4.5 双模型分析 Onboarding 截图
+- 使用异步 SDK 客户端，不阻塞事件循环
+- 批量分析交给 vision_scheduler（限流 + 流水线）
+- 模型输出按 sha256(图片) + 模型 + prompt 缓存（vision_cache），重复分析不再调用 API
+- settings.vision_provider = "stub" 时使用本地模拟 Provider，离线可测
 """
 import base64
 import asyncio
+import hashlib
 import json
+import random
 import re
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
 from pydantic import BaseModel, Field
-from openai import OpenAI
-from anthropic import Anthropic
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
 
 from app.config import settings
+from app.services.image_listing import list_images
+from app.services.image_preprocess import image_preprocessor
+from app.services.vision_cache import prompt_hash, sha256_bytes, vision_cache
+from app.services.vision_scheduler import ProviderRateLimited, get_gate, run_pipeline
 
 
 # ============================================================================
@@ -41,6 +51,15 @@ class ScreenAnalysis(BaseModel):
     analyzed_by: str = "gpt-5.2 + claude-opus-4-5"
 
 
+class LoadedImage(NamedTuple):
+    """已加载的截图"""
+    base64: str
+    media_type: str
+    sha256: str             # 发送给模型的数据的哈希（预处理参数变化时缓存自然失效）
+    original_size: int = 0  # 原图字节数
+    size: int = 0           # 实际发送的字节数
+
+
 # ============================================================================
 # Prompts
 # ============================================================================
@@ -118,6 +137,11 @@ CLASSIFICATION_PROMPT = """基于 GPT-5.2 的深度分析和原始截图，请
 ```"""
 
 
+# 请求参数（参与缓存 key 计算，修改后旧缓存自动失效）
+GPT52_PARAMS = {"max_completion_tokens": 1000, "temperature": 0.3}
+OPUS_PARAMS = {"max_tokens": 1000}
+
+
 # ============================================================================
 # Vision Analysis Service
 # ============================================================================
@@ -125,18 +149,26 @@ CLASSIFICATION_PROMPT = """基于 GPT-5.2 的深度分析和原始截图，请
 class VisionAnalysisService:
     """双模型视觉分析服务"""
     
+    gpt_model = "gpt-5.2"
+    opus_model = "claude-opus-4-5-20251101"
+    
     def __init__(self):
-        self.openai_client: Optional[OpenAI] = None
-        self.anthropic_client: Optional[Anthropic] = None
+        self.openai_client: Optional[AsyncOpenAI] = None
+        self.anthropic_client: Optional[AsyncAnthropic] = None
         self._init_clients()
     
     def _init_clients(self):
-        """初始化 API 客户端"""
+        """
+        初始化 API 客户端
+
+        关闭 SDK 内置重试（max_retries=0）：429/5xx 直接交给 vision_scheduler 的闸门处理，
+        避免两层重试叠加，也让 AIMD 降并发和 retry-after 暂停能及时生效。
+        """
         if settings.openai_api_key and settings.openai_api_key != "your_openai_api_key_here":
-            self.openai_client = OpenAI(api_key=settings.openai_api_key)
+            self.openai_client = AsyncOpenAI(api_key=settings.openai_api_key, max_retries=0)
         
         if settings.anthropic_api_key and settings.anthropic_api_key != "your_anthropic_api_key_here":
-            self.anthropic_client = Anthropic(api_key=settings.anthropic_api_key)
+            self.anthropic_client = AsyncAnthropic(api_key=settings.anthropic_api_key, max_retries=0)
     
     def is_configured(self) -> tuple[bool, bool]:
         """检查 API 是否已配置"""
@@ -147,6 +179,17 @@ class VisionAnalysisService:
         with open(image_path, "rb") as f:
             return base64.b64encode(f.read()).decode("utf-8")
     
+    def load_image(self, image_path: Path) -> LoadedImage:
+        """加载图片：裁剪、缩放、重新编码后返回 base64、媒体类型和内容哈希"""
+        prepared = image_preprocessor.prepare(image_path)
+        return LoadedImage(
+            base64.b64encode(prepared.data).decode("utf-8"),
+            prepared.media_type,
+            sha256_bytes(prepared.data),
+            prepared.original_size,
+            len(prepared.data),
+        )
+    
     def _get_media_type(self, filename: str) -> str:
         """根据文件名获取媒体类型"""
         ext = filename.lower().split(".")[-1]
@@ -162,8 +205,8 @@ class VisionAnalysisService:
         if not self.openai_client:
             raise ValueError("OpenAI API key not configured")
         
-        response = self.openai_client.chat.completions.create(
-            model="gpt-5.2",
+        response = await self.openai_client.chat.completions.create(
+            model=self.gpt_model,
             messages=[
                 {"role": "system", "content": DEEP_ANALYSIS_PROMPT},
                 {
@@ -179,8 +222,7 @@ class VisionAnalysisService:
                     ]
                 }
             ],
-            max_completion_tokens=1000,
-            temperature=0.3
+            **GPT52_PARAMS
         )
         return response.choices[0].message.content
     
@@ -191,12 +233,23 @@ class VisionAnalysisService:
         media_type: str = "image/png"
     ) -> dict:
         """使用 Opus 4.5 进行结构化分类"""
+        return self._parse_classification(
+            await self.request_classification(image_base64, gpt52_analysis, media_type)
+        )
+    
+    async def request_classification(
+        self,
+        image_base64: str,
+        gpt52_analysis: str,
+        media_type: str = "image/png"
+    ) -> str:
+        """调用 Opus 4.5，返回原始输出"""
         if not self.anthropic_client:
             raise ValueError("Anthropic API key not configured")
         
-        response = self.anthropic_client.messages.create(
-            model="claude-opus-4-5-20251101",
-            max_tokens=1000,
+        response = await self.anthropic_client.messages.create(
+            model=self.opus_model,
+            **OPUS_PARAMS,
             messages=[
                 {
                     "role": "user",
@@ -217,10 +270,36 @@ class VisionAnalysisService:
                 }
             ]
         )
+        return response.content[0].text
+    
+    async def deep_analysis(self, image: LoadedImage) -> str:
+        """GPT-5.2 深度分析（优先读缓存，未命中时经限流闸门调用）"""
+        digest = prompt_hash(DEEP_ANALYSIS_PROMPT, GPT52_PARAMS)
+        cached = vision_cache.get(image.sha256, self.gpt_model, digest)
+        if cached:
+            return cached.raw
         
-        # 解析 JSON 响应
-        content = response.content[0].text
+        analysis = await get_gate("openai").call(self.analyze_with_gpt52, image.base64, image.media_type)
+        vision_cache.put(image.sha256, self.gpt_model, digest, analysis)
+        return analysis
+    
+    async def classify(self, image: LoadedImage, gpt52_analysis: Optional[str]) -> dict:
+        """Opus 4.5 结构化分类（优先读缓存，未命中时经限流闸门调用）"""
+        gpt52_analysis = gpt52_analysis or "无 GPT-5.2 分析结果，请直接分析截图"
+        digest = prompt_hash(CLASSIFICATION_PROMPT, gpt52_analysis, OPUS_PARAMS)
+        cached = vision_cache.get(image.sha256, self.opus_model, digest)
+        if cached:
+            return cached.parsed
         
+        raw = await get_gate("anthropic").call(
+            self.request_classification, image.base64, gpt52_analysis, image.media_type
+        )
+        classification = self._parse_classification(raw)
+        vision_cache.put(image.sha256, self.opus_model, digest, raw, classification)
+        return classification
+    
+    def _parse_classification(self, content: str) -> dict:
+        """从模型输出中解析分类 JSON"""
         # 尝试提取 JSON
         if "```json" in content:
             json_str = content.split("```json")[1].split("```")[0].strip()
@@ -272,48 +351,57 @@ class VisionAnalysisService:
             ScreenAnalysis: 分析结果
         """
         filename = image_path.name
-        media_type = self._get_media_type(filename)
-        image_base64 = self._load_image_base64(image_path)
+        image = await asyncio.to_thread(self.load_image, image_path)
+        use_gpt, use_opus, analyzed_by = self.analysis_mode(use_dual_model)
         
-        if use_dual_model and self.openai_client and self.anthropic_client:
-            # 双模型协作
+        gpt52_analysis = None
+        if use_gpt:
             # Step 1: GPT-5.2 深度分析
-            gpt52_analysis = await self.analyze_with_gpt52(image_base64, media_type)
-            
+            gpt52_analysis = await self.deep_analysis(image)
+        
+        if use_opus:
             # Step 2: Opus 4.5 结构化分类
-            classification = await self.classify_with_opus(image_base64, gpt52_analysis, media_type)
-            
-            analyzed_by = "gpt-5.2 + claude-opus-4-5"
+            classification = await self.classify(image, gpt52_analysis)
+        else:
+            classification = self.fallback_classification(gpt52_analysis)
         
-        elif self.anthropic_client:
-            # 仅使用 Opus 4.5
-            classification = await self.classify_with_opus(
-                image_base64, 
-                "无 GPT-5.2 分析结果，请直接分析截图",
-                media_type
-            )
-            analyzed_by = "claude-opus-4-5"
+        return self.build_result(index, filename, classification, analyzed_by)
+    
+    def analysis_mode(self, use_dual_model: bool = True) -> tuple[bool, bool, str]:
+        """
+        根据已配置的 API 决定分析方式
         
-        elif self.openai_client:
+        Returns:
+            (是否调用 GPT-5.2, 是否调用 Opus 4.5, analyzed_by 标记)
+        """
+        openai_ok, anthropic_ok = self.is_configured()
+        if use_dual_model and openai_ok and anthropic_ok:
+            # 双模型协作
+            return True, True, "gpt-5.2 + claude-opus-4-5"
+        if anthropic_ok:
+            # 仅使用 Opus 4.5
+            return False, True, "claude-opus-4-5"
+        if openai_ok:
             # 仅使用 GPT-5.2（需要修改 prompt 输出 JSON）
-            gpt52_analysis = await self.analyze_with_gpt52(image_base64, media_type)
-            # 简单解析
-            classification = {
-                "primary_type": "Q",
-                "secondary_type": None,
-                "psychology": [],
-                "ui_pattern": "Unknown",
-                "copy": {"headline": None, "subheadline": None, "cta": None},
-                "insight": gpt52_analysis[:200],
-                "confidence": 0.7
-            }
-            analyzed_by = "gpt-5.2"
-        
-        else:
-            raise ValueError("No API keys configured")
-        
+            return True, False, "gpt-5.2"
+        raise ValueError("No API keys configured")
+    
+    def fallback_classification(self, gpt52_analysis: Optional[str]) -> dict:
+        """仅有 GPT-5.2 时的简单分类"""
+        return {
+            "primary_type": "Q",
+            "secondary_type": None,
+            "psychology": [],
+            "ui_pattern": "Unknown",
+            "copy": {"headline": None, "subheadline": None, "cta": None},
+            "insight": (gpt52_analysis or "")[:200],
+            "confidence": 0.7
+        }
+    
+    def build_result(self, index: int, filename: str, classification: dict, analyzed_by: str) -> ScreenAnalysis:
+        """由分类结果构建 ScreenAnalysis"""
         # 处理 copy 字段，确保 cta 是字符串而非列表
-        copy_data = classification.get("copy", {})
+        copy_data = classification.get("copy") or {}
         if isinstance(copy_data.get("cta"), list):
             copy_data["cta"] = ", ".join(copy_data["cta"])
         if isinstance(copy_data.get("headline"), list):
@@ -340,7 +428,7 @@ class VisionAnalysisService:
         screenshots_dir: Path,
         start_index: int = 1,
         end_index: Optional[int] = None,
-        concurrency: int = 3,
+        concurrency: Optional[int] = None,
         progress_callback: Optional[callable] = None
     ) -> list[ScreenAnalysis]:
         """
@@ -351,57 +439,91 @@ class VisionAnalysisService:
             screenshots_dir: 截图目录
             start_index: 起始序号
             end_index: 结束序号
-            concurrency: 并发数
+            concurrency: 每个阶段的并发数（实际并发受限流自适应调整）
             progress_callback: 进度回调
         
         Returns:
             list[ScreenAnalysis]: 分析结果列表
         """
         # 获取所有截图文件
-        screenshot_files = sorted([
-            f for f in screenshots_dir.iterdir()
-            if f.suffix.lower() in [".png", ".jpg", ".jpeg", ".webp"]
-        ])
+        screenshot_files = [screenshots_dir / e.name for e in list_images(screenshots_dir)]
         
         if end_index:
             screenshot_files = screenshot_files[:end_index]
         if start_index > 1:
             screenshot_files = screenshot_files[start_index - 1:]
         
-        results = []
-        semaphore = asyncio.Semaphore(concurrency)
-        
-        async def analyze_with_semaphore(file: Path, idx: int) -> ScreenAnalysis:
-            async with semaphore:
-                # Rate limit 重试逻辑
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        result = await self.analyze_screenshot(file, idx)
-                        if progress_callback:
-                            progress_callback(idx, len(screenshot_files), result)
-                        return result
-                    except Exception as e:
-                        error_msg = str(e).lower()
-                        if "rate" in error_msg or "limit" in error_msg or "429" in error_msg:
-                            wait_time = (attempt + 1) * 30  # 30s, 60s, 90s
-                            print(f"    [RATE LIMIT] {file.name} - 等待 {wait_time}s 后重试...")
-                            await asyncio.sleep(wait_time)
-                        else:
-                            if attempt == max_retries - 1:
-                                raise
-                            await asyncio.sleep(5)
-                raise Exception(f"Failed after {max_retries} retries")
-        
-        tasks = [
-            analyze_with_semaphore(f, i + start_index)
-            for i, f in enumerate(screenshot_files)
-        ]
-        
-        results = await asyncio.gather(*tasks)
-        return list(results)
+        pipeline = await run_pipeline(
+            self,
+            screenshot_files,
+            start_index=start_index,
+            concurrency=concurrency,
+            progress_callback=progress_callback,
+        )
+        if pipeline.failures:
+            print(f"    [WARN] {len(pipeline.failures)} 张截图分析失败: "
+                  + ", ".join(f["filename"] for f in pipeline.failures))
+        return pipeline.results
+
+
+class StubVisionAnalysisService(VisionAnalysisService):
+    """
+    本地模拟 Provider（settings.vision_provider = "stub"）
+    
+    不访问网络：按图片内容哈希生成稳定的分类结果，
+    可配置延迟和模拟 429 的概率，用于离线验证调度器。
+    """
+    
+    PAGE_TYPES = "WQVSARDCGLXP"
+    
+    gpt_model = "stub-gpt-5.2"
+    opus_model = "stub-claude-opus-4-5"
+    
+    def _init_clients(self):
+        pass
+    
+    def is_configured(self) -> tuple[bool, bool]:
+        return (True, True)
+    
+    def analysis_mode(self, use_dual_model: bool = True) -> tuple[bool, bool, str]:
+        return True, True, "stub"
+    
+    async def _simulate_call(self):
+        await asyncio.sleep(settings.vision_stub_latency)
+        if random.random() < settings.vision_stub_rate_limit:
+            raise ProviderRateLimited(retry_after=settings.vision_stub_latency)
+    
+    async def analyze_with_gpt52(self, image_base64: str, media_type: str = "image/png") -> str:
+        await self._simulate_call()
+        digest = hashlib.sha1(image_base64.encode("ascii")).hexdigest()
+        return f"[stub] {media_type} 截图 {digest[:12]} 的深度分析"
+    
+    async def request_classification(
+        self,
+        image_base64: str,
+        gpt52_analysis: str,
+        media_type: str = "image/png"
+    ) -> str:
+        await self._simulate_call()
+        digest = hashlib.sha1(image_base64.encode("ascii")).digest()
+        return json.dumps({
+            "primary_type": self.PAGE_TYPES[digest[0] % len(self.PAGE_TYPES)],
+            "secondary_type": None,
+            "psychology": [],
+            "ui_pattern": "Stub",
+            "copy": {"headline": None, "subheadline": None, "cta": None},
+            "insight": gpt52_analysis[:200],
+            "confidence": 0.5
+        }, ensure_ascii=False)
+
+
+def create_vision_service() -> VisionAnalysisService:
+    """按 settings.vision_provider 创建服务实例"""
+    if settings.vision_provider == "stub":
+        return StubVisionAnalysisService()
+    return VisionAnalysisService()
 
 
 # 全局服务实例
-vision_service = VisionAnalysisService()
+vision_service = create_vision_service()
 
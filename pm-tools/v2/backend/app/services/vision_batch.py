@@ -0,0 +1,422 @@
+"""
+视觉分析批量提交（离线批处理）
+- 把一整轮分析（如 analysis_queue.json）打包成 Provider 批处理任务：
+  Anthropic Message Batches / OpenAI Batch API（JSONL 文件）
+- 提交后进程即可退出，之后再查询状态、收集结果，不用在 sleep 中占着进程
+- 运行记录（manifest）保存在 data/analysis/batches/<run_id>/，收集到的原始输出写入 results.jsonl
+- 相同请求（图片哈希 + 模型 + prompt）只提交一次，已在结果缓存中的请求不提交
+- LocalBatchProvider 在本地文件中模拟批处理，用于离线测试
+"""
+import io
+import json
+import time
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, Union
+
+from app.config import settings
+from app.services.vision_cache import vision_cache
+
+
+# 批处理根目录
+BATCH_DIR = settings.data_dir / "analysis" / "batches"
+
+# 单个批次的上限（Anthropic: 10 万条 / 256MB，OpenAI: 5 万条 / 200MB，取保守值）
+MAX_BATCH_REQUESTS = 10000
+MAX_BATCH_BYTES = 150 * 1024 * 1024
+
+# 批次状态
+BATCH_IN_PROGRESS = "in_progress"
+BATCH_ENDED = "ended"
+BATCH_FAILED = "failed"
+
+
+@dataclass
+class BatchRequest:
+    """单个模型请求"""
+    provider: str                   # openai / anthropic
+    model: str
+    body: dict                      # 请求参数（与同步调用的参数一致）
+    cache_key: tuple[str, str, str]  # (图片哈希, 模型, prompt 哈希)
+
+    @property
+    def custom_id(self) -> str:
+        """由缓存 key 生成，相同请求去重（满足 Anthropic ^[a-zA-Z0-9_-]{1,64}$）"""
+        return hashlib.sha1("|".join(self.cache_key).encode()).hexdigest()
+
+
+@dataclass
+class BatchEntry:
+    """
+    一个输出单元（如一张截图）
+
+    requests 为 角色 -> custom_id，如 {"gpt": ..., "opus": ...}；meta 由调用方定义，收集时原样返回。
+    """
+    meta: dict
+    requests: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class BatchOutcome:
+    """收集结果"""
+    meta: dict
+    results: dict[str, Any]         # 角色 -> 解析后的结果
+    errors: dict[str, str]          # 角色 -> 错误信息
+
+
+# ============================================================================
+# Providers
+# ============================================================================
+
+class AnthropicBatchProvider:
+    """Anthropic Message Batches API"""
+
+    name = "anthropic"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, requests: list[BatchRequest]) -> str:
+        batch = self.client.messages.batches.create(
+            requests=[{"custom_id": r.custom_id, "params": r.body} for r in requests]
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        batch = self.client.messages.batches.retrieve(batch_id)
+        return BATCH_ENDED if batch.processing_status == "ended" else BATCH_IN_PROGRESS
+
+    def results(self, batch_id: str) -> Iterator[tuple[str, Optional[str], Optional[str]]]:
+        """逐条返回 (custom_id, 输出文本, 错误)"""
+        for item in self.client.messages.batches.results(batch_id):
+            if item.result.type == "succeeded":
+                yield item.custom_id, item.result.message.content[0].text, None
+            else:
+                error = getattr(item.result, "error", None)
+                yield item.custom_id, None, f"{item.result.type}: {error}" if error else item.result.type
+
+
+class OpenAIBatchProvider:
+    """OpenAI Batch API（上传 JSONL，/v1/chat/completions）"""
+
+    name = "openai"
+    endpoint = "/v1/chat/completions"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, requests: list[BatchRequest]) -> str:
+        lines = (
+            json.dumps({"custom_id": r.custom_id, "method": "POST", "url": self.endpoint, "body": r.body}, ensure_ascii=False)
+            for r in requests
+        )
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        uploaded = self.client.files.create(file=("batch.jsonl", io.BytesIO(payload)), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=self.endpoint,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status == "completed":
+            return BATCH_ENDED
+        if batch.status in ("failed", "expired", "cancelled"):
+            # expired / cancelled 的批次仍可能有部分结果
+            return BATCH_ENDED if batch.output_file_id else BATCH_FAILED
+        return BATCH_IN_PROGRESS
+
+    def results(self, batch_id: str) -> Iterator[tuple[str, Optional[str], Optional[str]]]:
+        batch = self.client.batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code") != 200:
+                    yield item["custom_id"], None, str(item.get("error") or response.get("body"))
+                else:
+                    yield item["custom_id"], response["body"]["choices"][0]["message"]["content"], None
+
+
+class LocalBatchProvider:
+    """
+    本地批处理替身（离线测试）
+
+    提交时把请求写成 JSONL 文件，latency 秒后视为完成；
+    结果按 custom_id 生成稳定的 JSON 文本，结构与分析脚本的输出格式一致。
+    """
+
+    CATEGORIES = ["Value", "Identity", "Goal", "Preference", "Plan", "Permission", "Paywall", "Registration", "Growth"]
+
+    def __init__(self, name: str, root: Union[str, Path] = BATCH_DIR / "local", latency: float = 0.0):
+        self.name = name
+        self.root = Path(root)
+        self.latency = latency
+
+    def submit(self, requests: list[BatchRequest]) -> str:
+        batch_id = f"local_{self.name}_{int(time.time() * 1000)}"
+        batch_dir = self.root / batch_id
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        with open(batch_dir / "input.jsonl", "w", encoding="utf-8") as f:
+            for r in requests:
+                f.write(json.dumps({"custom_id": r.custom_id, "model": r.model}, ensure_ascii=False) + "\n")
+        with open(batch_dir / "status.json", "w", encoding="utf-8") as f:
+            json.dump({"ready_at": time.time() + self.latency}, f)
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        with open(self.root / batch_id / "status.json", "r", encoding="utf-8") as f:
+            ready_at = json.load(f)["ready_at"]
+        return BATCH_ENDED if time.time() >= ready_at else BATCH_IN_PROGRESS
+
+    def results(self, batch_id: str) -> Iterator[tuple[str, Optional[str], Optional[str]]]:
+        with open(self.root / batch_id / "input.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                digest = hashlib.sha1(item["custom_id"].encode()).digest()
+                yield item["custom_id"], json.dumps({
+                    "classification": {
+                        "functional_purpose": {
+                            "primary_category": self.CATEGORIES[digest[0] % len(self.CATEGORIES)],
+                            "secondary_type": "Local",
+                            "confidence": 0.5,
+                        }
+                    },
+                    "deep_analysis": {
+                        "design_intent": f"[local {item['model']}] {item['custom_id'][:12]}",
+                        "conversion_impact": "uncertain",
+                    },
+                }, ensure_ascii=False), None
+
+
+# ============================================================================
+# 运行记录
+# ============================================================================
+
+def _chunks(requests: list[BatchRequest]) -> Iterator[list[BatchRequest]]:
+    """按条数和请求体大小切分批次"""
+    chunk, size = [], 0
+    for r in requests:
+        body_size = len(json.dumps(r.body, ensure_ascii=False).encode("utf-8"))
+        if chunk and (len(chunk) >= MAX_BATCH_REQUESTS or size + body_size > MAX_BATCH_BYTES):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(r)
+        size += body_size
+    if chunk:
+        yield chunk
+
+
+class BatchRun:
+    """
+    一轮批量分析
+
+    用法:
+        run = BatchRun.create({"script": ..., "plan": ...})
+        entry = run.add_entry(meta)
+        run.add_request(entry, "opus", request)
+        run.submit(providers)                 # 提交后可退出进程
+
+        run = BatchRun.load(run_id)           # 之后
+        run.refresh(providers)
+        if run.is_complete:
+            outcomes = run.collect(providers, parsers)
+    """
+
+    def __init__(self, run_dir: Path, manifest: dict):
+        self.run_dir = run_dir
+        self.manifest = manifest
+        self._pending: dict[str, BatchRequest] = {}
+
+    @property
+    def run_id(self) -> str:
+        return self.manifest["run_id"]
+
+    @classmethod
+    def create(cls, info: dict) -> "BatchRun":
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        run_dir = BATCH_DIR / run_id
+        run_dir.mkdir(parents=True, exist_ok=True)
+        return cls(run_dir, {
+            "run_id": run_id,
+            "created_at": datetime.now().isoformat(),
+            "info": info,
+            "requests": {},
+            "entries": [],
+            "batches": [],
+            "collected_at": None,
+        })
+
+    @classmethod
+    def load(cls, run_id: Optional[str] = None) -> "BatchRun":
+        """加载运行记录（默认最近一次）"""
+        if run_id is None:
+            runs = sorted(p.parent.name for p in BATCH_DIR.glob("*/manifest.json"))
+            if not runs:
+                raise FileNotFoundError(f"No batch runs in {BATCH_DIR}")
+            run_id = runs[-1]
+        run_dir = BATCH_DIR / run_id
+        with open(run_dir / "manifest.json", "r", encoding="utf-8") as f:
+            return cls(run_dir, json.load(f))
+
+    def provider_names(self) -> set[str]:
+        """本次运行用到的 Provider（status / collect 按此创建，与提交时的命令行参数无关）"""
+        return {request["provider"] for request in self.manifest["requests"].values()}
+
+    def save(self):
+        tmp_path = self.run_dir / "manifest.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.run_dir / "manifest.json")
+
+    def add_entry(self, meta: dict) -> BatchEntry:
+        entry = BatchEntry(meta)
+        self.manifest["entries"].append({"meta": meta, "requests": entry.requests})
+        return entry
+
+    def add_request(self, entry: BatchEntry, role: str, request: BatchRequest):
+        """登记请求；相同请求只提交一次，已缓存的请求不提交"""
+        custom_id = request.custom_id
+        entry.requests[role] = custom_id
+        if custom_id in self.manifest["requests"]:
+            return
+
+        cached = vision_cache.get(*request.cache_key) is not None
+        self.manifest["requests"][custom_id] = {
+            "provider": request.provider,
+            "cache_key": list(request.cache_key),
+            "cached": cached,
+        }
+        if not cached:
+            self._pending[custom_id] = request
+
+    def submit(self, providers: dict[str, Any]) -> list[dict]:
+        """提交未缓存的请求，返回新建的批次"""
+        by_provider: dict[str, list[BatchRequest]] = {}
+        for request in self._pending.values():
+            by_provider.setdefault(request.provider, []).append(request)
+
+        created = []
+        for provider_name, requests in by_provider.items():
+            provider = providers[provider_name]
+            for chunk in _chunks(requests):
+                batch_id = provider.submit(chunk)
+                batch = {
+                    "provider": provider_name,
+                    "batch_id": batch_id,
+                    "count": len(chunk),
+                    "status": BATCH_IN_PROGRESS,
+                    "submitted_at": datetime.now().isoformat(),
+                }
+                self.manifest["batches"].append(batch)
+                created.append(batch)
+                # 每提交一个批次就保存，提交中途失败也不会丢失已提交的批次
+                self.save()
+
+        self._pending.clear()
+        self.save()
+        return created
+
+    def refresh(self, providers: dict[str, Any]) -> dict:
+        """查询未完成批次的状态，返回汇总"""
+        for batch in self.manifest["batches"]:
+            if batch["status"] == BATCH_IN_PROGRESS:
+                batch["status"] = providers[batch["provider"]].status(batch["batch_id"])
+        self.save()
+        return self.summary()
+
+    @property
+    def is_complete(self) -> bool:
+        return all(b["status"] != BATCH_IN_PROGRESS for b in self.manifest["batches"])
+
+    def summary(self) -> dict:
+        counts: dict[str, int] = {}
+        for batch in self.manifest["batches"]:
+            counts[batch["status"]] = counts.get(batch["status"], 0) + 1
+        return {
+            "run_id": self.run_id,
+            "entries": len(self.manifest["entries"]),
+            "requests": len(self.manifest["requests"]),
+            "cached": sum(1 for r in self.manifest["requests"].values() if r["cached"]),
+            "batches": counts,
+            "complete": self.is_complete,
+            "collected_at": self.manifest["collected_at"],
+        }
+
+    def _fetch(self, providers: dict[str, Any]) -> dict[str, tuple[Optional[str], Optional[str]]]:
+        """下载已完成批次的结果（只下载一次，保存到 results.jsonl）"""
+        results_path = self.run_dir / "results.jsonl"
+        raw: dict[str, tuple[Optional[str], Optional[str]]] = {}
+        if results_path.exists():
+            with open(results_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    item = json.loads(line)
+                    raw[item["custom_id"]] = (item["text"], item["error"])
+
+        with open(results_path, "a", encoding="utf-8") as f:
+            for batch in self.manifest["batches"]:
+                if batch["status"] != BATCH_ENDED or batch.get("fetched"):
+                    continue
+                for custom_id, text, error in providers[batch["provider"]].results(batch["batch_id"]):
+                    raw[custom_id] = (text, error)
+                    f.write(json.dumps({"custom_id": custom_id, "text": text, "error": error}, ensure_ascii=False) + "\n")
+                batch["fetched"] = True
+        self.save()
+        return raw
+
+    def collect(self, providers: dict[str, Any], parsers: dict[str, Callable[[str], Any]]) -> list[BatchOutcome]:
+        """
+        收集结果并写入结果缓存
+
+        Args:
+            providers: Provider 名 -> Provider
+            parsers: 角色 -> 解析函数（输出文本 -> 结果），解析失败记为错误
+        """
+        raw = self._fetch(providers)
+        parsed: dict[str, tuple[Any, Optional[str]]] = {}
+
+        for custom_id, info in self.manifest["requests"].items():
+            cache_key = tuple(info["cache_key"])
+            if custom_id in raw:
+                parsed[custom_id] = raw[custom_id]
+            else:
+                cached = vision_cache.get(*cache_key)
+                parsed[custom_id] = (cached.raw, None) if cached else (None, "missing result")
+
+        outcomes = []
+        for entry in self.manifest["entries"]:
+            outcome = BatchOutcome(entry["meta"], {}, {})
+            for role, custom_id in entry["requests"].items():
+                text, error = parsed[custom_id]
+                if error is None:
+                    try:
+                        outcome.results[role] = parsers[role](text)
+                    except Exception as e:
+                        error = f"parse error: {e}"
+                    else:
+                        vision_cache.put(*self.manifest["requests"][custom_id]["cache_key"], text, outcome.results[role])
+                if error is not None:
+                    outcome.errors[role] = error
+            outcomes.append(outcome)
+
+        self.manifest["collected_at"] = datetime.now().isoformat()
+        self.save()
+        return outcomes
+
+
+def wait_for(run: BatchRun, providers: dict[str, Any], poll_interval: float = 300) -> dict:
+    """轮询直到所有批次结束（可选；通常提交后退出，稍后再 collect）"""
+    while True:
+        summary = run.refresh(providers)
+        print(f"[BATCH] {run.run_id}: {summary['batches']}")
+        if run.is_complete:
+            return summary
+        time.sleep(poll_interval)
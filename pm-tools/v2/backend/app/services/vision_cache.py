@@ -0,0 +1,147 @@
+"""
+视觉分析结果缓存（内容寻址）
+- key = sha256(图片字节) + 模型 ID + prompt 哈希
+- 存储模型原始输出和解析后的结果，保存在 SQLite（data/cache/vision_results.sqlite3）
+- 文件改名、重新排序后图片字节不变，仍然命中缓存
+- 后端服务和 scripts/ 下的分析脚本共用同一个缓存
+"""
+import json
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, NamedTuple, Optional, Union
+
+from app.config import settings
+
+
+class CachedResult(NamedTuple):
+    """缓存条目"""
+    raw: str            # 模型原始输出
+    parsed: Any         # 解析后的结果（JSON 可序列化），可能为 None
+
+
+def sha256_bytes(data: bytes) -> str:
+    """图片内容哈希"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: Union[str, Path]) -> str:
+    """图片文件内容哈希"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prompt_hash(*parts: Any) -> str:
+    """prompt 及影响输出的请求参数（max_tokens、temperature 等）的哈希"""
+    text = "\x1f".join(str(p) for p in parts)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def request_hash(request: dict) -> str:
+    """实际发送的请求参数（含 prompt 和图片）的哈希：修改任何参数都会使缓存失效"""
+    text = json.dumps(request, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class VisionResultCache:
+    """SQLite 结果缓存（线程安全，多进程通过 WAL 共享）"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS vision_results (
+                    image_sha256 TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    raw TEXT NOT NULL,
+                    parsed TEXT,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (image_sha256, model, prompt_hash)
+                )
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, image_sha256: str, model: str, prompt_digest: str) -> Optional[CachedResult]:
+        """查询缓存，未命中返回 None"""
+        if not settings.vision_cache_enabled:
+            return None
+
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT raw, parsed FROM vision_results "
+                "WHERE image_sha256 = ? AND model = ? AND prompt_hash = ?",
+                (image_sha256, model, prompt_digest),
+            ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        raw, parsed = row
+        return CachedResult(raw, json.loads(parsed) if parsed is not None else None)
+
+    def put(self, image_sha256: str, model: str, prompt_digest: str, raw: str, parsed: Any = None):
+        """写入缓存（同 key 覆盖）"""
+        if not settings.vision_cache_enabled:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO vision_results "
+                "(image_sha256, model, prompt_hash, raw, parsed, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    image_sha256,
+                    model,
+                    prompt_digest,
+                    raw,
+                    json.dumps(parsed, ensure_ascii=False) if parsed is not None else None,
+                    datetime.now().isoformat(),
+                ),
+            )
+            conn.commit()
+
+    def stats(self) -> dict:
+        """缓存统计"""
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM vision_results").fetchone()[0]
+        return {
+            "enabled": settings.vision_cache_enabled,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def clear(self, model: Optional[str] = None) -> int:
+        """清空缓存（可只清某个模型），返回删除条数"""
+        with self._lock:
+            conn = self._connect()
+            if model:
+                cursor = conn.execute("DELETE FROM vision_results WHERE model = ?", (model,))
+            else:
+                cursor = conn.execute("DELETE FROM vision_results")
+            conn.commit()
+            return cursor.rowcount
+
+
+# 全局缓存实例
+vision_cache = VisionResultCache(settings.cache_dir / "vision_results.sqlite3")
@@ -0,0 +1,376 @@
+"""
+视觉分析调度器
+- 每个 Provider（openai / anthropic）一个闸门：令牌桶限制 RPM + 自适应并发
+- 自适应并发采用 AIMD：收到 429/529 时并发减半并按 retry-after 暂停，连续成功后逐步加 1
+- 两阶段流水线：GPT 深度分析第 N+1 张的同时，Opus 在分类第 N 张
+- 闸门在进程内共享，多个分析任务同时运行时一起受限
+"""
+import time
+import asyncio
+import inspect
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Collection, Optional
+
+from app.config import settings
+
+
+class ProviderRateLimited(Exception):
+    """Provider 限流（stub 模拟 429 时使用）"""
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__(f"rate limited (retry after {retry_after}s)")
+        self.retry_after = retry_after
+
+
+# 当前任务的调用耗时回调 callback(provider, 秒)，可以是协程函数，由分析任务设置（子任务自动继承）
+latency_observer: ContextVar[Optional[Callable[[str, float], None]]] = ContextVar("latency_observer", default=None)
+
+# 视为限流的状态码（529 = Anthropic overloaded）
+_RATE_LIMIT_STATUS = (429, 529)
+
+
+def _header_retry_after(exc: Exception) -> Optional[float]:
+    """从 SDK 异常的响应头读取 retry-after（秒）"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                continue
+    return None
+
+
+async def _call_hook(hook: Optional[Callable], *args):
+    """调用回调（普通函数或协程函数）"""
+    if hook is None:
+        return
+    outcome = hook(*args)
+    if inspect.isawaitable(outcome):
+        await outcome
+
+
+def rate_limit_delay(exc: Exception) -> Optional[float]:
+    """
+    判断异常是否为限流
+
+    Returns:
+        限流时返回建议等待秒数（无 retry-after 时为 0），非限流返回 None
+    """
+    if isinstance(exc, ProviderRateLimited):
+        return exc.retry_after or 0.0
+    if getattr(exc, "status_code", None) in _RATE_LIMIT_STATUS:
+        return _header_retry_after(exc) or 0.0
+    return None
+
+
+def is_transient(exc: Exception) -> bool:
+    """可重试的临时错误：5xx、连接错误、超时"""
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # openai / anthropic SDK 的 APIConnectionError / APITimeoutError
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class TokenBucket:
+    """令牌桶：平均 rate_per_minute 次/分钟，允许 capacity 次突发"""
+
+    def __init__(self, rate_per_minute: float, capacity: int):
+        if rate_per_minute <= 0:
+            raise ValueError(f"rate_per_minute 必须大于 0: {rate_per_minute}")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reset(self):
+        """绑定到新的事件循环"""
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """取一个令牌（不足时等待，先到先得）"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发限制"""
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.active = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+
+    def reset(self):
+        """绑定到新的事件循环"""
+        self.active = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            while self.active >= self.limit:
+                await self._cond.wait()
+            self.active += 1
+
+        # retry-after 暂停期间不发请求
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        """加性增：连续成功 limit 次后并发 +1"""
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._successes = 0
+
+    def on_rate_limited(self, delay: float):
+        """乘性减：并发减半，并暂停 delay 秒"""
+        self.limit = max(self.min_limit, self.limit // 2)
+        self._successes = 0
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+
+class ProviderGate:
+    """单个 Provider 的调用闸门：令牌桶 + 自适应并发 + 重试"""
+
+    def __init__(self, name: str, rpm: float, max_concurrency: int, max_retries: int):
+        self.name = name
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rpm, max_concurrency)
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.rate_limited = 0
+        self.calls = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind(self):
+        """asyncio 原语不能跨事件循环使用，循环变化时重建"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self.bucket.reset()
+            self.limiter.reset()
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """在限流约束下调用 fn，限流和临时错误自动重试"""
+        self._bind()
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            await self.limiter.acquire()
+            started = time.monotonic()
+            elapsed = None
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                retry_after = rate_limit_delay(e)
+                if retry_after is None and not is_transient(e):
+                    raise
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+
+                backoff = min(60.0, 2.0 ** attempt)
+                if retry_after is not None:
+                    self.rate_limited += 1
+                    delay = retry_after or backoff
+                    self.limiter.on_rate_limited(delay)
+                    print(f"    [RATE LIMIT] {self.name} - 并发降为 {self.limiter.limit}，{delay:.1f}s 后重试")
+                else:
+                    delay = backoff
+                    print(f"    [RETRY] {self.name} - {e}，{delay:.1f}s 后重试")
+            else:
+                self.calls += 1
+                self.limiter.on_success()
+                elapsed = time.monotonic() - started
+            finally:
+                await self.limiter.release()
+
+            if elapsed is not None:
+                # 释放并发名额后再回调（回调可能写入任务存储）
+                await _call_hook(latency_observer.get(), self.name, elapsed)
+                return result
+            if retry_after is None:
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        """当前限流状态"""
+        return {
+            "concurrency": self.limiter.limit,
+            "max_concurrency": self.limiter.max_limit,
+            "active": self.limiter.active,
+            "calls": self.calls,
+            "rate_limited": self.rate_limited,
+        }
+
+
+_gates: dict[str, ProviderGate] = {}
+
+
+def get_gate(provider: str) -> ProviderGate:
+    """获取 Provider 闸门（进程内共享）"""
+    gate = _gates.get(provider)
+    if gate is None:
+        rpm = settings.vision_openai_rpm if provider == "openai" else settings.vision_anthropic_rpm
+        gate = ProviderGate(provider, rpm, settings.vision_max_concurrency, settings.vision_max_retries)
+        _gates[provider] = gate
+    return gate
+
+
+def get_scheduler_stats() -> dict:
+    """所有 Provider 的限流状态"""
+    return {name: gate.stats() for name, gate in _gates.items()}
+
+
+@dataclass
+class PipelineResult:
+    """流水线结果"""
+    results: list = field(default_factory=list)              # ScreenAnalysis，按 index 排序
+    failures: list[dict] = field(default_factory=list)       # {"index", "filename", "error"}
+    bytes_original: int = 0                                  # 原图总字节数
+    bytes_sent: int = 0                                      # 预处理后实际发送的字节数
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_original - self.bytes_sent
+
+
+async def run_pipeline(
+    service,
+    files: list[Path],
+    start_index: int = 1,
+    concurrency: Optional[int] = None,
+    progress_callback: Optional[Callable] = None,
+    skip_indexes: Collection[int] = (),
+    checkpoint: Optional[Callable] = None,
+    pipeline: Optional[PipelineResult] = None,
+) -> PipelineResult:
+    """
+    两阶段流水线分析截图
+
+    阶段 1（GPT 深度分析）和阶段 2（Opus 分类）各自有一组 worker（模型调用经
+    service 走缓存和 Provider 闸门），
+    中间用有界队列衔接：阶段 2 忙时阶段 1 最多领先一个队列长度，控制内存占用。
+    只配置一个 Provider 时，对应阶段直接透传。
+
+    Args:
+        service: VisionAnalysisService
+        files: 截图文件
+        start_index: 第一张截图的序号
+        concurrency: 每个阶段的 worker 数，默认 settings.vision_max_concurrency
+        progress_callback: 每完成一张调用 callback(completed, total, result)，失败时 result 为 None
+        skip_indexes: 跳过的序号（断点续跑时已完成的截图）
+        checkpoint: 每完成一张调用 checkpoint(index, filename, result, error)（可以是协程函数），用于持久化进度
+        pipeline: 写入结果的对象（默认新建）；传入后即使流水线被取消或失败，也能读到已统计的字节数
+    """
+    use_gpt, use_opus, analyzed_by = service.analysis_mode()
+    workers = concurrency or settings.vision_max_concurrency
+
+    pipeline = pipeline if pipeline is not None else PipelineResult()
+    completed = 0
+
+    pending: asyncio.Queue = asyncio.Queue()
+    for i, path in enumerate(files):
+        if i + start_index not in skip_indexes:
+            pending.put_nowait((i + start_index, path))
+    total = pending.qsize()
+    handoff: asyncio.Queue = asyncio.Queue(maxsize=workers)
+
+    async def finish(index: int, path: Path, result=None, error: Optional[Exception] = None):
+        nonlocal completed
+        completed += 1
+        if result is not None:
+            pipeline.results.append(result)
+        else:
+            print(f"    [ERROR] {path.name}: {error}")
+            pipeline.failures.append({"index": index, "filename": path.name, "error": str(error)})
+        await _call_hook(checkpoint, index, path.name, result, None if result is not None else str(error))
+        if progress_callback:
+            progress_callback(completed, total, result)
+
+    async def analyze_stage():
+        while True:
+            try:
+                index, path = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                image = await asyncio.to_thread(service.load_image, path)
+                pipeline.bytes_original += image.original_size
+                pipeline.bytes_sent += image.size
+                analysis = await service.deep_analysis(image) if use_gpt else None
+            except Exception as e:
+                await finish(index, path, error=e)
+                continue
+            await handoff.put((index, path, image, analysis))
+
+    async def classify_stage():
+        while True:
+            job = await handoff.get()
+            if job is None:
+                return
+            index, path, image, analysis = job
+            try:
+                if use_opus:
+                    classification = await service.classify(image, analysis)
+                else:
+                    classification = service.fallback_classification(analysis)
+                result = service.build_result(index, path.name, classification, analyzed_by)
+            except Exception as e:
+                await finish(index, path, error=e)
+                continue
+            await finish(index, path, result=result)
+
+    async def feed_stage():
+        await asyncio.gather(*[analyze_stage() for _ in range(workers)])
+        for _ in range(workers):
+            await handoff.put(None)
+
+    # 两个阶段放在同一个 gather 里：任何 worker 抛出异常（例如 checkpoint 写入失败）时
+    # 整个流水线失败并取消其余 worker，不会因为下游全部退出而阻塞在 handoff.put 上
+    tasks = [asyncio.create_task(feed_stage())]
+    tasks += [asyncio.create_task(classify_stage()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if pipeline.bytes_original:
+        print(
+            f"    [PREPROCESS] {pipeline.bytes_original / 1024 / 1024:.1f}MB -> "
+            f"{pipeline.bytes_sent / 1024 / 1024:.1f}MB（节省 {pipeline.bytes_saved / 1024 / 1024:.1f}MB）"
+        )
+    pipeline.results.sort(key=lambda r: r.index)
+    pipeline.failures.sort(key=lambda f: f["index"])
+    return pipeline
@@ -0,0 +1,100 @@
+"""
+流式 ZIP 打包
+- 边读文件边输出，不在内存中缓冲整个压缩包
+- PNG/JPG/WebP 等已压缩图片使用 ZIP_STORED，其余文件使用 ZIP_DEFLATED
+- 输出为同步生成器：交给 StreamingResponse 时在线程池中迭代，读文件不阻塞事件循环
+"""
+import os
+import time
+import zipfile
+from typing import Iterable, Iterator, Union
+
+from app.services.image_listing import is_image_file
+
+
+# 每次读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# ZIP 条目：(包内路径, 文件路径 或 内容字节)
+ZipEntry = tuple[str, Union[str, bytes]]
+
+
+class _ChunkSink:
+    """
+    不可 seek 的输出目标
+
+    zipfile 检测到不可 seek 时会改用数据描述符（data descriptor）写入，
+    条目写完即可输出，不需要回头修改本地文件头。
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        """取出并清空已写入的数据"""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _compress_type(arcname: str) -> int:
+    """已压缩的图片直接存储，避免重复 deflate"""
+    return zipfile.ZIP_STORED if is_image_file(arcname) else zipfile.ZIP_DEFLATED
+
+
+def stream_zip(entries: Iterable[ZipEntry], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    流式生成 ZIP 数据
+
+    Args:
+        entries: (包内路径, 文件路径或字节) 序列，可以是惰性生成器
+        chunk_size: 读取文件的块大小
+
+    Yields:
+        ZIP 数据块
+    """
+    sink = _ChunkSink()
+
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+        for arcname, source in entries:
+            if isinstance(source, bytes):
+                zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                zinfo.compress_type = _compress_type(arcname)
+                zinfo.file_size = len(source)
+                with zf.open(zinfo, "w") as dst:
+                    dst.write(source)
+            else:
+                try:
+                    zinfo = zipfile.ZipInfo.from_file(source, arcname)
+                except OSError as e:
+                    print(f"[WARN] 导出跳过文件: {source}: {e}")
+                    continue
+                zinfo.compress_type = _compress_type(arcname)
+                with open(source, "rb") as src, zf.open(zinfo, "w") as dst:
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        if data := sink.drain():
+                            yield data
+
+            if data := sink.drain():
+                yield data
+
+    # 中央目录
+    if data := sink.drain():
+        yield data
+
+
+def file_entries(directory: Union[str, os.PathLike], filenames: Iterable[str], prefix: str) -> Iterator[ZipEntry]:
+    """把目录下的文件映射为 ZIP 条目（包内路径为 prefix/filename）"""
+    for filename in filenames:
+        yield f"{prefix}/{filename}", os.path.join(directory, filename)
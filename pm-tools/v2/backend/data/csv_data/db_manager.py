@@ -3,11 +3,20 @@
 SQLite数据库管理器
 支持产品分析数据的存储和跨产品查询
 支持三层分类体系 (Stage/Module/Feature)
+支持项目文档（分类 / AI 分析结果 / Onboarding 范围，逐截图条目按行存储，见 app/services/project_store.py）
+
+连接管理:
+- 每个线程复用一个读写连接和一个只读连接（不再每次调用都重新打开）
+- WAL 日志模式：读取不阻塞写入，迁移时其他进程仍可查询
+- 连接级 PRAGMA：synchronous/cache_size/mmap_size/temp_store/foreign_keys
+- 连接复用后 sqlite3 的语句缓存（cached_statements）生效，相同 SQL 不再重复编译
 """
 
 import os
+import re
 import json
 import sqlite3
+import threading
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from contextlib import contextmanager
@@ -16,31 +25,261 @@ from contextlib import contextmanager
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, "data", "pm_tool.db")
 
+# 连接级 PRAGMA（每个连接打开时执行）
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",      # WAL 模式下 NORMAL 即可保证一致性
+    "PRAGMA cache_size = -32000",       # 页缓存 32MB（负数单位为 KB）
+    "PRAGMA mmap_size = 268435456",     # 256MB 内存映射读取
+    "PRAGMA temp_store = MEMORY",       # 排序/临时表放内存
+    "PRAGMA foreign_keys = ON",         # 使表结构中的 ON DELETE CASCADE 生效
+)
+
+# 每个连接缓存的预编译语句数
+STATEMENT_CACHE_SIZE = 256
+
+# 全文搜索索引（FTS5 trigram：中文无需分词，英文按子串匹配，不区分大小写）
+# rowid = screenshots.id；中英文合并到同一列；由触发器与 screenshots/tags/design_highlights 保持同步
+_TAGS_TEXT = """(SELECT group_concat(coalesce(tag_cn, '') || ' ' || coalesce(tag_en, ''), ' ')
+                 FROM tags WHERE screenshot_id = {id})"""
+_HIGHLIGHTS_TEXT = """(SELECT group_concat(coalesce(content_cn, '') || ' ' || coalesce(content_en, ''), ' ')
+                       FROM design_highlights WHERE screenshot_id = {id})"""
+_FTS_VALUES = """
+        {row}.id,
+        coalesce({row}.naming_cn, '') || ' ' || coalesce({row}.naming_en, ''),
+        coalesce({row}.core_function_cn, '') || ' ' || coalesce({row}.core_function_en, ''),
+        coalesce({row}.product_insight_cn, '') || ' ' || coalesce({row}.product_insight_en, ''),
+        coalesce(""" + _TAGS_TEXT.format(id="{row}.id") + """, ''),
+        coalesce(""" + _HIGHLIGHTS_TEXT.format(id="{row}.id") + """, '')
+"""
+_FTS_COLUMNS = "screenshots_fts (rowid, naming, core_function, insight, tags, highlights)"
+_FTS_INSERT = "INSERT INTO " + _FTS_COLUMNS + " VALUES (" + _FTS_VALUES + ");"
+
+SEARCH_SCHEMA = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS screenshots_fts USING fts5(
+        naming, core_function, insight, tags, highlights,
+        tokenize = 'trigram'
+    );
+    
+    CREATE TRIGGER IF NOT EXISTS screenshots_fts_ai AFTER INSERT ON screenshots BEGIN
+        {_FTS_INSERT.format(row="new")}
+    END;
+    CREATE TRIGGER IF NOT EXISTS screenshots_fts_au AFTER UPDATE ON screenshots BEGIN
+        DELETE FROM screenshots_fts WHERE rowid = old.id;
+        {_FTS_INSERT.format(row="new")}
+    END;
+    CREATE TRIGGER IF NOT EXISTS screenshots_fts_ad AFTER DELETE ON screenshots BEGIN
+        DELETE FROM screenshots_fts WHERE rowid = old.id;
+    END;
+    
+    CREATE TRIGGER IF NOT EXISTS tags_fts_ai AFTER INSERT ON tags BEGIN
+        UPDATE screenshots_fts SET tags = coalesce({_TAGS_TEXT.format(id="new.screenshot_id")}, '')
+        WHERE rowid = new.screenshot_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS tags_fts_au AFTER UPDATE ON tags BEGIN
+        UPDATE screenshots_fts SET tags = coalesce({_TAGS_TEXT.format(id="old.screenshot_id")}, '')
+        WHERE rowid = old.screenshot_id;
+        UPDATE screenshots_fts SET tags = coalesce({_TAGS_TEXT.format(id="new.screenshot_id")}, '')
+        WHERE rowid = new.screenshot_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS tags_fts_ad AFTER DELETE ON tags BEGIN
+        UPDATE screenshots_fts SET tags = coalesce({_TAGS_TEXT.format(id="old.screenshot_id")}, '')
+        WHERE rowid = old.screenshot_id;
+    END;
+    
+    CREATE TRIGGER IF NOT EXISTS highlights_fts_ai AFTER INSERT ON design_highlights BEGIN
+        UPDATE screenshots_fts SET highlights = coalesce({_HIGHLIGHTS_TEXT.format(id="new.screenshot_id")}, '')
+        WHERE rowid = new.screenshot_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS highlights_fts_au AFTER UPDATE ON design_highlights BEGIN
+        UPDATE screenshots_fts SET highlights = coalesce({_HIGHLIGHTS_TEXT.format(id="old.screenshot_id")}, '')
+        WHERE rowid = old.screenshot_id;
+        UPDATE screenshots_fts SET highlights = coalesce({_HIGHLIGHTS_TEXT.format(id="new.screenshot_id")}, '')
+        WHERE rowid = new.screenshot_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS highlights_fts_ad AFTER DELETE ON design_highlights BEGIN
+        UPDATE screenshots_fts SET highlights = coalesce({_HIGHLIGHTS_TEXT.format(id="old.screenshot_id")}, '')
+        WHERE rowid = old.screenshot_id;
+    END;
+"""
+
+# 索引内容拼接（短词子串匹配用）
+_FTS_TEXT = "naming || ' ' || core_function || ' ' || insight || ' ' || tags || ' ' || highlights"
+
+# BM25 列权重：naming, core_function, insight, tags, highlights
+SEARCH_WEIGHTS = (5.0, 2.0, 1.0, 4.0, 1.0)
+
+# trigram 最短可索引长度；更短的词（如两个汉字）退化为 LIKE 子串匹配
+_TRIGRAM_MIN = 3
+
+
+# 项目文档：原先分散在各项目目录下的 classification.json / ai_analysis.json / onboarding_range.json
+# - project_documents：每个 (项目, 类型) 一行，header 为逐截图条目以外的内容
+# - project_entries：逐截图条目（filename -> JSON），更新分类只改动涉及的行
+# - revision 全表递增，任何写入后都会变化（用作缓存签名）；source_mtime_ns 为同步时 JSON 文件的 mtime
+PROJECT_DOCUMENT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS project_documents (
+        project TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        header TEXT,
+        revision INTEGER NOT NULL,
+        source_mtime_ns INTEGER,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (project, kind)
+    ) WITHOUT ROWID;
+    
+    CREATE TABLE IF NOT EXISTS project_entries (
+        project TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (project, kind, filename)
+    ) WITHOUT ROWID;
+"""
+
+
+def _bilingual(data: Dict, key: str, lang: str):
+    """读取双语字段：{key: {cn, en}} 或扁平的 key_cn / key_en"""
+    value = data.get(key)
+    if isinstance(value, dict):
+        return value.get(lang)
+    return data.get(f"{key}_{lang}")
+
+
+def _screenshot_row(product_id: int, screenshot_data: Dict) -> Tuple:
+    """截图数据 -> screenshots 表的一行"""
+    return (
+        product_id,
+        screenshot_data.get('index', screenshot_data.get('idx')),
+        screenshot_data.get('filename'),
+        screenshot_data.get('screen_type'),
+        screenshot_data.get('sub_type'),
+        screenshot_data.get('stage'),
+        screenshot_data.get('module'),
+        screenshot_data.get('feature'),
+        screenshot_data.get('role'),
+        _bilingual(screenshot_data, 'naming', 'cn'),
+        _bilingual(screenshot_data, 'naming', 'en'),
+        _bilingual(screenshot_data, 'core_function', 'cn'),
+        _bilingual(screenshot_data, 'core_function', 'en'),
+        _bilingual(screenshot_data, 'product_insight', 'cn'),
+        _bilingual(screenshot_data, 'product_insight', 'en'),
+        screenshot_data.get('confidence', 0.0)
+    )
+
+
+def _search_terms(query: str) -> List[str]:
+    """拆分搜索词：双引号内为短语，其余按空白分隔"""
+    terms = []
+    for phrase, word in re.findall(r'"([^"]+)"|(\S+)', query or ""):
+        term = (phrase or word).strip()
+        if term:
+            terms.append(term)
+    return terms
+
+
+def _fts_query(terms: List[str]) -> str:
+    """FTS5 查询：每个词作为短语，全部包含"""
+    return " AND ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
 
 class DBManager:
     """数据库管理器"""
     
     def __init__(self, db_path: str = None):
         self.db_path = db_path or DB_PATH
+        self._local = threading.local()
+        self._connections: List[Tuple[bool, sqlite3.Connection]] = []   # (是否只读, 连接)
+        self._lock = threading.Lock()
         self._init_db()
     
+    # ==================== 连接管理 ====================
+    
+    def _open(self, readonly: bool = False) -> sqlite3.Connection:
+        """打开连接并设置 PRAGMA"""
+        if readonly:
+            uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+            # 自动提交模式：不隐式开启事务，每条查询都读取最新提交的数据
+            conn = sqlite3.connect(uri, uri=True, timeout=30, isolation_level=None,
+                                   check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row  # 返回字典式结果
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        
+        with self._lock:
+            self._connections.append((readonly, conn))
+        return conn
+    
+    def _thread_connection(self, readonly: bool) -> sqlite3.Connection:
+        """当前线程的连接（首次使用时打开）"""
+        attr = "reader" if readonly else "writer"
+        conn = getattr(self._local, attr, None)
+        if conn is None:
+            conn = self._open(readonly)
+            setattr(self._local, attr, conn)
+        return conn
+    
     @contextmanager
     def get_connection(self):
-        """获取数据库连接（上下文管理器）"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # 返回字典式结果
+        """
+        获取读写连接（上下文管理器）
+        
+        同一线程内可嵌套使用：只有最外层退出时提交，异常时整体回滚。
+        """
+        conn = self._thread_connection(readonly=False)
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
         try:
             yield conn
-            conn.commit()
+            if depth == 0:
+                conn.commit()
         except Exception:
-            conn.rollback()
+            if depth == 0:
+                conn.rollback()
             raise
         finally:
-            conn.close()
+            self._local.depth = depth
+    
+    @contextmanager
+    def read_connection(self):
+        """
+        获取只读连接（查询方法使用）
+        
+        与写连接分开：WAL 模式下读取不等待写事务，迁移进行时也能查询。
+        当前线程有未提交的写事务时使用写连接，以便读到自己的修改。
+        """
+        if getattr(self._local, "depth", 0):
+            yield self._thread_connection(readonly=False)
+            return
+        yield self._thread_connection(readonly=True)
+    
+    def close(self):
+        """关闭所有线程打开的连接"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        # 先关只读连接：最后关闭的读写连接负责 checkpoint 并删除 -wal 文件
+        connections.sort(key=lambda item: not item[0])
+        for _, conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self._local = threading.local()
     
     def _init_db(self):
         """初始化数据库表结构"""
+        db_dir = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        
         with self.get_connection() as conn:
+            # WAL 是数据库文件级别的设置，设置一次后对所有连接生效
+            conn.execute("PRAGMA journal_mode = WAL")
+            
             cursor = conn.cursor()
             
             # 产品表
@@ -173,6 +412,25 @@ class DBManager:
             
             # 添加新列到已存在的表（安全迁移）
             self._migrate_screenshots_table(cursor)
+            
+            # 项目文档
+            cursor.executescript(PROJECT_DOCUMENT_SCHEMA)
+            
+            # 全文搜索索引（已有数据时回填）
+            cursor.executescript(SEARCH_SCHEMA)
+            cursor.execute("SELECT (SELECT COUNT(*) FROM screenshots) - (SELECT COUNT(*) FROM screenshots_fts)")
+            if cursor.fetchone()[0]:
+                self._rebuild_search_index(cursor)
+    
+    def _rebuild_search_index(self, cursor):
+        """按 screenshots/tags/design_highlights 重建全文索引"""
+        cursor.execute("DELETE FROM screenshots_fts")
+        cursor.execute("INSERT INTO " + _FTS_COLUMNS + " SELECT " + _FTS_VALUES.format(row="s") + " FROM screenshots s")
+    
+    def rebuild_search_index(self):
+        """重建全文索引（索引损坏或手动改表后使用）"""
+        with self.get_connection() as conn:
+            self._rebuild_search_index(conn.cursor())
     
     def _migrate_screenshots_table(self, cursor):
         """为已存在的screenshots表添加新列"""
@@ -282,65 +540,78 @@ class DBManager:
     
     def save_screenshot(self, product_id: int, screenshot_data: Dict) -> int:
         """保存截图分析结果（支持三层分类）"""
+        return self.save_screenshots(product_id, [screenshot_data])[0]
+    
+    def save_screenshots(self, product_id: int, screenshots: List[Dict]) -> List[int]:
+        """
+        批量保存截图分析结果（单个事务，截图/设计亮点/标签各一次 executemany）
+        
+        Returns:
+            截图ID列表（与传入顺序一致）
+        """
+        if not screenshots:
+            return []
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("""
+            # AUTOINCREMENT 在同一写事务内单调递增：先取得写锁，插入后按 id 顺序取回新行
+            if not conn.in_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM screenshots")
+            last_id = cursor.fetchone()[0]
+            
+            cursor.executemany("""
                 INSERT INTO screenshots (
                     product_id, idx, filename, screen_type, sub_type,
                     stage, module, feature, role,
                     naming_cn, naming_en, core_function_cn, core_function_en,
                     product_insight_cn, product_insight_en, confidence
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                product_id,
-                screenshot_data.get('index', screenshot_data.get('idx')),
-                screenshot_data.get('filename'),
-                screenshot_data.get('screen_type'),
-                screenshot_data.get('sub_type'),
-                screenshot_data.get('stage'),
-                screenshot_data.get('module'),
-                screenshot_data.get('feature'),
-                screenshot_data.get('role'),
-                screenshot_data.get('naming', {}).get('cn') if isinstance(screenshot_data.get('naming'), dict) else screenshot_data.get('naming_cn'),
-                screenshot_data.get('naming', {}).get('en') if isinstance(screenshot_data.get('naming'), dict) else screenshot_data.get('naming_en'),
-                screenshot_data.get('core_function', {}).get('cn') if isinstance(screenshot_data.get('core_function'), dict) else screenshot_data.get('core_function_cn'),
-                screenshot_data.get('core_function', {}).get('en') if isinstance(screenshot_data.get('core_function'), dict) else screenshot_data.get('core_function_en'),
-                screenshot_data.get('product_insight', {}).get('cn') if isinstance(screenshot_data.get('product_insight'), dict) else screenshot_data.get('product_insight_cn'),
-                screenshot_data.get('product_insight', {}).get('en') if isinstance(screenshot_data.get('product_insight'), dict) else screenshot_data.get('product_insight_en'),
-                screenshot_data.get('confidence', 0.0)
-            ))
+            """, [_screenshot_row(product_id, s) for s in screenshots])
             
-            screenshot_id = cursor.lastrowid
+            cursor.execute("SELECT id FROM screenshots WHERE id > ? ORDER BY id", (last_id,))
+            screenshot_ids = [row[0] for row in cursor.fetchall()]
             
-            # 保存设计亮点
-            highlights = screenshot_data.get('design_highlights', [])
-            for h in highlights:
-                cursor.execute("""
-                    INSERT INTO design_highlights (screenshot_id, category, content_cn, content_en)
-                    VALUES (?, ?, ?, ?)
-                """, (
-                    screenshot_id,
-                    h.get('category'),
-                    h.get('cn'),
-                    h.get('en')
-                ))
+            highlight_rows = []
+            tag_rows = []
+            for screenshot_id, screenshot_data in zip(screenshot_ids, screenshots):
+                # 设计亮点
+                for h in screenshot_data.get('design_highlights', []):
+                    highlight_rows.append((screenshot_id, h.get('category'), h.get('cn'), h.get('en')))
+                
+                # 标签
+                for t in screenshot_data.get('tags', []):
+                    if isinstance(t, dict):
+                        tag_rows.append((screenshot_id, t.get('cn'), t.get('en')))
+                    else:
+                        tag_rows.append((screenshot_id, str(t), str(t)))
             
-            # 保存标签
-            tags = screenshot_data.get('tags', [])
-            for t in tags:
-                if isinstance(t, dict):
-                    cursor.execute("""
-                        INSERT INTO tags (screenshot_id, tag_cn, tag_en)
-                        VALUES (?, ?, ?)
-                    """, (screenshot_id, t.get('cn'), t.get('en')))
-                else:
-                    cursor.execute("""
-                        INSERT INTO tags (screenshot_id, tag_cn, tag_en)
-                        VALUES (?, ?, ?)
-                    """, (screenshot_id, str(t), str(t)))
-            
-            return screenshot_id
+            cursor.executemany("""
+                INSERT INTO design_highlights (screenshot_id, category, content_cn, content_en)
+                VALUES (?, ?, ?, ?)
+            """, highlight_rows)
+            cursor.executemany("""
+                INSERT INTO tags (screenshot_id, tag_cn, tag_en)
+                VALUES (?, ?, ?)
+            """, tag_rows)
+            
+            return screenshot_ids
+    
+    def save_product_bundle(self, product_data: Dict, screenshots: List[Dict],
+                            flow_stages: Optional[List] = None) -> int:
+        """
+        在一个事务中保存产品、截图和流程阶段（任一步失败整体回滚）
+        
+        Returns:
+            产品ID
+        """
+        with self.get_connection():
+            product_id = self.save_product(product_data)
+            self.save_screenshots(product_id, screenshots)
+            if flow_stages:
+                self.save_flow_stages(product_id, flow_stages)
+            return product_id
     
     def save_video_frame(self, product_id: int, frame_data: Dict) -> int:
         """保存视频帧分析结果"""
@@ -385,35 +656,174 @@ class DBManager:
     
     def save_flow_stages(self, product_id: int, stages: List[Dict]):
         """保存流程阶段"""
+        rows = []
+        for i, stage in enumerate(stages):
+            if isinstance(stage, str):
+                # 简单字符串格式
+                rows.append((product_id, i, stage, None, None, None))
+            else:
+                # 字典格式
+                rows.append((
+                    product_id,
+                    stage.get('order', i),
+                    stage.get('name', stage.get('stage_name')),
+                    stage.get('start_idx', stage.get('start')),
+                    stage.get('end_idx', stage.get('end')),
+                    stage.get('description')
+                ))
+        
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            for i, stage in enumerate(stages):
-                if isinstance(stage, str):
-                    # 简单字符串格式
-                    cursor.execute("""
-                        INSERT INTO flow_stages (product_id, order_num, stage_name)
-                        VALUES (?, ?, ?)
-                    """, (product_id, i, stage))
-                else:
-                    # 字典格式
-                    cursor.execute("""
-                        INSERT INTO flow_stages (product_id, order_num, stage_name, start_idx, end_idx, description)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
-                        product_id,
-                        stage.get('order', i),
-                        stage.get('name', stage.get('stage_name')),
-                        stage.get('start_idx', stage.get('start')),
-                        stage.get('end_idx', stage.get('end')),
-                        stage.get('description')
-                    ))
+            conn.executemany("""
+                INSERT INTO flow_stages (product_id, order_num, stage_name, start_idx, end_idx, description)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+    
+    # ==================== 项目文档 ====================
+    
+    def _touch_project_document(self, conn, project: str, kind: str, header: Optional[Dict] = None,
+                                replace_header: bool = False) -> int:
+        """创建文档行或递增 revision，返回新 revision"""
+        conn.execute("""
+            INSERT INTO project_documents (project, kind, header, revision, updated_at)
+            VALUES (?, ?, ?, (SELECT coalesce(max(revision), 0) + 1 FROM project_documents), CURRENT_TIMESTAMP)
+            ON CONFLICT (project, kind) DO UPDATE SET
+                header = CASE WHEN ? THEN excluded.header ELSE header END,
+                revision = excluded.revision,
+                updated_at = excluded.updated_at
+        """, (project, kind, None if header is None else json.dumps(header, ensure_ascii=False), replace_header))
+        cursor = conn.execute(
+            "SELECT revision FROM project_documents WHERE project = ? AND kind = ?", (project, kind)
+        )
+        return cursor.fetchone()[0]
+    
+    def put_project_document(self, project: str, kind: str, header: Optional[Dict],
+                             entries: Optional[Dict[str, Dict]] = None,
+                             source_mtime_ns: Optional[int] = None) -> int:
+        """整体写入项目文档（替换已有条目），返回新 revision"""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM project_entries WHERE project = ? AND kind = ?", (project, kind))
+            conn.executemany("""
+                INSERT INTO project_entries (project, kind, filename, position, data)
+                VALUES (?, ?, ?, ?, ?)
+            """, [
+                (project, kind, filename, position, json.dumps(data, ensure_ascii=False))
+                for position, (filename, data) in enumerate((entries or {}).items())
+            ])
+            revision = self._touch_project_document(conn, project, kind, header, replace_header=True)
+            self.set_project_source_mtime(project, kind, source_mtime_ns)
+            return revision
+    
+    def upsert_project_entries(self, project: str, kind: str, entries: Dict[str, Dict]) -> int:
+        """写入部分条目（新条目追加在末尾），不存在的文档自动创建，返回新 revision"""
+        with self.get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO project_entries (project, kind, filename, position, data)
+                VALUES (?, ?, ?, (SELECT coalesce(max(position), -1) + 1 FROM project_entries
+                                  WHERE project = ? AND kind = ?), ?)
+                ON CONFLICT (project, kind, filename) DO UPDATE SET data = excluded.data
+            """, [
+                (project, kind, filename, project, kind, json.dumps(data, ensure_ascii=False))
+                for filename, data in entries.items()
+            ])
+            return self._touch_project_document(conn, project, kind)
+    
+    def copy_project_document(self, project: str, source_kind: str, target_kind: str) -> int:
+        """复制文档条目到另一类型（替换目标已有条目），返回目标的新 revision"""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM project_entries WHERE project = ? AND kind = ?", (project, target_kind))
+            conn.execute("""
+                INSERT INTO project_entries (project, kind, filename, position, data)
+                SELECT project, ?, filename, position, data FROM project_entries
+                WHERE project = ? AND kind = ?
+            """, (target_kind, project, source_kind))
+            return self._touch_project_document(conn, project, target_kind)
+    
+    def set_project_source_mtime(self, project: str, kind: str, source_mtime_ns: Optional[int]):
+        """记录文档同步时对应 JSON 文件的 mtime"""
+        with self.get_connection() as conn:
+            conn.execute(
+                "UPDATE project_documents SET source_mtime_ns = ? WHERE project = ? AND kind = ?",
+                (source_mtime_ns, project, kind)
+            )
+    
+    def delete_project_document(self, project: str, kind: Optional[str] = None):
+        """删除项目文档（不指定类型时删除该项目的全部文档）"""
+        where, params = ("project = ?", (project,)) if kind is None else ("project = ? AND kind = ?", (project, kind))
+        with self.get_connection() as conn:
+            conn.execute(f"DELETE FROM project_entries WHERE {where}", params)
+            conn.execute(f"DELETE FROM project_documents WHERE {where}", params)
+    
+    def copy_project_documents_from(self, source_path: str) -> int:
+        """从另一个数据库复制项目文档（已有的文档不覆盖），返回复制的文档数"""
+        conn = self._thread_connection(readonly=False)
+        # ATTACH 不能在事务中执行，复制完成提交后再 DETACH
+        conn.execute("ATTACH DATABASE ? AS source", (os.path.abspath(source_path),))
+        try:
+            with self.get_connection():
+                cursor = conn.execute(
+                    "SELECT COUNT(*) FROM source.sqlite_master WHERE type = 'table' "
+                    "AND name IN ('project_documents', 'project_entries')"
+                )
+                if cursor.fetchone()[0] < 2:
+                    return 0
+                cursor = conn.execute("""
+                    INSERT OR IGNORE INTO project_documents
+                        (project, kind, header, revision, source_mtime_ns, updated_at)
+                    SELECT project, kind, header, revision, source_mtime_ns, updated_at
+                    FROM source.project_documents
+                """)
+                copied = cursor.rowcount
+                conn.execute("""
+                    INSERT OR IGNORE INTO project_entries (project, kind, filename, position, data)
+                    SELECT project, kind, filename, position, data FROM source.project_entries
+                """)
+                return copied
+        finally:
+            conn.execute("DETACH DATABASE source")
+    
+    def get_project_document_info(self, project: str, kind: str) -> Optional[Dict]:
+        """文档元信息 {revision, source_mtime_ns, updated_at}，不读取条目"""
+        with self.read_connection() as conn:
+            cursor = conn.execute("""
+                SELECT revision, source_mtime_ns, updated_at FROM project_documents
+                WHERE project = ? AND kind = ?
+            """, (project, kind))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def get_project_header(self, project: str, kind: str) -> Optional[Dict]:
+        """文档 header（文档不存在时为 None）"""
+        with self.read_connection() as conn:
+            cursor = conn.execute(
+                "SELECT header FROM project_documents WHERE project = ? AND kind = ?", (project, kind)
+            )
+            row = cursor.fetchone()
+            if row is None or row['header'] is None:
+                return None
+            return json.loads(row['header'])
+    
+    def get_project_entries(self, project: str, kind: str,
+                            filenames: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """文档条目 filename -> data（按原顺序；filenames 指定时只读取这些条目）"""
+        with self.read_connection() as conn:
+            if filenames is None:
+                cursor = conn.execute("""
+                    SELECT filename, data FROM project_entries
+                    WHERE project = ? AND kind = ? ORDER BY position
+                """, (project, kind))
+            else:
+                cursor = conn.execute("""
+                    SELECT filename, data FROM project_entries
+                    WHERE project = ? AND kind = ? AND filename IN (SELECT value FROM json_each(?))
+                    ORDER BY position
+                """, (project, kind, json.dumps(list(filenames), ensure_ascii=False)))
+            return {row['filename']: json.loads(row['data']) for row in cursor.fetchall()}
     
     # ==================== 查询操作 ====================
     
     def get_product(self, name: str) -> Optional[Dict]:
         """获取产品信息"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM products WHERE name = ? OR folder_name = ?", (name, name))
             row = cursor.fetchone()
@@ -421,7 +831,7 @@ class DBManager:
     
     def get_product_by_folder(self, folder_name: str) -> Optional[Dict]:
         """通过文件夹名获取产品"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM products WHERE folder_name = ?", (folder_name,))
             row = cursor.fetchone()
@@ -429,50 +839,55 @@ class DBManager:
     
     def get_all_products(self) -> List[Dict]:
         """获取所有产品"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM products ORDER BY analyzed_at DESC")
             return [dict(row) for row in cursor.fetchall()]
     
     def get_screenshots(self, product_id: int) -> List[Dict]:
-        """获取产品的所有截图"""
-        with self.get_connection() as conn:
+        """获取产品的所有截图（设计亮点、标签各一次查询，按截图分组）"""
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT * FROM screenshots WHERE product_id = ? ORDER BY idx
             """, (product_id,))
+            screenshots = [dict(row) for row in cursor.fetchall()]
             
-            screenshots = []
-            for row in cursor.fetchall():
-                screenshot = dict(row)
-                screenshot_id = screenshot['id']
-                
-                # 获取设计亮点
-                cursor.execute("""
-                    SELECT category, content_cn, content_en FROM design_highlights
-                    WHERE screenshot_id = ?
-                """, (screenshot_id,))
-                screenshot['design_highlights'] = [
+            by_id = {}
+            for screenshot in screenshots:
+                screenshot['design_highlights'] = []
+                screenshot['tags'] = []
+                by_id[screenshot['id']] = screenshot
+            
+            # 获取设计亮点
+            cursor.execute("""
+                SELECT h.screenshot_id, h.category, h.content_cn, h.content_en
+                FROM design_highlights h
+                JOIN screenshots s ON h.screenshot_id = s.id
+                WHERE s.product_id = ?
+                ORDER BY h.id
+            """, (product_id,))
+            for r in cursor.fetchall():
+                by_id[r['screenshot_id']]['design_highlights'].append(
                     {'category': r['category'], 'cn': r['content_cn'], 'en': r['content_en']}
-                    for r in cursor.fetchall()
-                ]
-                
-                # 获取标签
-                cursor.execute("""
-                    SELECT tag_cn, tag_en FROM tags WHERE screenshot_id = ?
-                """, (screenshot_id,))
-                screenshot['tags'] = [
-                    {'cn': r['tag_cn'], 'en': r['tag_en']}
-                    for r in cursor.fetchall()
-                ]
-                
-                screenshots.append(screenshot)
+                )
+            
+            # 获取标签
+            cursor.execute("""
+                SELECT t.screenshot_id, t.tag_cn, t.tag_en
+                FROM tags t
+                JOIN screenshots s ON t.screenshot_id = s.id
+                WHERE s.product_id = ?
+                ORDER BY t.id
+            """, (product_id,))
+            for r in cursor.fetchall():
+                by_id[r['screenshot_id']]['tags'].append({'cn': r['tag_cn'], 'en': r['tag_en']})
             
             return screenshots
     
     def get_video_frames(self, product_id: int) -> List[Dict]:
         """获取产品的所有视频帧"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT * FROM video_frames WHERE product_id = ? ORDER BY idx
@@ -481,7 +896,7 @@ class DBManager:
     
     def get_alignments(self, product_id: int) -> List[Dict]:
         """获取产品的所有对齐关系"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT a.*, vf.filename as frame_filename, s.filename as screenshot_filename
@@ -495,7 +910,7 @@ class DBManager:
     
     def get_flow_stages(self, product_id: int) -> List[Dict]:
         """获取产品的流程阶段"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT * FROM flow_stages WHERE product_id = ? ORDER BY order_num
@@ -518,7 +933,7 @@ class DBManager:
     
     def find_by_screen_type(self, screen_type: str) -> List[Dict]:
         """按截图类型查询"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT s.*, p.name as product_name, p.folder_name
@@ -531,7 +946,7 @@ class DBManager:
     
     def find_by_stage(self, stage: str) -> List[Dict]:
         """按Stage查询"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT s.*, p.name as product_name, p.folder_name
@@ -544,7 +959,7 @@ class DBManager:
     
     def find_by_module(self, module: str) -> List[Dict]:
         """按Module查询"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT s.*, p.name as product_name, p.folder_name
@@ -557,7 +972,7 @@ class DBManager:
     
     def find_by_paywall_position(self, position: str) -> List[Dict]:
         """按Paywall位置查询产品"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT * FROM products WHERE paywall_position = ?
@@ -566,18 +981,126 @@ class DBManager:
     
     def find_by_onboarding_length(self, length: str) -> List[Dict]:
         """按Onboarding长度查询产品"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT * FROM products WHERE onboarding_length = ?
             """, (length,))
             return [dict(row) for row in cursor.fetchall()]
     
+    # ==================== 全文搜索 ====================
+    
+    def search_screenshots(self, query: str, stage: str = None, module: str = None,
+                           screen_type: str = None, product: str = None,
+                           limit: int = 20, offset: int = 0) -> Dict:
+        """
+        全文搜索截图（命名、核心功能、产品洞察、标签、设计亮点，中英文）
+        
+        Args:
+            query: 关键词，空格分隔表示同时包含；双引号包裹表示短语
+            stage / module / screen_type: 分类筛选
+            product: 产品名或文件夹名
+            limit / offset: 分页
+            
+        Returns:
+            {'hits': [...], 'total': int}，有可索引关键词时按 BM25 相关度排序
+        """
+        terms = _search_terms(query)
+        fts_terms = [t for t in terms if len(t) >= _TRIGRAM_MIN]
+        short_terms = [t for t in terms if len(t) < _TRIGRAM_MIN]
+        
+        # 全文条件（只涉及索引表）
+        text_where = []
+        text_params = []
+        if fts_terms:
+            text_where.append("screenshots_fts MATCH ?")
+            text_params.append(_fts_query(fts_terms))
+        for term in short_terms:
+            # 过短的词无法走 trigram 索引，在索引内容上做子串匹配
+            text_where.append(f"({_FTS_TEXT}) LIKE ? ESCAPE '\\'")
+            text_params.append("%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        
+        # 分类/产品筛选
+        where = []
+        params = []
+        for column, value in (("s.stage", stage), ("s.module", module), ("s.screen_type", screen_type)):
+            if value:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if product:
+            where.append("(p.name = ? OR p.folder_name = ?)")
+            params.extend([product, product])
+        
+        if not text_where and not where:
+            return {'hits': [], 'total': 0}
+        
+        if text_where:
+            # 先在索引表中求出命中集合（含相关度），再关联截图表做筛选和排序，
+            # 避免优化器从截图表出发、对每一行重复执行全文查询
+            score = f"bm25(screenshots_fts, {', '.join(map(str, SEARCH_WEIGHTS))})" if fts_terms else "0.0"
+            source = f"""
+                WITH matched AS MATERIALIZED (
+                    SELECT rowid AS id, {score} AS score FROM screenshots_fts
+                    WHERE {' AND '.join(text_where)}
+                )
+                SELECT {{columns}}, matched.score AS score
+                FROM matched
+                JOIN screenshots s ON s.id = matched.id
+                JOIN products p ON p.id = s.product_id
+            """
+            params = text_params + params
+            order = "matched.score, p.name, s.idx"
+        else:
+            source = """
+                SELECT {columns}, NULL AS score
+                FROM screenshots s
+                JOIN products p ON p.id = s.product_id
+            """
+            order = "p.name, s.idx"
+        if where:
+            source += " WHERE " + " AND ".join(where)
+        
+        columns = """s.id, s.product_id, p.name AS product_name, p.folder_name,
+                     s.idx, s.filename, s.screen_type, s.stage, s.module, s.feature,
+                     s.naming_cn, s.naming_en, s.core_function_cn, s.core_function_en,
+                     COUNT(*) OVER () AS total"""
+        
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(source.format(columns=columns) + f" ORDER BY {order} LIMIT ? OFFSET ?",
+                           (*params, limit, offset))
+            hits = [dict(row) for row in cursor.fetchall()]
+            
+            if hits:
+                total = hits[0]['total']
+            elif offset:
+                cursor.execute("SELECT COUNT(*) FROM (" + source.format(columns="s.id") + ")", params)
+                total = cursor.fetchone()[0]
+            else:
+                total = 0
+            
+            # 只为当前页生成摘要片段
+            snippets = {}
+            if hits and fts_terms:
+                ids = [h['id'] for h in hits]
+                cursor.execute(f"""
+                    SELECT rowid, snippet(screenshots_fts, -1, '<mark>', '</mark>', '…', 16)
+                    FROM screenshots_fts
+                    WHERE screenshots_fts MATCH ? AND rowid IN ({', '.join('?' * len(ids))})
+                """, (_fts_query(fts_terms), *ids))
+                snippets = dict(cursor.fetchall())
+        
+        for hit in hits:
+            del hit['total']
+            hit['snippet'] = snippets.get(hit['id'])
+        
+        return {'hits': hits, 'total': total}
+    
     # ==================== 聚合统计 ====================
     
     def get_screen_type_stats(self) -> Dict[str, int]:
         """获取截图类型统计"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT screen_type, COUNT(*) as count
@@ -589,7 +1112,7 @@ class DBManager:
     
     def get_stage_stats(self) -> Dict[str, int]:
         """获取Stage统计"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT stage, COUNT(*) as count
@@ -602,7 +1125,7 @@ class DBManager:
     
     def get_module_stats(self) -> Dict[str, int]:
         """获取Module统计"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT module, COUNT(*) as count
@@ -615,7 +1138,7 @@ class DBManager:
     
     def get_onboarding_stats(self) -> Dict:
         """获取Onboarding统计"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             
             # 各产品Onboarding截图数（使用新的stage字段）
@@ -655,7 +1178,7 @@ class DBManager:
     
     def get_paywall_stats(self) -> Dict:
         """获取Paywall统计"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             
             # Paywall位置分布
@@ -684,7 +1207,7 @@ class DBManager:
     
     def get_design_patterns(self, limit: int = 20) -> List[Dict]:
         """获取设计亮点出现频率"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT content_cn, category, COUNT(*) as count
@@ -744,7 +1267,7 @@ class DBManager:
         if not product:
             return {}
         
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT filename, screen_type FROM screenshots WHERE product_id = ?
@@ -757,7 +1280,7 @@ class DBManager:
         if not product:
             return {}
         
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT filename, stage, module, feature, role FROM screenshots WHERE product_id = ?
@@ -12,10 +12,10 @@ from datetime import datetime
 
 sys.stdout.reconfigure(encoding='utf-8')
 
-# 添加父目录到路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 添加当前目录到路径（db_manager 与本脚本同目录）
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from data.db_manager import DBManager, DB_PATH
+from db_manager import DBManager, DB_PATH
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PROJECTS_DIR = os.path.join(BASE_DIR, "projects")
@@ -121,13 +121,9 @@ def migrate_project(db: DBManager, project_folder: str, mapping: dict) -> bool:
         'model': data.get('model')
     }
     
-    # 保存产品
-    product_id = db.save_product(product_data)
-    print(f"  [OK] Product saved (ID: {product_id})")
-    
-    # 保存截图（含三层分类转换）
+    # 截图（含三层分类转换）
     results = data.get('results', {})
-    screenshot_count = 0
+    screenshots = []
     conversion_stats = {"converted": 0, "skipped": 0}
     
     for filename, screenshot_data in results.items():
@@ -146,15 +142,14 @@ def migrate_project(db: DBManager, project_folder: str, mapping: dict) -> bool:
         else:
             conversion_stats["skipped"] += 1
         
-        db.save_screenshot(product_id, screenshot_data)
-        screenshot_count += 1
+        screenshots.append(screenshot_data)
     
-    print(f"  [OK] {screenshot_count} screenshots saved (converted: {conversion_stats['converted']}, skipped: {conversion_stats['skipped']})")
-    
-    # 保存流程阶段
+    # 产品、截图、流程阶段在一个事务中批量写入
     stages = flow_structure.get('stages', [])
+    product_id = db.save_product_bundle(product_data, screenshots, stages)
+    print(f"  [OK] Product saved (ID: {product_id})")
+    print(f"  [OK] {len(screenshots)} screenshots saved (converted: {conversion_stats['converted']}, skipped: {conversion_stats['skipped']})")
     if stages:
-        db.save_flow_stages(product_id, stages)
         print(f"  [OK] {len(stages)} flow stages saved")
     
     return True
@@ -171,9 +166,14 @@ def migrate_all():
     print(f"\n[INFO] Loaded screen_type mapping with {len(mapping)} entries")
     
     # 备份现有数据库（如果存在）
+    # 项目文档（分类、Onboarding 范围等）在单独的 project_store.db 中，不随之移走
     if os.path.exists(DB_PATH):
         backup_path = DB_PATH + f".backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         os.rename(DB_PATH, backup_path)
+        # WAL 模式的附属文件一起移走，避免被新数据库误用
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(DB_PATH + suffix):
+                os.rename(DB_PATH + suffix, backup_path + suffix)
         print(f"\n[BACKUP] Existing database backed up to {backup_path}")
     
     # 创建新数据库
@@ -227,6 +227,7 @@ def migrate_all():
         print(f"  {t}: {count}")
     
     print(f"\n[RESULT] Success: {success_count}, Failed: {fail_count}")
+    db.close()
     print(f"[OK] Database saved to {DB_PATH}")
 
 
@@ -18,6 +18,9 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from openai import OpenAI
 from anthropic import Anthropic
 
+from app.services.vision_cache import vision_cache, request_hash, sha256_bytes
+from app.services.image_preprocess import image_preprocessor
+
 # ============================================================================
 # 配置
 # ============================================================================
@@ -333,17 +336,23 @@ class StoreAnalysisService:
             }
         }
     
-    async def analyze_with_opus(self, image_base64: str, position: str, media_type: str = "image/png") -> dict:
-        """使用 Claude Opus 4.5 进行 5 层分析"""
+    async def analyze_with_opus(
+        self,
+        image_base64: str,
+        position: str,
+        media_type: str = "image/png",
+        image_sha256: Optional[str] = None,
+    ) -> dict:
+        """使用 Claude Opus 4.5 进行 5 层分析（按图片内容 + prompt 缓存）"""
         if not self.anthropic_client:
             raise ValueError("Anthropic API key not configured")
         
+        model = "claude-opus-4-5-20251101"
         prompt = STORE_ANALYSIS_PROMPT.format(position=position)
-        
-        response = self.anthropic_client.messages.create(
-            model="claude-opus-4-5-20251101",
-            max_tokens=4000,
-            messages=[
+        request = {
+            "model": model,
+            "max_tokens": 4000,
+            "messages": [
                 {
                     "role": "user",
                     "content": [
@@ -362,21 +371,38 @@ class StoreAnalysisService:
                     ]
                 }
             ]
-        )
+        }
+        # 缓存键取自实际发送的参数，修改 max_tokens 等参数时缓存自动失效
+        digest = request_hash(request)
+        if image_sha256:
+            cached = vision_cache.get(image_sha256, model, digest)
+            if cached:
+                return self._parse_json_response(cached.raw)
+        
+        response = self.anthropic_client.messages.create(**request)
         
         content = response.content[0].text
-        return self._parse_json_response(content)
+        analysis = self._parse_json_response(content)
+        if image_sha256:
+            vision_cache.put(image_sha256, model, digest, content, analysis)
+        return analysis
     
-    async def analyze_with_gpt52(self, image_base64: str, position: str, media_type: str = "image/png") -> dict:
-        """使用 GPT-5.2 进行 5 层分析"""
+    async def analyze_with_gpt52(
+        self,
+        image_base64: str,
+        position: str,
+        media_type: str = "image/png",
+        image_sha256: Optional[str] = None,
+    ) -> dict:
+        """使用 GPT-5.2 进行 5 层分析（按图片内容 + prompt 缓存）"""
         if not self.openai_client:
             raise ValueError("OpenAI API key not configured")
         
+        model = "gpt-5.2"
         prompt = STORE_ANALYSIS_PROMPT.format(position=position)
-        
-        response = self.openai_client.chat.completions.create(
-            model="gpt-5.2",
-            messages=[
+        request = {
+            "model": model,
+            "messages": [
                 {
                     "role": "user",
                     "content": [
@@ -394,12 +420,22 @@ class StoreAnalysisService:
                     ]
                 }
             ],
-            max_completion_tokens=4000,
-            temperature=0.2
-        )
+            "max_completion_tokens": 4000,
+            "temperature": 0.2
+        }
+        digest = request_hash(request)
+        if image_sha256:
+            cached = vision_cache.get(image_sha256, model, digest)
+            if cached:
+                return self._parse_json_response(cached.raw)
+        
+        response = self.openai_client.chat.completions.create(**request)
         
         content = response.choices[0].message.content
-        return self._parse_json_response(content)
+        analysis = self._parse_json_response(content)
+        if image_sha256:
+            vision_cache.put(image_sha256, model, digest, content, analysis)
+        return analysis
     
     async def analyze_screenshot(self, image_path: Path, index: int) -> dict:
         """
@@ -407,8 +443,11 @@ class StoreAnalysisService:
         优先使用 Opus 4.5，如果失败则使用 GPT-5.2
         """
         position = f"P{index}"
-        media_type = self._get_media_type(image_path.name)
-        image_base64 = self._load_image_base64(image_path)
+        # 商店宣传图是完整设计稿，不裁剪，只缩放和重新编码
+        prepared = image_preprocessor.prepare(image_path, crop=False)
+        media_type = prepared.media_type
+        image_base64 = base64.b64encode(prepared.data).decode("utf-8")
+        image_sha256 = sha256_bytes(prepared.data)
         
         analysis = None
         model_used = None
@@ -416,7 +455,7 @@ class StoreAnalysisService:
         # 优先使用 Opus 4.5
         if self.anthropic_client:
             try:
-                analysis = await self.analyze_with_opus(image_base64, position, media_type)
+                analysis = await self.analyze_with_opus(image_base64, position, media_type, image_sha256)
                 model_used = "claude-opus-4-5-20251101"
             except Exception as e:
                 print(f"  [WARN] Opus failed: {e}")
@@ -424,7 +463,7 @@ class StoreAnalysisService:
         # 备选 GPT-5.2
         if analysis is None and self.openai_client:
             try:
-                analysis = await self.analyze_with_gpt52(image_base64, position, media_type)
+                analysis = await self.analyze_with_gpt52(image_base64, position, media_type, image_sha256)
                 model_used = "gpt-5.2"
             except Exception as e:
                 print(f"  [WARN] GPT-5.2 failed: {e}")
@@ -680,8 +719,14 @@ async def main():
             print("  [WAIT] 5 seconds...")
             await asyncio.sleep(5)
     
+    stats = image_preprocessor.stats.to_dict()
     print("\n" + "=" * 60)
     print("[DONE] Analysis complete!")
+    print(
+        f"[PREPROCESS] {stats['images']} images, "
+        f"{stats['bytes_original'] / 1024 / 1024:.1f}MB -> {stats['bytes_sent'] / 1024 / 1024:.1f}MB "
+        f"(saved {stats['bytes_saved'] / 1024 / 1024:.1f}MB)"
+    )
     print("=" * 60)
 
 
@@ -7,17 +7,32 @@ Batch Screenshot Analyzer - 批量分析截图
 2. 运行: python batch_analyze.py
 
 注意: 此脚本将分析 828 张截图，预计需要 3-5 小时
+
+批量模式（Message Batches API，提交后即可退出，通常 24 小时内完成，费用减半）:
+   python batch_analyze.py --batch submit    # 打包提交
+   python batch_analyze.py --batch status    # 查询进度
+   python batch_analyze.py --batch collect   # 收集结果，写入同样的输出文件
+   加 --local 使用本地文件模拟批处理（离线测试）
 """
 
 import os
+import sys
 import json
 import base64
 import time
+import argparse
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import anthropic
 
+# 添加项目根目录到路径（共用 app 的批处理、预处理和结果缓存）
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.image_preprocess import image_preprocessor
+from app.services.vision_batch import AnthropicBatchProvider, BatchRequest, BatchRun, LocalBatchProvider, wait_for
+from app.services.vision_cache import request_hash, sha256_bytes
+
 # 配置
 BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "data"
@@ -31,11 +46,6 @@ def load_queue() -> dict:
     with open(queue_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-# 图像转 base64
-def image_to_base64(image_path: Path) -> str:
-    with open(image_path, "rb") as f:
-        return base64.standard_b64encode(f.read()).decode("utf-8")
-
 SYSTEM_PROMPT = """你是一个专业的移动应用UX分析师。请分析这张健康App的Onboarding截图。
 
 输出JSON格式（严格遵守）：
@@ -78,20 +88,24 @@ SYSTEM_PROMPT = """你是一个专业的移动应用UX分析师。请分析这
 
 只输出JSON，不要其他文字。"""
 
-def analyze_screenshot(client: anthropic.Anthropic, image_path: Path, app_name: str, index: int, total: int) -> dict:
-    """分析单张截图"""
-    image_base64 = image_to_base64(image_path)
+MODEL = "claude-sonnet-4-20250514"  # 使用 Claude Sonnet 4 进行批量分析
+
+
+def build_request(image_path: Path, app_name: str, index: int, total: int) -> BatchRequest:
+    """单张截图的请求参数（同步调用和批量提交共用）"""
+    prepared = image_preprocessor.prepare(image_path)
+    image_base64 = base64.standard_b64encode(prepared.data).decode("utf-8")
     position_pct = round((index / total) * 100, 1)
     
     user_prompt = f"""分析这张 {app_name} App 的 Onboarding 截图。
 截图序号：第 {index} 张（共 {total} 张）
 流程位置：{position_pct}%"""
     
-    response = client.messages.create(
-        model="claude-sonnet-4-20250514",  # 使用 Claude Sonnet 4 进行批量分析
-        max_tokens=1500,
-        system=SYSTEM_PROMPT,
-        messages=[
+    body = {
+        "model": MODEL,
+        "max_tokens": 1500,
+        "system": SYSTEM_PROMPT,
+        "messages": [
             {
                 "role": "user",
                 "content": [
@@ -99,7 +113,7 @@ def analyze_screenshot(client: anthropic.Anthropic, image_path: Path, app_name:
                         "type": "image",
                         "source": {
                             "type": "base64",
-                            "media_type": "image/png",
+                            "media_type": prepared.media_type,
                             "data": image_base64
                         }
                     },
@@ -110,19 +124,23 @@ def analyze_screenshot(client: anthropic.Anthropic, image_path: Path, app_name:
                 ]
             }
         ]
-    )
-    
-    result_text = response.content[0].text
-    
-    # 解析JSON
+    }
+    return BatchRequest("anthropic", MODEL, body, (sha256_bytes(prepared.data), MODEL, request_hash(body)))
+
+
+def parse_output(result_text: str) -> dict:
+    """解析JSON"""
     if "```json" in result_text:
         result_text = result_text.split("```json")[1].split("```")[0]
     elif "```" in result_text:
         result_text = result_text.split("```")[1].split("```")[0]
     
-    result = json.loads(result_text.strip())
-    
-    # 添加元数据
+    return json.loads(result_text.strip())
+
+
+def add_metadata(result: dict, image_path: Path, app_name: str, index: int, total: int) -> dict:
+    """添加元数据"""
+    position_pct = round((index / total) * 100, 1)
     result["app_name"] = app_name
     result["screenshot_index"] = index
     result["screenshot_filename"] = image_path.name
@@ -133,6 +151,14 @@ def analyze_screenshot(client: anthropic.Anthropic, image_path: Path, app_name:
     
     return result
 
+
+def analyze_screenshot(client: anthropic.Anthropic, image_path: Path, app_name: str, index: int, total: int) -> dict:
+    """分析单张截图"""
+    request = build_request(image_path, app_name, index, total)
+    response = client.messages.create(**request.body)
+    result = parse_output(response.content[0].text)
+    return add_metadata(result, image_path, app_name, index, total)
+
 def analyze_app(client: anthropic.Anthropic, app_info: dict) -> List[dict]:
     """分析单个App的所有截图"""
     app_name = app_info["name"]
@@ -185,6 +211,14 @@ def analyze_app(client: anthropic.Anthropic, app_info: dict) -> List[dict]:
             continue
     
     # 保存App汇总
+    save_app_summary(app_output_dir, app_name, results)
+    
+    print(f"  完成: {len(results)}/{total} 张")
+    
+    return results
+
+def save_app_summary(app_output_dir: Path, app_name: str, results: List[dict]):
+    """保存App汇总"""
     summary_file = app_output_dir / "summary.json"
     with open(summary_file, "w", encoding="utf-8") as f:
         json.dump({
@@ -193,18 +227,127 @@ def analyze_app(client: anthropic.Anthropic, app_info: dict) -> List[dict]:
             "analyzed_at": datetime.now().isoformat(),
             "results": results
         }, f, ensure_ascii=False, indent=2)
+
+def save_all_results(all_results: Dict[str, List[dict]]) -> Path:
+    """保存全部结果"""
+    all_results_file = OUTPUT_DIR / "all_results.json"
+    with open(all_results_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "total_apps": len(all_results),
+            "total_screenshots": sum(len(r) for r in all_results.values()),
+            "analyzed_at": datetime.now().isoformat(),
+            "apps": all_results
+        }, f, ensure_ascii=False, indent=2)
+    return all_results_file
+
+def iter_screens(app_info: dict):
+    """App 的 Onboarding 截图：(序号, 截图路径, 单张结果文件, 总数)"""
+    app_name = app_info["name"]
+    start = app_info["onboarding_range"]["start"]
+    end = app_info["onboarding_range"]["end"]
+    total = end - start + 1
+    for i in range(start, end + 1):
+        yield i + 1, DOWNLOADS_DIR / app_name / f"{i+1:04d}.png", OUTPUT_DIR / app_name / f"{i+1:04d}_analysis.json", total
+
+def batch_providers(run: BatchRun) -> dict:
+    """按运行记录中的 local 标记创建（status / collect 时不必再传 --local）"""
+    if run.manifest["info"].get("local"):
+        return {"anthropic": LocalBatchProvider("anthropic")}
+    return {"anthropic": AnthropicBatchProvider(anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY")))}
+
+def submit_batch(queue: dict, local: bool = False) -> BatchRun:
+    """把队列中尚未分析的截图打包成 Message Batch 提交"""
+    run = BatchRun.create({"script": "batch_analyze", "local": local})
+    for app_info in queue["apps"]:
+        for index, image_path, result_file, total in iter_screens(app_info):
+            if not image_path.exists() or result_file.exists():
+                continue
+            entry = run.add_entry({"app": app_info["name"], "index": index, "total": total})
+            run.add_request(entry, "analysis", build_request(image_path, app_info["name"], index, total))
     
-    print(f"  完成: {len(results)}/{total} 张")
+    batches = run.submit(batch_providers(run))
+    summary = run.summary()
+    print(f"批次 {run.run_id}: {summary['requests']} 个请求，{summary['cached']} 个命中缓存，提交 {len(batches)} 个批次")
+    print(f"稍后运行: python batch_analyze.py --batch collect --run {run.run_id}")
+    return run
+
+def collect_batch(queue: dict, run_id: Optional[str] = None,
+                  wait: bool = False, poll_interval: float = 300) -> bool:
+    """收集批处理结果：写入单张结果文件，并重建 App 汇总和全部结果"""
+    run = BatchRun.load(run_id)
+    providers = batch_providers(run)
     
-    return results
+    if wait:
+        wait_for(run, providers, poll_interval)
+    elif not run.refresh(providers)["complete"]:
+        print(f"批次 {run.run_id} 尚未完成: {run.summary()['batches']}")
+        return False
+    
+    failed = 0
+    for outcome in run.collect(providers, {"analysis": parse_output}):
+        app_name, index, total = outcome.meta["app"], outcome.meta["index"], outcome.meta["total"]
+        if outcome.errors:
+            failed += 1
+            print(f"  ✗ {app_name} #{index}: {outcome.errors['analysis']}")
+            continue
+        image_path = DOWNLOADS_DIR / app_name / f"{index:04d}.png"
+        result = add_metadata(outcome.results["analysis"], image_path, app_name, index, total)
+        result["analysis_method"] = "claude_sonnet_4_batch"
+        result_file = OUTPUT_DIR / app_name / f"{index:04d}_analysis.json"
+        result_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    
+    # 汇总（包括之前已有的单张结果；截图已不存在的跳过，损坏的结果文件记为失败）
+    all_results = {}
+    for app_info in queue["apps"]:
+        results = []
+        for _, image_path, result_file, _ in iter_screens(app_info):
+            if not image_path.exists() or not result_file.exists():
+                continue
+            try:
+                with open(result_file, "r", encoding="utf-8") as f:
+                    results.append(json.load(f))
+            except (json.JSONDecodeError, OSError) as e:
+                failed += 1
+                print(f"  [WARN] 跳过损坏的结果文件 {result_file}: {e}")
+        if results:
+            save_app_summary(OUTPUT_DIR / app_info["name"], app_info["name"], results)
+        all_results[app_info["name"]] = results
+    
+    all_results_file = save_all_results(all_results)
+    print(f"收集完成: 失败 {failed}，结果保存到: {all_results_file}")
+    return True
 
 def main():
+    parser = argparse.ArgumentParser(description="Onboarding Screenshot Batch Analyzer")
+    parser.add_argument("--batch", choices=["submit", "status", "collect"], default=None,
+                        help="批量模式: submit=打包提交后退出, status=查询进度, collect=收集结果")
+    parser.add_argument("--run", type=str, default=None, help="批次运行 ID（默认最近一次）")
+    parser.add_argument("--wait", action="store_true", help="collect 时轮询等待批次完成")
+    parser.add_argument("--poll-interval", type=float, default=300, help="轮询间隔（秒）")
+    parser.add_argument("--local", action="store_true", help="使用本地文件模拟批处理（离线测试，submit 时指定）")
+    args = parser.parse_args()
+    
+    # status / collect 按提交时记录的 local 标记选择 Provider
+    if args.batch == "status":
+        run = BatchRun.load(args.run)
+        print(json.dumps(run.refresh(batch_providers(run)), ensure_ascii=False, indent=2))
+        return
+    if args.batch == "collect":
+        collect_batch(load_queue(), args.run, args.wait, args.poll_interval)
+        return
+    
     # 检查API Key
     api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
+    if not api_key and not args.local:
         print("错误: 请设置 ANTHROPIC_API_KEY 环境变量")
         return
     
+    if args.batch == "submit":
+        submit_batch(load_queue(), args.local)
+        return
+    
     # 初始化客户端
     client = anthropic.Anthropic(api_key=api_key)
     
@@ -230,14 +373,7 @@ def main():
         total_analyzed += len(results)
     
     # 保存全部结果
-    all_results_file = OUTPUT_DIR / "all_results.json"
-    with open(all_results_file, "w", encoding="utf-8") as f:
-        json.dump({
-            "total_apps": len(all_results),
-            "total_screenshots": total_analyzed,
-            "analyzed_at": datetime.now().isoformat(),
-            "apps": all_results
-        }, f, ensure_ascii=False, indent=2)
+    all_results_file = save_all_results(all_results)
     
     print("\n" + "="*60)
     print("分析完成!")
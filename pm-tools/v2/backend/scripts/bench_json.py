@@ -0,0 +1,147 @@
+"""
+JSON 序列化基准
+对比热点接口的几种序列化方式：
+- stdlib：jsonable_encoder + json.dumps（FastAPI 默认 JSONResponse 的路径）
+- fast：app.services.fast_json.dumps（orjson）
+- cached：按版本缓存的序列化结果（命中时只是一次字典查找）
+- model：pydantic 模型经 response_model 校验后输出 vs model_response 直接输出
+
+用法:
+    python scripts/bench_json.py
+    python scripts/bench_json.py --repeat 50 --project downloads_2024/Calm
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.models.project import ProjectListResponse
+from app.models.screenshot import ScreenshotListResponse
+from app.routers.analysis import _build_compare_all_apps
+from app.routers.store import _load_all_store_analysis_v2
+from app.config import settings
+from app.services.fast_json import BACKEND, dumps
+from app.services.project_service import get_all_projects
+from app.services.screenshot_service import get_project_manifest
+from app.services.swimlane_aggregate import swimlane_aggregate
+
+
+def stdlib_dumps(content) -> bytes:
+    """FastAPI 默认路径：jsonable_encoder + JSONResponse.render"""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def timeit(func, repeat: int) -> float:
+    """平均耗时（毫秒）"""
+    func()  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def store_analysis_payload() -> dict:
+    downloads = settings.downloads_2024_dir
+    apps = []
+    if downloads.exists():
+        for app_dir in sorted(downloads.iterdir()):
+            v2_file = app_dir / "store_analysis_v2.json"
+            if app_dir.is_dir() and "_backup_" not in app_dir.name and v2_file.exists():
+                apps.append((app_dir.name, str(v2_file), str(app_dir / "store_info.json")))
+    return _load_all_store_analysis_v2(apps)
+
+
+def screenshots_payload(project_name: str = None):
+    if project_name is None:
+        project_name = next((p.name for p in get_all_projects() if p.screen_count), None)
+    manifest = get_project_manifest(project_name) if project_name else None
+    if not manifest:
+        return None
+    return ScreenshotListResponse(
+        project=project_name,
+        screenshots=manifest.screenshots,
+        total=len(manifest.screenshots),
+        stages=manifest.stages,
+        modules=manifest.modules,
+    )
+
+
+def bench_dict(name: str, payload, repeat: int):
+    stdlib_body = stdlib_dumps(payload)
+    fast_body = dumps(payload)
+    assert json.loads(stdlib_body) == json.loads(fast_body), f"{name}: 序列化结果不一致"
+
+    cache = {"v1": fast_body}
+    stdlib_ms = timeit(lambda: stdlib_dumps(payload), repeat)
+    fast_ms = timeit(lambda: dumps(payload), repeat)
+    cached_ms = timeit(lambda: cache["v1"], repeat)
+    print(
+        f"{name:<28} {len(fast_body) / 1024:>9.1f} KB  "
+        f"stdlib {stdlib_ms:>8.2f} ms  {BACKEND} {fast_ms:>7.2f} ms ({stdlib_ms / fast_ms:>5.1f}x)  "
+        f"cached {cached_ms * 1000:>6.2f} µs"
+    )
+
+
+def bench_model(name: str, model, repeat: int):
+    """response_model 路径：校验返回值 + 转为 JSON 兼容对象 + 渲染"""
+    adapter = TypeAdapter(type(model))
+
+    def via_response_model():
+        validated = adapter.validate_python(model, from_attributes=True)
+        return stdlib_dumps(adapter.dump_python(validated, mode="json"))
+
+    def via_model_response():
+        return model.model_dump_json().encode("utf-8")
+
+    assert json.loads(via_response_model()) == json.loads(via_model_response()), f"{name}: 序列化结果不一致"
+
+    slow_ms = timeit(via_response_model, repeat)
+    fast_ms = timeit(via_model_response, repeat)
+    print(
+        f"{name:<28} {len(via_model_response()) / 1024:>9.1f} KB  "
+        f"response_model {slow_ms:>8.2f} ms  model_response {fast_ms:>7.2f} ms ({slow_ms / fast_ms:>5.1f}x)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 序列化基准")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数")
+    parser.add_argument("--project", help="project-screenshots 使用的项目（默认第一个有截图的项目）")
+    args = parser.parse_args()
+
+    print(f"JSON backend: {BACKEND}\n")
+
+    swimlane_aggregate.refresh()
+    bench_dict("/analysis/compare", _build_compare_all_apps(swimlane_aggregate.snapshot()), args.repeat)
+    bench_dict("/store-analysis-v2-all", store_analysis_payload(), args.repeat)
+
+    projects = get_all_projects()
+    bench_model(
+        "/projects",
+        ProjectListResponse(projects=projects, total=len(projects), stats={}),
+        args.repeat,
+    )
+
+    screenshots = screenshots_payload(args.project)
+    if screenshots is not None:
+        bench_model("/project-screenshots", screenshots, args.repeat)
+        bench_dict("/project-screenshots (dict)", screenshots, args.repeat)
+    else:
+        print("/project-screenshots          跳过：没有可用的项目")
+
+
+if __name__ == "__main__":
+    main()
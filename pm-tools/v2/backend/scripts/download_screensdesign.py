@@ -18,6 +18,8 @@ from urllib.parse import urljoin, urlparse
 # 添加项目路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app.services.atomic_file import write_bytes_atomic
+
 try:
     from playwright.sync_api import sync_playwright
 except ImportError:
@@ -42,8 +44,8 @@ def download_image(url: str, save_path: Path, headers: dict = None):
         response = requests.get(url, headers=headers, timeout=30)
         response.raise_for_status()
         
-        with open(save_path, "wb") as f:
-            f.write(response.content)
+        # 整体替换而不是原地改写：已有截图可能是 blob 存储的硬链接
+        write_bytes_atomic(save_path, response.content)
         
         return True
     except Exception as e:
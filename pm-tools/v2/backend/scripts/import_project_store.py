@@ -0,0 +1,69 @@
+"""
+项目数据一次性导入 SQLite
+把各项目目录下的 classification.json / ai_analysis.json / onboarding_range.json
+导入 settings.project_store_path（DBManager 的 project_documents / project_entries 表）。
+
+切换步骤：
+1. python scripts/import_project_store.py
+2. PM_TOOL_STORAGE_BACKEND=dual 运行一段时间（读 SQLite，同时写 JSON，外部脚本改动的文件自动重新导入）
+3. 确认无误后改为 PM_TOOL_STORAGE_BACKEND=sqlite
+
+用法:
+    python scripts/import_project_store.py
+    python scripts/import_project_store.py --force        # 已导入的文档也重新导入
+    python scripts/import_project_store.py --verify       # 导入后逐个比对 JSON 文件与 SQLite 内容
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.services.project_store import DOCUMENT_FILES, SqliteProjectStore, iter_project_names
+
+
+def verify(store: SqliteProjectStore) -> int:
+    """比对 JSON 文件与 SQLite 内容，返回不一致的文档数"""
+    mismatches = 0
+    for project in iter_project_names():
+        for kind in DOCUMENT_FILES:
+            expected = store.json_store.read_document(project, kind)
+            if expected is not None and store.load_document(project, kind) != expected:
+                print(f"  ✗ {project}/{DOCUMENT_FILES[kind]}")
+                mismatches += 1
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="项目数据导入 SQLite")
+    parser.add_argument("--force", action="store_true", help="已导入的文档也重新导入")
+    parser.add_argument("--verify", action="store_true", help="导入后比对 JSON 文件与 SQLite 内容")
+    args = parser.parse_args()
+
+    # dual_write：比对时如果 JSON 文件在导入后被修改，会自动重新导入
+    store = SqliteProjectStore(settings.project_store_path, dual_write=True, legacy_path=settings.database_path)
+    print(f"数据库: {store.db_path}")
+
+    start = time.perf_counter()
+    counts = store.import_all(force=args.force)
+    elapsed = time.perf_counter() - start
+
+    for kind, count in counts.items():
+        print(f"  {DOCUMENT_FILES[kind]:<24} {count:>5} 个")
+    print(f"导入完成，耗时 {elapsed:.2f}s")
+
+    exit_code = 0
+    if args.verify:
+        mismatches = verify(store)
+        print("比对通过" if not mismatches else f"比对失败：{mismatches} 个文档不一致")
+        exit_code = 1 if mismatches else 0
+
+    store.db.close()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
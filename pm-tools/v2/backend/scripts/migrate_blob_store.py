@@ -0,0 +1,87 @@
+"""
+截图目录迁移到内容寻址 Blob 存储（原地转换）
+遍历 downloads_2024/<App>、projects/<项目>/Screens，把每张截图替换为指向 {data_dir}/blobs 中
+只读 blob 的硬链接，重复内容只保留一份（包括 *_backup_* 和 deleted/<批次>）。
+每个目录写入清单 .blobs.json。已转换的文件按 inode 识别，重复运行不会重新计算哈希。
+
+注意：硬链接共享 blob 的修改时间，迁移前记录的排序备份（sort_apply_*.json）撤销时可能报指纹不一致。
+
+用法:
+    python scripts/migrate_blob_store.py
+    python scripts/migrate_blob_store.py --dry-run      # 只统计重复，不改动任何文件
+    python scripts/migrate_blob_store.py --private-snapshots  # 备份和回收站保持独立副本，只记录清单
+    python scripts/migrate_blob_store.py --verify       # 按当前目录校正清单并校验每个文件的哈希
+    python scripts/migrate_blob_store.py --gc           # 删除没有任何引用的 blob（可加 --dry-run）
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.blob_store import blob_store, image_directories, is_snapshot_directory
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+def migrate(dry_run: bool, private_snapshots: bool = False):
+    totals = {"files": 0, "bytes": 0, "freed": 0, "unlinked": 0}
+    digests: dict[str, int] = {}
+    start = time.perf_counter()
+    for directory in image_directories():
+        private = private_snapshots and is_snapshot_directory(directory)
+        stats = blob_store.index_directory(directory, link=not private, write=not dry_run)
+        if not stats["files"]:
+            continue
+        for key in totals:
+            totals[key] += stats[key]
+        if not private:
+            digests.update(stats["digests"])
+        label = "（快照，不链接）" if private else f"释放 {_mb(stats['freed'])}"
+        print(f"  {directory.relative_to(blob_store.root.parent)}: {stats['files']} 张, {label}")
+
+    # 去重后链接目录的实际占用（按唯一内容统计）
+    unique = sum(digests.values())
+    print(f"截图 {totals['files']} 张，共 {_mb(totals['bytes'])}；可链接目录唯一内容 {len(digests)} 个，{_mb(unique)}")
+    if dry_run:
+        print("未改动任何文件")
+    else:
+        print(f"本次释放 {_mb(totals['freed'])}，独立副本 {totals['unlinked']} 张")
+    print(f"耗时 {time.perf_counter() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="截图目录迁移到 Blob 存储")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不改动任何文件")
+    parser.add_argument("--verify", action="store_true", help="按当前目录校正清单并校验每个文件的哈希")
+    parser.add_argument("--private-snapshots", action="store_true",
+                        help="备份（*_backup_*）和回收站（deleted/<批次>）保持独立副本，不链接")
+    parser.add_argument("--gc", action="store_true", help="删除没有任何引用的 blob")
+    args = parser.parse_args()
+
+    print(f"Blob 存储: {blob_store.root}")
+    exit_code = 0
+
+    if args.verify:
+        report = blob_store.verify(image_directories(), refresh=not args.dry_run)
+        for path in report["corrupted"]:
+            print(f"  ✗ 损坏 {path}")
+        problems = len(report["corrupted"])
+        print(f"校验 {report['checked']} 张（清单中已移除 {report['stale']} 条过期记录）："
+              + ("全部通过" if not problems else f"{problems} 张异常"))
+        exit_code = 1 if problems else 0
+    elif args.gc:
+        result = blob_store.gc(dry_run=args.dry_run)
+        print(f"{'可删除' if args.dry_run else '已删除'} {result['removed']} 个 blob，{_mb(result['freed'])}")
+    else:
+        migrate(args.dry_run, args.private_snapshots)
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
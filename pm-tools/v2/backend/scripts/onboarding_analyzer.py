@@ -12,9 +12,16 @@ Onboarding Screenshot Analyzer
    python onboarding_analyzer.py --plan B  # Claude Opus 4.5
    python onboarding_analyzer.py --plan C  # 双模型协作
    python onboarding_analyzer.py --plan ALL  # 三种方案都运行
+
+3. 批量模式（Provider 批处理 API，适合上千张截图的夜间任务）：
+   python onboarding_analyzer.py --plan ALL --batch submit   # 打包提交后退出
+   python onboarding_analyzer.py --batch status              # 查询进度
+   python onboarding_analyzer.py --plan ALL --batch collect  # 完成后收集，写入同样的输出文件
+   加 --local 使用本地文件模拟批处理（离线测试）
 """
 
 import os
+import sys
 import json
 import base64
 import asyncio
@@ -24,6 +31,20 @@ from datetime import datetime
 from typing import Optional, Dict, Any, List
 import time
 
+# 添加项目根目录到路径（共用 app 的模型输出缓存）
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.vision_cache import vision_cache, request_hash, sha256_bytes
+from app.services.image_preprocess import image_preprocessor
+from app.services.vision_batch import (
+    AnthropicBatchProvider,
+    BatchRequest,
+    BatchRun,
+    LocalBatchProvider,
+    OpenAIBatchProvider,
+    wait_for,
+)
+
 # API clients
 try:
     from openai import OpenAI
@@ -54,10 +75,15 @@ def load_analysis_queue() -> dict:
     with open(queue_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-# 图像转 base64
-def image_to_base64(image_path: Path) -> str:
-    with open(image_path, "rb") as f:
-        return base64.standard_b64encode(f.read()).decode("utf-8")
+# 图像预处理（裁剪状态栏/外框、缩放、重新编码）后转 base64
+def load_image(image_path: Path) -> tuple[str, str, str]:
+    """返回 (base64, 媒体类型, 内容哈希)"""
+    prepared = image_preprocessor.prepare(image_path)
+    return (
+        base64.standard_b64encode(prepared.data).decode("utf-8"),
+        prepared.media_type,
+        sha256_bytes(prepared.data),
+    )
 
 # 获取截图路径
 def get_screenshot_path(app_name: str, index: int) -> Path:
@@ -205,41 +231,122 @@ USER_PROMPT_TEMPLATE = """分析这张来自 {app_name} App 的 Onboarding 截
 """
 
 
+def parse_gpt52_output(text: str) -> dict:
+    """解析 GPT-5.2 输出（json_object 模式）"""
+    return json.loads(text)
+
+
+def parse_opus_output(text: str) -> dict:
+    """解析 Claude 输出（提取 JSON 部分）"""
+    result_text = text
+    if "```json" in result_text:
+        result_text = result_text.split("```json")[1].split("```")[0]
+    elif "```" in result_text:
+        result_text = result_text.split("```")[1].split("```")[0]
+    return json.loads(result_text.strip())
+
+
+def merge_combined(gpt_result: dict, opus_result: dict) -> dict:
+    """双模型结果合并"""
+    return {
+        **opus_result,  # 以 Claude 的结构化输出为主
+        "gpt52_analysis": gpt_result.get("deep_analysis", {}),
+        "analysis_method": "combined_gpt52_opus45"
+    }
+
+
+# 方案 -> (方法, 输出目录名)
+PLANS = {
+    "A": ("gpt52", "analysis_gpt52"),
+    "B": ("opus", "analysis_opus"),
+    "C": ("combined", "analysis_combined"),
+}
+
+
+def save_app_results(output_dir: Path, app_name: str, method: str, app_results: list) -> Path:
+    """保存单个 App 的分析结果"""
+    app_output_dir = output_dir / app_name
+    app_output_dir.mkdir(parents=True, exist_ok=True)
+    
+    output_file = app_output_dir / "analysis.json"
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "app_name": app_name,
+            "total_screenshots": len(app_results),
+            "analysis_method": method,
+            "analyzed_at": datetime.now().isoformat(),
+            "results": app_results
+        }, f, ensure_ascii=False, indent=2)
+    return output_file
+
+
+def save_plan_summary(output_dir: Path, plan_name: str, method: str, all_results: dict) -> Path:
+    """保存方案汇总结果"""
+    summary_file = output_dir / "all_results.json"
+    with open(summary_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "plan": plan_name,
+            "method": method,
+            "total_apps": len(all_results),
+            "total_screenshots": sum(len(r) for r in all_results.values()),
+            "analyzed_at": datetime.now().isoformat(),
+            "apps": all_results
+        }, f, ensure_ascii=False, indent=2)
+    return summary_file
+
+
 class OnboardingAnalyzer:
-    def __init__(self, plan: str = "A"):
+    def __init__(self, plan: str = "A", local: bool = False):
         self.plan = plan
+        self.local = local
         self.taxonomy = load_taxonomy_schema()
         self.queue = load_analysis_queue()
         self.results = {}
+        self.openai_client = None
+        self.anthropic_client = None
+        
+        # 初始化API客户端（本地批处理模式不需要）
+        if local:
+            return
         
-        # 初始化API客户端
         if plan in ["A", "C", "ALL"]:
+            self._get_openai_client()
+        
+        if plan in ["B", "C", "ALL"]:
+            self._get_anthropic_client()
+    
+    def _get_openai_client(self):
+        if self.openai_client is None:
             if OpenAI is None:
                 raise ImportError("请安装 openai: pip install openai")
             self.openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        
-        if plan in ["B", "C", "ALL"]:
+        return self.openai_client
+    
+    def _get_anthropic_client(self):
+        if self.anthropic_client is None:
             if anthropic is None:
                 raise ImportError("请安装 anthropic: pip install anthropic")
             self.anthropic_client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+        return self.anthropic_client
     
-    def analyze_with_gpt52(self, image_path: Path, app_name: str, index: int, total: int) -> dict:
-        """使用 GPT-5.2 Pro 分析截图"""
-        image_base64 = image_to_base64(image_path)
-        filename = image_path.name
-        position_pct = round((index / total) * 100, 1)
-        
-        user_prompt = USER_PROMPT_TEMPLATE.format(
+    def _user_prompt(self, image_path: Path, app_name: str, index: int, total: int) -> str:
+        return USER_PROMPT_TEMPLATE.format(
             app_name=app_name,
             index=index,
             total=total,
-            filename=filename,
-            position_pct=position_pct
+            filename=image_path.name,
+            position_pct=round((index / total) * 100, 1)
         )
+    
+    def build_gpt52_request(self, image_path: Path, app_name: str, index: int, total: int) -> BatchRequest:
+        """GPT-5.2 请求参数（同步调用和批量提交共用）"""
+        image_base64, media_type, image_sha256 = load_image(image_path)
+        user_prompt = self._user_prompt(image_path, app_name, index, total)
         
-        response = self.openai_client.chat.completions.create(
-            model="gpt-5.2",  # 或者 "gpt-5.2-pro" 取决于实际API
-            messages=[
+        model = "gpt-5.2"
+        body = {
+            "model": model,  # 或者 "gpt-5.2-pro" 取决于实际API
+            "messages": [
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {
                     "role": "user",
@@ -248,39 +355,29 @@ class OnboardingAnalyzer:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}"
+                                "url": f"data:{media_type};base64,{image_base64}"
                             }
                         }
                     ]
                 }
             ],
-            max_tokens=2000,
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
-        
-        result_text = response.choices[0].message.content
-        return json.loads(result_text)
+            "max_tokens": 2000,
+            "temperature": 0.1,
+            "response_format": {"type": "json_object"}
+        }
+        return BatchRequest("openai", model, body, (image_sha256, model, request_hash(body)))
     
-    def analyze_with_opus(self, image_path: Path, app_name: str, index: int, total: int) -> dict:
-        """使用 Claude Opus 4.5 分析截图"""
-        image_base64 = image_to_base64(image_path)
-        filename = image_path.name
-        position_pct = round((index / total) * 100, 1)
+    def build_opus_request(self, image_path: Path, app_name: str, index: int, total: int) -> BatchRequest:
+        """Claude Opus 4.5 请求参数（同步调用和批量提交共用）"""
+        image_base64, media_type, image_sha256 = load_image(image_path)
+        user_prompt = self._user_prompt(image_path, app_name, index, total)
         
-        user_prompt = USER_PROMPT_TEMPLATE.format(
-            app_name=app_name,
-            index=index,
-            total=total,
-            filename=filename,
-            position_pct=position_pct
-        )
-        
-        response = self.anthropic_client.messages.create(
-            model="claude-opus-4-5-20251124",  # 或实际模型名
-            max_tokens=2000,
-            system=SYSTEM_PROMPT,
-            messages=[
+        model = "claude-opus-4-5-20251124"
+        body = {
+            "model": model,  # 或实际模型名
+            "max_tokens": 2000,
+            "system": SYSTEM_PROMPT,
+            "messages": [
                 {
                     "role": "user",
                     "content": [
@@ -288,7 +385,7 @@ class OnboardingAnalyzer:
                             "type": "image",
                             "source": {
                                 "type": "base64",
-                                "media_type": "image/png",
+                                "media_type": media_type,
                                 "data": image_base64
                             }
                         },
@@ -299,16 +396,40 @@ class OnboardingAnalyzer:
                     ]
                 }
             ]
-        )
+        }
+        return BatchRequest("anthropic", model, body, (image_sha256, model, request_hash(body)))
+    
+    def analyze_with_gpt52(self, image_path: Path, app_name: str, index: int, total: int) -> dict:
+        """使用 GPT-5.2 Pro 分析截图"""
+        request = self.build_gpt52_request(image_path, app_name, index, total)
         
-        result_text = response.content[0].text
-        # 提取JSON部分
-        if "```json" in result_text:
-            result_text = result_text.split("```json")[1].split("```")[0]
-        elif "```" in result_text:
-            result_text = result_text.split("```")[1].split("```")[0]
+        # 命中缓存（同一图片 + 同一 prompt）时不调用 API
+        cached = vision_cache.get(*request.cache_key)
+        if cached:
+            return cached.parsed
         
-        return json.loads(result_text.strip())
+        response = self.openai_client.chat.completions.create(**request.body)
+        
+        result_text = response.choices[0].message.content
+        result = parse_gpt52_output(result_text)
+        vision_cache.put(*request.cache_key, result_text, result)
+        return result
+    
+    def analyze_with_opus(self, image_path: Path, app_name: str, index: int, total: int) -> dict:
+        """使用 Claude Opus 4.5 分析截图"""
+        request = self.build_opus_request(image_path, app_name, index, total)
+        
+        # 命中缓存（同一图片 + 同一 prompt）时不调用 API
+        cached = vision_cache.get(*request.cache_key)
+        if cached:
+            return cached.parsed
+        
+        response = self.anthropic_client.messages.create(**request.body)
+        
+        raw_text = response.content[0].text
+        result = parse_opus_output(raw_text)
+        vision_cache.put(*request.cache_key, raw_text, result)
+        return result
     
     def analyze_combined(self, image_path: Path, app_name: str, index: int, total: int) -> dict:
         """双模型协作分析"""
@@ -319,13 +440,7 @@ class OnboardingAnalyzer:
         opus_result = self.analyze_with_opus(image_path, app_name, index, total)
         
         # 合并结果
-        combined = {
-            **opus_result,  # 以 Claude 的结构化输出为主
-            "gpt52_analysis": gpt_result.get("deep_analysis", {}),
-            "analysis_method": "combined_gpt52_opus45"
-        }
-        
-        return combined
+        return merge_combined(gpt_result, opus_result)
     
     def analyze_app(self, app_info: dict, output_dir: Path, method: str = "gpt52"):
         """分析单个App的所有Onboarding截图"""
@@ -368,48 +483,23 @@ class OnboardingAnalyzer:
                 continue
         
         # 保存App结果
-        app_output_dir = output_dir / app_name
-        app_output_dir.mkdir(parents=True, exist_ok=True)
-        
-        output_file = app_output_dir / "analysis.json"
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump({
-                "app_name": app_name,
-                "total_screenshots": len(app_results),
-                "analysis_method": method,
-                "analyzed_at": datetime.now().isoformat(),
-                "results": app_results
-            }, f, ensure_ascii=False, indent=2)
-        
+        output_file = save_app_results(output_dir, app_name, method, app_results)
         print(f"  保存到: {output_file}")
         
         return app_results
     
+    def _plans(self) -> list[str]:
+        return list(PLANS) if self.plan == "ALL" else [self.plan]
+    
     def run(self):
         """运行分析"""
-        plans_to_run = []
-        
-        if self.plan == "ALL":
-            plans_to_run = [("A", "gpt52"), ("B", "opus"), ("C", "combined")]
-        elif self.plan == "A":
-            plans_to_run = [("A", "gpt52")]
-        elif self.plan == "B":
-            plans_to_run = [("B", "opus")]
-        elif self.plan == "C":
-            plans_to_run = [("C", "combined")]
-        
-        for plan_name, method in plans_to_run:
+        for plan_name in self._plans():
+            method, dir_name = PLANS[plan_name]
             print(f"\n{'#'*60}")
             print(f"# 执行方案 {plan_name}: {method}")
             print(f"{'#'*60}")
             
-            if method == "gpt52":
-                output_dir = ANALYSIS_DIR / "analysis_gpt52"
-            elif method == "opus":
-                output_dir = ANALYSIS_DIR / "analysis_opus"
-            else:
-                output_dir = ANALYSIS_DIR / "analysis_combined"
-            
+            output_dir = ANALYSIS_DIR / dir_name
             output_dir.mkdir(parents=True, exist_ok=True)
             
             all_results = {}
@@ -419,18 +509,109 @@ class OnboardingAnalyzer:
                 all_results[app_info["name"]] = results
             
             # 保存汇总结果
-            summary_file = output_dir / "all_results.json"
-            with open(summary_file, "w", encoding="utf-8") as f:
-                json.dump({
-                    "plan": plan_name,
-                    "method": method,
-                    "total_apps": len(all_results),
-                    "total_screenshots": sum(len(r) for r in all_results.values()),
-                    "analyzed_at": datetime.now().isoformat(),
-                    "apps": all_results
-                }, f, ensure_ascii=False, indent=2)
-            
+            summary_file = save_plan_summary(output_dir, plan_name, method, all_results)
             print(f"\n方案 {plan_name} 完成，结果保存到: {summary_file}")
+        
+        self._print_preprocess_stats()
+    
+    def _print_preprocess_stats(self):
+        stats = image_preprocessor.stats.to_dict()
+        print(
+            f"\n图片预处理: {stats['images']} 张，"
+            f"{stats['bytes_original'] / 1024 / 1024:.1f}MB -> {stats['bytes_sent'] / 1024 / 1024:.1f}MB"
+            f"（节省 {stats['bytes_saved'] / 1024 / 1024:.1f}MB）"
+        )
+    
+    # ------------------------------------------------------------------
+    # 批量模式：提交后退出，稍后 status / collect
+    # ------------------------------------------------------------------
+    
+    def _batch_providers(self, run: BatchRun) -> dict:
+        """按运行记录中的 Provider 和 local 标记创建（status / collect 时 --plan、--local 可以与 submit 不同）"""
+        names = run.provider_names()
+        if run.manifest["info"].get("local", self.local):
+            return {name: LocalBatchProvider(name) for name in names}
+        providers = {}
+        if "openai" in names:
+            providers["openai"] = OpenAIBatchProvider(self._get_openai_client())
+        if "anthropic" in names:
+            providers["anthropic"] = AnthropicBatchProvider(self._get_anthropic_client())
+        return providers
+    
+    def submit_batch(self) -> BatchRun:
+        """把整个分析队列打包成批处理任务提交（方案 C 复用 A/B 的请求，不重复提交）"""
+        run = BatchRun.create({"script": "onboarding_analyzer", "plan": self.plan, "local": self.local})
+        
+        for app_info in self.queue["apps"]:
+            app_name = app_info["name"]
+            start = app_info["onboarding_range"]["start"]
+            end = app_info["onboarding_range"]["end"]
+            total = end - start + 1
+            
+            for i in range(start, end + 1):
+                screenshot_path = get_screenshot_path(app_name, i + 1)
+                if not screenshot_path.exists():
+                    print(f"  [跳过] {screenshot_path.name} - 文件不存在")
+                    continue
+                
+                for plan_name in self._plans():
+                    entry = run.add_entry({"plan": plan_name, "app": app_name, "index": i + 1})
+                    if plan_name in ("A", "C"):
+                        run.add_request(entry, "gpt", self.build_gpt52_request(screenshot_path, app_name, i + 1, total))
+                    if plan_name in ("B", "C"):
+                        run.add_request(entry, "opus", self.build_opus_request(screenshot_path, app_name, i + 1, total))
+        
+        batches = run.submit(self._batch_providers(run))
+        summary = run.summary()
+        print(f"\n批次 {run.run_id}: {summary['requests']} 个请求，{summary['cached']} 个命中缓存，提交 {len(batches)} 个批次")
+        print(f"稍后运行: python onboarding_analyzer.py --batch collect --run {run.run_id}")
+        self._print_preprocess_stats()
+        return run
+    
+    def batch_status(self, run_id: Optional[str] = None) -> dict:
+        run = BatchRun.load(run_id)
+        summary = run.refresh(self._batch_providers(run))
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return summary
+    
+    def collect_batch(self, run_id: Optional[str] = None, wait: bool = False, poll_interval: float = 300) -> bool:
+        """收集批处理结果，写入与同步模式相同的输出文件"""
+        run = BatchRun.load(run_id)
+        providers = self._batch_providers(run)
+        
+        if wait:
+            wait_for(run, providers, poll_interval)
+        elif not run.refresh(providers)["complete"]:
+            print(f"批次 {run.run_id} 尚未完成: {run.summary()['batches']}")
+            return False
+        
+        outcomes = run.collect(providers, {"gpt": parse_gpt52_output, "opus": parse_opus_output})
+        
+        # 按方案、App 分组（保持截图顺序）
+        grouped: dict[str, dict[str, list]] = {}
+        failed = 0
+        for outcome in sorted(outcomes, key=lambda o: o.meta["index"]):
+            if outcome.errors:
+                failed += 1
+                print(f"  ✗ {outcome.meta['app']} #{outcome.meta['index']}: {outcome.errors}")
+                continue
+            if outcome.meta["plan"] == "C":
+                result = merge_combined(outcome.results["gpt"], outcome.results["opus"])
+            else:
+                result = outcome.results.get("gpt") or outcome.results.get("opus")
+            grouped.setdefault(outcome.meta["plan"], {}).setdefault(outcome.meta["app"], []).append(result)
+        
+        for plan_name, apps in grouped.items():
+            method, dir_name = PLANS[plan_name]
+            output_dir = ANALYSIS_DIR / dir_name
+            output_dir.mkdir(parents=True, exist_ok=True)
+            for app_name, app_results in apps.items():
+                save_app_results(output_dir, app_name, method, app_results)
+            summary_file = save_plan_summary(output_dir, plan_name, method, apps)
+            print(f"方案 {plan_name}: {sum(len(r) for r in apps.values())} 张，结果保存到: {summary_file}")
+        
+        print(f"失败: {failed}")
+        return True
 
 
 def main():
@@ -447,6 +628,16 @@ def main():
         default=None,
         help="只分析指定App（可选）"
     )
+    parser.add_argument(
+        "--batch",
+        choices=["submit", "status", "collect"],
+        default=None,
+        help="批量模式: submit=打包提交后退出, status=查询进度, collect=收集结果写入输出文件"
+    )
+    parser.add_argument("--run", type=str, default=None, help="批次运行 ID（默认最近一次）")
+    parser.add_argument("--wait", action="store_true", help="collect 时轮询等待批次完成")
+    parser.add_argument("--poll-interval", type=float, default=300, help="轮询间隔（秒）")
+    parser.add_argument("--local", action="store_true", help="使用本地文件模拟批处理（离线测试）")
     
     args = parser.parse_args()
     
@@ -457,8 +648,15 @@ def main():
     print(f"数据目录: {DOWNLOADS_DIR}")
     print(f"输出目录: {ANALYSIS_DIR}")
     
-    analyzer = OnboardingAnalyzer(plan=args.plan)
-    analyzer.run()
+    analyzer = OnboardingAnalyzer(plan=args.plan, local=args.local)
+    if args.batch == "submit":
+        analyzer.submit_batch()
+    elif args.batch == "status":
+        analyzer.batch_status(args.run)
+    elif args.batch == "collect":
+        analyzer.collect_batch(args.run, wait=args.wait, poll_interval=args.poll_interval)
+    else:
+        analyzer.run()
 
 
 if __name__ == "__main__":